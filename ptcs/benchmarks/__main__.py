@@ -0,0 +1,131 @@
+# 制御の中心となる処理 (update、前方の探索、状態の変換など) の速さを計測し、保存した基準値と比べます。
+# 基準値より `--threshold` の割合を超えて遅くなったベンチマークがあれば、終了コード 1 で終わります。
+#
+# マシンの速さの違いを打ち消すため、決まった計算 (`calibrate`) にかかる時間も一緒に記録しておき、
+# 基準値はその比で換算してから比べます。
+#
+# 使い方:
+#   poetry run python -m benchmarks
+#   poetry run python -m benchmarks -k synthetic300 -k gogatsusai2024/update
+#   poetry run python -m benchmarks --save  # 計測した値を基準値として保存する
+
+import json
+import platform
+import sys
+import timeit
+from pathlib import Path
+
+import click
+
+from .cases import create_benchmarks
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+
+def calibrate() -> float:
+    """マシンの速さの目安として、決まった量の Python の計算にかかる秒数"""
+
+    def work() -> int:
+        return sum(i * i % 7 for i in range(500_000))
+
+    return min(timeit.repeat(work, number=1, repeat=7))
+
+
+def measure(run, min_seconds: float, repeat: int) -> float:
+    """
+    `run` を 1 回呼ぶのにかかる秒数。
+    1 回の計測が `min_seconds` 以上になるように呼ぶ回数を決め、`repeat` 回計測した中で最も速い値を使う。
+    """
+
+    timer = timeit.Timer(run)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_seconds:
+            break
+        number = max(number * 2, int(number * min_seconds / elapsed * 1.2) if elapsed > 0 else number * 10)
+    times = [elapsed] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(times) / number
+
+
+def load_baseline(path: Path) -> dict:
+    if not path.exists():
+        return {"calibration_seconds": None, "results": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1e-1:
+        return f"{seconds:8.3f} s "
+    if seconds >= 1e-4:
+        return f"{seconds * 1e3:8.3f} ms"
+    return f"{seconds * 1e6:8.3f} us"
+
+
+@click.command()
+@click.option("-k", "--filter", "filters", multiple=True, help="名前にこの文字列を含むベンチマークだけを実行する")
+@click.option("--baseline", "baseline_path", default=str(BASELINE_PATH), help="基準値のファイル")
+@click.option("--threshold", default=0.2, help="基準値よりこの割合を超えて遅ければ失敗とする")
+@click.option("--min-seconds", default=0.1, help="1 回の計測にかける最低の秒数")
+@click.option("--repeat", default=5, help="計測の回数 (最も速い回を使う)")
+@click.option("--save", is_flag=True, help="計測した値を基準値として保存する")
+def main(filters: tuple[str, ...], baseline_path: str, threshold: float, min_seconds: float, repeat: int, save: bool):
+    benchmarks = [
+        benchmark
+        for benchmark in create_benchmarks()
+        if not filters or any(filter in benchmark.name for filter in filters)
+    ]
+    if not benchmarks:
+        print("no benchmarks matched")
+        sys.exit(1)
+
+    baseline = load_baseline(Path(baseline_path))
+    # 計測の前後で較正し、速いほうを使う (どちらかがほかの処理に邪魔されていても、比が狂わないように)
+    calibration_before = calibrate()
+    results: dict[str, float] = {}
+    for benchmark in benchmarks:
+        results[benchmark.name] = measure(benchmark.setup(), min_seconds, repeat)
+        print(f"{benchmark.name:45} {format_seconds(results[benchmark.name])}", flush=True)
+    calibration_seconds = min(calibration_before, calibrate())
+
+    # 基準値を記録したマシンと比べて、このマシンが何倍遅いか
+    scale = calibration_seconds / baseline["calibration_seconds"] if baseline["calibration_seconds"] else 1.0
+    print(f"\ncalibration: {format_seconds(calibration_seconds)} (x{scale:.2f} of the baseline machine)")
+    regressions: list[str] = []
+    for name, seconds in results.items():
+        base_seconds = baseline["results"].get(name)
+        if base_seconds is None:
+            print(f"{name:45} (no baseline)")
+            continue
+        ratio = seconds / (base_seconds * scale)
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:45} {ratio:5.2f}x baseline{'  REGRESSION' if regressed else ''}")
+
+    if save:
+        # 一部だけ実行したときは、実行しなかったベンチマークの基準値を残す。
+        # 記録済みの値はこのマシンの速さに換算し直してから、新しい較正値とともに保存する。
+        saved = {name: seconds * scale for name, seconds in baseline["results"].items()}
+        saved.update(results)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "calibration_seconds": calibration_seconds,
+                    "results": dict(sorted(saved.items())),
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"saved {len(results)} results to {baseline_path}")
+
+    if regressions:
+        print(f"{len(regressions)} benchmarks are more than {threshold:.0%} slower than the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+ベンチマークの対象となる処理と、それを動かす路線の一覧。
+
+各ベンチマークは `<路線>/<処理>` という名前を持ち、`setup` を呼ぶと、計測する関数が返る。
+路線は最初の `setup` で作って決まった数だけ tick を進め、同じ路線のベンチマークで使い回す。
+状態を変えるのは最後に計測する update だけなので、どのベンチマークを選んで実行しても、同じ状態から計測される。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import cache, partial
+from typing import Callable
+
+from ptcs_control import gogatsusai2024, mft2023, synthetic
+from ptcs_control.components.position import DirectedPosition
+from ptcs_control.control.base import BaseControl, create_empty_logger
+from ptcs_control.control.moving_block import MovingBlockControl
+from ptcs_server.serializer import dump_json, state_to_dict
+from ptcs_server.types.state import get_state_from_control
+
+CONTROL_INTERVAL_SECONDS = 0.1  # 1 tick で列車を進める時間 (server.py の `control_loop` の周期)
+WARMUP_TICKS = 20  # 計測前に進める tick 数。列車を走らせ、ポイントや停車の状態を作っておく
+ADVANCE_DISTANCE = 200.0  # get_advanced_position で進める距離[cm]。数セクションをまたぐ
+SYNTHETIC_SECTIONS = [100, 300, 1000]  # 自動生成する路線の大きさ。列車の数はセクション数の 1/10
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    setup: Callable[[], Callable[[], object]]
+
+
+def create_synthetic_control(sections: int, moving_block: bool) -> BaseControl:
+    layout = synthetic.SyntheticLayout(sections=sections, trains=sections // 10)
+    if not moving_block:
+        return synthetic.create_control(layout)
+    control = MovingBlockControl(logger=create_empty_logger())
+    synthetic.configure(control, layout)
+    control.verify()
+    return control
+
+
+def create_layouts() -> dict[str, Callable[[], BaseControl]]:
+    """
+    路線の名前と、その路線の control を作る関数。
+    mft2023 は列車が設定されていない (コメントアウトされている) ので、列車を含む処理は空回りになる。
+    MovingBlockControl に列車を走らせるベンチマークは、自動生成した路線で行う。
+    """
+
+    layouts: dict[str, Callable[[], BaseControl]] = {
+        "gogatsusai2024": gogatsusai2024.create_control,
+        "mft2023": mft2023.create_control,
+    }
+    for sections in SYNTHETIC_SECTIONS:
+        layouts[f"synthetic{sections}_fixed"] = partial(create_synthetic_control, sections, False)
+        layouts[f"synthetic{sections}_moving"] = partial(create_synthetic_control, sections, True)
+    return layouts
+
+
+def tick(control: BaseControl) -> None:
+    """
+    サーバーの制御ループの 1 周期に相当する処理。
+    列車は速度指令どおりに進んだものとして動かす。
+    """
+
+    control.tick()
+    for train in control.trains.values():
+        if train.speed_command > 0:
+            train.move_forward(train.speed_command * CONTROL_INTERVAL_SECONDS)
+    control.update()
+
+
+def prepare(create_control: Callable[[], BaseControl]) -> BaseControl:
+    control = create_control()
+    control.update()
+    for _ in range(WARMUP_TICKS):
+        tick(control)
+    return control
+
+
+def _update(control: BaseControl) -> Callable[[], object]:
+    return lambda: tick(control)
+
+
+def _get_advanced_position(control: BaseControl) -> Callable[[], object]:
+    positions = [train.head_position for train in control.trains.values()]
+    return lambda: [position.get_advanced_position(ADVANCE_DISTANCE) for position in positions]
+
+
+def _find_forward_train(control: BaseControl) -> Callable[[], object]:
+    trains = list(control.trains.values())
+    return lambda: [train.find_forward_train() for train in trains]
+
+
+def _find_forward_stop(control: BaseControl) -> Callable[[], object]:
+    trains = list(control.trains.values())
+    return lambda: [train.find_forward_stop() for train in trains]
+
+
+def _find_forward_object(control: BaseControl) -> Callable[[], object]:
+    trains = list(control.trains.values())
+    pairs = [
+        (sensor, DirectedPosition(sensor.section, sensor.target_junction, sensor.mileage))
+        for sensor in control.sensor_positions.values()
+    ]
+    return lambda: [train.find_forward_object(pairs) for train in trains]
+
+
+def _is_toggle_prohibited(control: BaseControl) -> Callable[[], object]:
+    junctions = list(control.junctions.values())
+    return lambda: [junction.is_toggle_prohibited() for junction in junctions]
+
+
+def _get_state_from_control(control: BaseControl) -> Callable[[], object]:
+    return lambda: get_state_from_control(control)
+
+
+def _dump_json(control: BaseControl) -> Callable[[], object]:
+    return lambda: dump_json(state_to_dict(control))
+
+
+# 処理の名前と、準備のできた control から計測する関数を作る関数。
+# 列車ごと・ジャンクションごとの処理は、路線全体について 1 回ずつ呼ぶ時間を計測する。
+# update は状態を変えるので最後に置く。
+TARGETS: dict[str, Callable[[BaseControl], Callable[[], object]]] = {
+    "get_advanced_position": _get_advanced_position,
+    "find_forward_train": _find_forward_train,
+    "find_forward_stop": _find_forward_stop,
+    "find_forward_object": _find_forward_object,
+    "is_toggle_prohibited": _is_toggle_prohibited,
+    "get_state_from_control": _get_state_from_control,
+    "dump_json": _dump_json,
+    "update": _update,
+}
+
+
+def _setup(
+    prepare: Callable[[], BaseControl], target: Callable[[BaseControl], Callable[[], object]]
+) -> Callable[[], object]:
+    return target(prepare())
+
+
+def create_benchmarks() -> list[Benchmark]:
+    benchmarks: list[Benchmark] = []
+    for layout_name, create_control in create_layouts().items():
+        prepare_once = cache(partial(prepare, create_control))
+        for target_name, target in TARGETS.items():
+            benchmarks.append(
+                Benchmark(
+                    name=f"{layout_name}/{target_name}",
+                    setup=partial(_setup, prepare_once, target),
+                )
+            )
+    return benchmarks
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class CommandFilter(Generic[T]):
+    """
+    同じ指令を BLE で送り続けないように、指令が変わったときと、最後に送ってから
+    `keepalive_seconds` 秒が経ったときだけ送らせる。
+
+    キープアライブは、書き込みが失われたり、機器が再起動して指令を忘れたりしても、いずれ正しい指令に戻すためのもの。
+    `keepalive_seconds` が 0 なら、毎回送る (以前の動作)。
+    """
+
+    keepalive_seconds: float
+    sent_count: int = 0  # 実際に送った回数
+    saved_count: int = 0  # 前回と同じなので送らずに済ませた回数
+    _last_command: T | None = field(default=None, init=False)
+    _last_sent_at: float = field(default=-float("inf"), init=False)
+
+    def should_send(self, command: T, now: float | None = None) -> bool:
+        """
+        `command` を今送るべきかを返す。`True` を返したら送ったものとして記録するので、必ず送ること。
+        """
+        if now is None:
+            now = time.monotonic()
+        if command == self._last_command and now - self._last_sent_at < self.keepalive_seconds:
+            self.saved_count += 1
+            return False
+        self._last_command = command
+        self._last_sent_at = now
+        self.sent_count += 1
+        return True
+
+    def reset(self) -> None:
+        """
+        次の指令を必ず送らせる。接続し直したときなど、機器が指令を覚えているかわからないときに呼ぶ。
+        """
+        self._last_command = None
+        self._last_sent_at = -float("inf")
+
+    def __str__(self) -> str:
+        return f"sent {self.sent_count}, saved {self.saved_count}"
+
+
+@dataclass
+class WriteLatency:
+    """
+    書き込みが確認される (応答が返る) までの遅れ[s]の統計。
+    """
+
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_seconds: float | None = None
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.last_seconds = seconds
+
+    @property
+    def mean_seconds(self) -> float | None:
+        return self.total_seconds / self.count if self.count > 0 else None
+
+    def __str__(self) -> str:
+        mean_seconds = self.mean_seconds
+        if mean_seconds is None:
+            return "no writes"
+        return f"{self.count} writes, mean {mean_seconds * 1000:.0f} ms, max {self.max_seconds * 1000:.0f} ms"
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from array import array
+from collections.abc import Iterable
+
+from .train_simulator import TrainSimulator
+
+logger = logging.getLogger(__name__)
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+class FleetSimulator:
+    """
+    多数の TrainSimulator を 1 つのタスクでまとめてシミュレーションする。
+
+    TrainSimulator は列車ごとにタスクを作って 0.1 秒ごとに起きるので、負荷試験で数百両を動かすと
+    タイマーとコールバックの数が多くなりすぎる。
+    ここでは列車ごとの速度と回転数を配列にまとめて持ち、1 周期につき 1 回のループで全列車を進め、
+    回転した列車にだけ、その周期の回転数をまとめて通知する。
+
+    センサー (位置の UID と電池電圧) のシミュレーションは、列車ごとに TrainSimulator と同じ処理で行う。
+
+    列車ごとの操作は `add_train` で得られる `FleetTrainSimulator` (TrainSimulator の派生クラス) を通して行うので、
+    サーバー側は TrainSimulator と同じように扱える。
+    """
+
+    trains: list[FleetTrainSimulator]
+    _current_speeds_cm_s: array[float]
+    _target_speeds_cm_s: array[float]
+    _total_rotations: array[float]
+    _connected_count: int
+    _task: asyncio.Task | None
+
+    INTERVAL_SECONDS = TrainSimulator.INTERVAL_SECONDS
+
+    def __init__(self) -> None:
+        self.trains = []
+        self._current_speeds_cm_s = array("d")
+        self._target_speeds_cm_s = array("d")
+        self._total_rotations = array("d")
+        self._connected_count = 0
+        self._task = None
+
+    def __str__(self) -> str:
+        return f"FleetSimulator({len(self.trains)} trains)"
+
+    def add_train(self, id: str, odometry_error: float = 0.0) -> FleetTrainSimulator:
+        train = FleetTrainSimulator(id, self, len(self.trains), odometry_error)
+        self.trains.append(train)
+        self._current_speeds_cm_s.append(0.0)
+        self._target_speeds_cm_s.append(0.0)
+        self._total_rotations.append(0.0)
+        return train
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.INTERVAL_SECONDS)
+            self.step(self.INTERVAL_SECONDS)
+
+    def step(self, dt: float) -> list[int]:
+        """
+        すべての列車の時間を `dt` 秒だけ進め、列車ごとのモーターの回転数を `trains` の順に返す。
+        回転した列車には、回転数をまとめて一度だけ通知する。
+        計算は TrainSimulator.step と同じ式で行うので、同じ指令からは同じ回転数が得られる。
+        """
+        return self._step_trains(range(len(self.trains)), dt)
+
+    def _step_trains(self, indices: Iterable[int], dt: float) -> list[int]:
+        """
+        `indices` 番目の列車だけ時間を `dt` 秒だけ進め、モーターの回転数を `indices` の順に返す。
+        """
+
+        current_speeds = self._current_speeds_cm_s
+        target_speeds = self._target_speeds_cm_s
+        total_rotations = self._total_rotations
+        wheel_perimeter_cm = TrainSimulator.WHEEL_PERIMETER_CENTIMETERS
+        gear_ratio = TrainSimulator.GEAR_RATIO
+        floor = math.floor
+
+        indices = list(indices)
+        rotations = [0] * len(indices)
+        delta_rotations = [0.0] * len(indices)
+        for j, i in enumerate(indices):
+            # とりあえず簡単に、即座に指令速度に変わるものとする
+            prev_speed_cm_s = current_speeds[i]
+            speed_cm_s = target_speeds[i]
+            current_speeds[i] = speed_cm_s
+            if prev_speed_cm_s == 0.0 and speed_cm_s == 0.0:
+                continue
+
+            prev_total_rotation = total_rotations[i]
+            delta_cm = (prev_speed_cm_s + speed_cm_s) / 2 * dt
+            total_rotation = prev_total_rotation + delta_cm / wheel_perimeter_cm / gear_ratio
+            total_rotations[i] = total_rotation
+            rotations[j] = floor(total_rotation) - floor(prev_total_rotation)
+            delta_rotations[j] = total_rotation - prev_total_rotation
+
+        trains = self.trains
+        for i, rotation in zip(indices, rotations):
+            train = trains[i]
+            if rotation > 0 and train._notify_rotation_callback is not None:
+                train._notify_rotation_callback(train, rotation)
+
+        # 位置や電圧の通知を受け取る列車だけ、センサーをシミュレーションする
+        for j, i in enumerate(indices):
+            train = trains[i]
+            if train._notify_position_uid_callback is not None or train._notify_voltage_callback is not None:
+                train._emulate_sensors(delta_rotations[j], current_speeds[i], dt)
+
+        return rotations
+
+    def _connect(self) -> None:
+        self._connected_count += 1
+        if self._task is None:
+            task = asyncio.create_task(self._loop())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            self._task = task
+            logger.info("%s started", self)
+
+    def _disconnect(self) -> None:
+        assert self._connected_count > 0
+        self._connected_count -= 1
+        if self._connected_count == 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logger.info("%s stopped", self)
+
+
+class FleetTrainSimulator(TrainSimulator):
+    """
+    FleetSimulator が動かす列車の 1 両。
+    状態は FleetSimulator の配列の `_index` 番目に置かれていて、時間を進めるのも FleetSimulator が行う。
+    動特性のモデル (`dynamics`) には対応していないので、速度指令で動かす。
+    """
+
+    _fleet: FleetSimulator
+    _index: int
+    _is_connected: bool
+
+    def __init__(self, id: str, fleet: FleetSimulator, index: int, odometry_error: float = 0.0) -> None:
+        super().__init__(id, odometry_error)
+        self._fleet = fleet
+        self._index = index
+        self._is_connected = False
+
+    def __str__(self) -> str:
+        return f"FleetTrainSimulator({self.id})"
+
+    @property
+    def rotation_rate(self) -> float:
+        """現在のモーターの回転の速さ[回転/s]"""
+        return self._fleet._current_speeds_cm_s[self._index] / self.WHEEL_PERIMETER_CENTIMETERS / self.GEAR_RATIO
+
+    @property
+    def total_rotation(self) -> float:
+        """これまでのモーターの回転数 (端数を含む)"""
+        return self._fleet._total_rotations[self._index]
+
+    def step(self, dt: float) -> int:
+        """
+        この列車だけ時間を `dt` 秒だけ進める。
+        まとめて進めるときは FleetSimulator.step を使い、同じ時間をこれと二重に進めないこと。
+        """
+        return self._fleet._step_trains((self._index,), dt)[0]
+
+    async def connect(self) -> None:
+        assert not self._is_connected
+        self._is_connected = True
+        self._fleet._connect()
+        logger.debug("%s connected", self)
+
+    async def disconnect(self) -> None:
+        assert self._is_connected
+        self._is_connected = False
+        self._fleet._disconnect()
+        logger.debug("%s disconnected", self)
+
+    async def send_speed(self, speed: float) -> None:
+        self.set_speed(speed)
+        # 数百両が 0.2 秒ごとに送るので、ログは出さない
+
+    def set_speed(self, speed: float) -> None:
+        self._fleet._target_speeds_cm_s[self._index] = speed * self.INPUT_TO_CENTIMETERS_PER_SECOND
+
+
+async def main():
+    fleet = FleetSimulator()
+    trains = [fleet.add_train(f"t{i}") for i in range(500)]
+    rotations = 0
+
+    def handle_rotation(train: TrainSimulator, rotation: int):
+        nonlocal rotations
+        rotations += rotation
+
+    for train in trains:
+        await train.connect()
+        await train.start_notify_rotation(handle_rotation)
+        await train.send_speed(120)
+
+    await asyncio.sleep(5.0)
+    print(f"{fleet} rotated {rotations} times in total")
+
+    for train in trains:
+        await train.disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)-8s]  %(message)s")
+    asyncio.run(main())
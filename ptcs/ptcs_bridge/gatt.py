@@ -0,0 +1,24 @@
+from uuid import UUID
+
+from bleak import BleakClient
+from bleak.backends.characteristic import BleakGATTCharacteristic
+from bleak.exc import BleakError
+
+
+def resolve_characteristic(
+    client: BleakClient, service_uuid: UUID, characteristic_uuid: UUID
+) -> BleakGATTCharacteristic:
+    """
+    接続した直後の `client` から characteristic を探す。
+
+    書き込みや notify のたびに探さないように、各クライアントは connect で一度だけ探して覚えておく。
+    接続し直すとハンドルが変わるかもしれないので、connect のたびに探し直すこと。
+    見つからなければ、走行中ではなく接続の時点で失敗させるために BleakError を投げる。
+    """
+    service = client.services.get_service(service_uuid)
+    if service is None:
+        raise BleakError(f"{client.address} has no service {service_uuid}")
+    characteristic = service.get_characteristic(characteristic_uuid)
+    if characteristic is None:
+        raise BleakError(f"{client.address} has no characteristic {characteristic_uuid} in service {service_uuid}")
+    return characteristic
@@ -4,6 +4,9 @@ from uuid import UUID
 
 from bleak import BleakClient
 from bleak.backends.characteristic import BleakGATTCharacteristic
+from bleak.exc import BleakError
+
+from .gatt import resolve_characteristic
 
 NotifySpeedCallback = Callable[["MasterControllerClient", int], None]
 
@@ -18,20 +21,31 @@ logger = logging.getLogger(__name__)
 class MasterControllerClient:
     id: str
     _client: BleakClient
+    # connect で探しておく characteristic (接続していなければ `None`)
+    _characteristic_speed: BleakGATTCharacteristic | None
 
     def __init__(self, id: str, address: str) -> None:
         self.id = id
         self._client = BleakClient(address)
+        self._characteristic_speed = None
 
     def __str__(self) -> str:
         return f"MasterControllerClient({self.id}, {self._client.address})"
 
     async def connect(self) -> None:
         await self._client.connect()
+        try:
+            self._characteristic_speed = resolve_characteristic(
+                self._client, SERVICE_MASTER_CONTROLLER_UUID, CHARACTERISTIC_SPEED_UUID
+            )
+        except BleakError:
+            await self._client.disconnect()
+            raise
         logger.info("%s connected", self)
 
     async def disconnect(self) -> None:
         await self._client.disconnect()
+        self._characteristic_speed = None
         logger.info("%s disconnected", self)
 
     @property
@@ -45,10 +59,8 @@ class MasterControllerClient:
             logger.info("%s notify speed %s", self, speed)
             callback(self, speed)
 
-        service = self._client.services.get_service(SERVICE_MASTER_CONTROLLER_UUID)
-        assert service is not None
-        characteristic = service.get_characteristic(CHARACTERISTIC_SPEED_UUID)
-        assert characteristic is not None
+        characteristic = self._characteristic_speed
+        assert characteristic is not None, "not connected"
 
         await self._client.start_notify(characteristic, wrapped_callback)
         logger.info("%s start notify speed", self)
@@ -2,9 +2,13 @@ import logging
 from uuid import UUID
 
 from bleak import BleakClient
+from bleak.backends.characteristic import BleakGATTCharacteristic
+from bleak.exc import BleakError
 
 from ptcs_control.components.junction import PointDirection
 
+from .gatt import resolve_characteristic
+
 SERVICE_POINT_SWITCHING_UUID = UUID("2a4023a6-6079-efea-b79f-7c882319b83b")
 CHARACTERISTIC_DIRECTION_UUID = UUID("737237f4-300e-ca58-1e2f-40ff59fc71f7")
 
@@ -23,20 +27,31 @@ logger = logging.getLogger(__name__)
 class PointClient:
     id: str
     _client: BleakClient
+    # connect で探しておく characteristic (接続していなければ `None`)
+    _characteristic_direction: BleakGATTCharacteristic | None
 
     def __init__(self, id: str, address: str) -> None:
         self.id = id
         self._client = BleakClient(address)
+        self._characteristic_direction = None
 
     def __str__(self) -> str:
         return f"{self.__class__.__name__}({self.id}, {self._client.address})"
 
     async def connect(self) -> None:
         await self._client.connect()
+        try:
+            self._characteristic_direction = resolve_characteristic(
+                self._client, SERVICE_POINT_SWITCHING_UUID, CHARACTERISTIC_DIRECTION_UUID
+            )
+        except BleakError:
+            await self._client.disconnect()
+            raise
         logger.info("%s connected", self)
 
     async def disconnect(self) -> None:
         await self._client.disconnect()
+        self._characteristic_direction = None
         logger.info("%s disconnected", self)
 
     @property
@@ -44,10 +59,8 @@ class PointClient:
         return self._client.is_connected
 
     async def send_direction(self, direction: PointDirection) -> None:
-        service = self._client.services.get_service(SERVICE_POINT_SWITCHING_UUID)
-        assert service is not None
-        characteristic = service.get_characteristic(CHARACTERISTIC_DIRECTION_UUID)
-        assert characteristic is not None
+        characteristic = self._characteristic_direction
+        assert characteristic is not None, "not connected"
 
         command = point_direction_to_command(direction)
         await self._client.write_gatt_char(characteristic, command, response=True)
@@ -3,8 +3,9 @@ from uuid import UUID
 
 from bleak import BleakClient
 from bleak.backends.characteristic import BleakGATTCharacteristic
-from bleak.backends.service import BleakGATTService
+from bleak.exc import BleakError
 
+from .gatt import resolve_characteristic
 from .train_base import (
     NotifyPositionIdCallback,
     NotifyRotationCallback,
@@ -24,55 +25,69 @@ logger = logging.getLogger(__name__)
 
 class TrainClient(TrainBase):
     id: str
+    # モーターへの入力値を応答なしで書き込む (ファームウェアの characteristic が対応しているときだけ)
+    write_without_response: bool
     _client: BleakClient
+    # connect で探しておく characteristic (接続していなければ `None`)
+    _characteristic_motor_input: BleakGATTCharacteristic | None
+    _characteristic_position_uid: BleakGATTCharacteristic | None
+    _characteristic_rotation: BleakGATTCharacteristic | None
+    _characteristic_voltage: BleakGATTCharacteristic | None
 
-    def __init__(self, id: str, address: str) -> None:
+    def __init__(self, id: str, address: str, write_without_response: bool = False) -> None:
         self.id = id
+        self.write_without_response = write_without_response
         self._client = BleakClient(address)
+        self._clear_characteristics()
 
     def __str__(self) -> str:
         return f"TrainClient({self.id}, {self._client.address})"
 
     async def connect(self) -> None:
         await self._client.connect()
+        try:
+            self._resolve_characteristics()
+        except BleakError:
+            await self._client.disconnect()
+            raise
         logger.info("%s connected", self)
 
     async def disconnect(self) -> None:
         await self._client.disconnect()
+        self._clear_characteristics()
         logger.info("%s disconnected", self)
 
     @property
     def is_connected(self) -> bool:
         return self._client.is_connected
 
-    def _get_service_train(self) -> BleakGATTService:
-        service = self._client.services.get_service(SERVICE_TRAIN_UUID)
-        assert service is not None
-        return service
-
-    def _get_characteristic(self, uuid: UUID) -> BleakGATTCharacteristic:
-        service = self._get_service_train()
-        characteristic = service.get_characteristic(uuid)
-        assert characteristic is not None
-        return characteristic
-
-    def _get_characteristic_motor_input(self) -> BleakGATTCharacteristic:
-        return self._get_characteristic(CHARACTERISTIC_MOTOR_INPUT_UUID)
-
-    def _get_characteristic_position_uid(self) -> BleakGATTCharacteristic:
-        return self._get_characteristic(CHARACTERISTIC_POSITION_UID_UUID)
-
-    def _get_characteristic_rotation(self) -> BleakGATTCharacteristic:
-        return self._get_characteristic(CHARACTERISTIC_ROTATION_UUID)
-
-    def _get_characteristic_voltage(self) -> BleakGATTCharacteristic:
-        return self._get_characteristic(CHARACTERISTIC_VOLTAGE_UUID)
+    def _resolve_characteristics(self) -> None:
+        self._characteristic_motor_input = resolve_characteristic(
+            self._client, SERVICE_TRAIN_UUID, CHARACTERISTIC_MOTOR_INPUT_UUID
+        )
+        self._characteristic_position_uid = resolve_characteristic(
+            self._client, SERVICE_TRAIN_UUID, CHARACTERISTIC_POSITION_UID_UUID
+        )
+        self._characteristic_rotation = resolve_characteristic(
+            self._client, SERVICE_TRAIN_UUID, CHARACTERISTIC_ROTATION_UUID
+        )
+        self._characteristic_voltage = resolve_characteristic(
+            self._client, SERVICE_TRAIN_UUID, CHARACTERISTIC_VOLTAGE_UUID
+        )
+
+    def _clear_characteristics(self) -> None:
+        self._characteristic_motor_input = None
+        self._characteristic_position_uid = None
+        self._characteristic_rotation = None
+        self._characteristic_voltage = None
 
     async def send_motor_input(self, motor_input: int) -> None:
         assert isinstance(motor_input, int)
         assert 0 <= motor_input <= 255
-        characteristic = self._get_characteristic_motor_input()
-        await self._client.write_gatt_char(characteristic, f"{motor_input}".encode(), response=True)
+        characteristic = self._characteristic_motor_input
+        assert characteristic is not None, "not connected"
+        response = not (self.write_without_response and "write-without-response" in characteristic.properties)
+        await self._client.write_gatt_char(characteristic, f"{motor_input}".encode(), response=response)
         logger.info("%s send motor input %s", self, motor_input)
 
     async def start_notify_position_uid(self, callback: NotifyPositionIdCallback) -> None:
@@ -82,7 +97,8 @@ class TrainClient(TrainBase):
             logger.info("%s notify position uid %s", self, position_uid)
             callback(self, position_uid)
 
-        characteristic = self._get_characteristic_position_uid()
+        characteristic = self._characteristic_position_uid
+        assert characteristic is not None, "not connected"
         await self._client.start_notify(characteristic, wrapped_callback)
         logger.info("%s start notify position uid", self)
 
@@ -93,7 +109,8 @@ class TrainClient(TrainBase):
             # logger.info("%s notify rotation %s", self, 1)
             callback(self, 1)
 
-        characteristic = self._get_characteristic_rotation()
+        characteristic = self._characteristic_rotation
+        assert characteristic is not None, "not connected"
         await self._client.start_notify(characteristic, wrapped_callback)
         logger.info("%s start notify rotation", self)
 
@@ -104,6 +121,7 @@ class TrainClient(TrainBase):
             logger.info("%s notify voltage %s mV", self, voltage)
             callback(self, voltage)
 
-        characteristic = self._get_characteristic_voltage()
+        characteristic = self._characteristic_voltage
+        assert characteristic is not None, "not connected"
         await self._client.start_notify(characteristic, wrapped_callback)
         logger.info("%s start notify voltage", self)
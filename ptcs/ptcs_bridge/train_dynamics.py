@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import asdict, dataclass
+
+
+@dataclass(frozen=True)
+class TrainDynamics:
+    """
+    モーターへの入力値から、モーターの回転の速さを計算する列車の動特性のモデル。
+
+    - 不感帯: 入力値が `dead_zone_input` 以下ではモーターが回らない
+    - ゲイン: それを超えると、定常状態の回転の速さは超えた分に比例する
+    - 加速の遅れ: 回転の速さは定常状態の値に向かって、時定数 `time_constant_seconds` の一次遅れで変化する
+
+    回転数の量子化 (整数回の回転ごとに通知すること) は TrainSimulator が行う。
+    パラメーターは、実機で記録したセッションから scripts/fit_train_dynamics.py で求める。
+    """
+
+    dead_zone_input: float
+    gain: float  # 不感帯を超えた入力値 1 あたりの、定常状態の回転の速さ[回転/s]
+    time_constant_seconds: float
+
+    def calc_steady_rotation_rate(self, motor_input: int) -> float:
+        """入力値 `motor_input` を与え続けたときの回転の速さ[回転/s]"""
+        return max(0.0, self.gain * (motor_input - self.dead_zone_input))
+
+    def calc_next_rotation_rate(self, rotation_rate: float, motor_input: int, dt: float) -> float:
+        """回転の速さが `rotation_rate` のときに `motor_input` を `dt` 秒だけ与えた後の回転の速さ[回転/s]"""
+        steady_rotation_rate = self.calc_steady_rotation_rate(motor_input)
+        if self.time_constant_seconds <= 0:
+            return steady_rotation_rate
+        return steady_rotation_rate + (rotation_rate - steady_rotation_rate) * math.exp(
+            -dt / self.time_constant_seconds
+        )
+
+
+def load_train_dynamics(path: str) -> dict[str, TrainDynamics]:
+    """
+    scripts/fit_train_dynamics.py が書き出した、列車の ID ごとの動特性を読み込む。
+    """
+    with open(path, encoding="utf-8") as f:
+        return {train_id: TrainDynamics(**params) for train_id, params in json.load(f).items()}
+
+
+def save_train_dynamics(path: str, dynamics: dict[str, TrainDynamics]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({train_id: asdict(d) for train_id, d in dynamics.items()}, f, indent=2)
+        f.write("\n")
@@ -1,6 +1,13 @@
+from __future__ import annotations
+
 import asyncio
 import logging
 import math
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+from ptcs_control.components.position import DirectedPosition
+from ptcs_control.components.section import SectionConnection
 
 from .train_base import (
     NotifyPositionIdCallback,
@@ -8,6 +15,12 @@ from .train_base import (
     NotifyVoltageCallback,
     TrainBase,
 )
+from .train_dynamics import TrainDynamics
+
+if TYPE_CHECKING:
+    from ptcs_control.components.section import Section
+    from ptcs_control.components.sensor_position import SensorPosition
+    from ptcs_control.components.train import Train
 
 logger = logging.getLogger(__name__)
 
@@ -17,50 +30,191 @@ _background_tasks: set[asyncio.Task] = set()
 class TrainSimulator(TrainBase):
     """
     BLE 通信を行わず、列車への速度指令とモーター回転通知をシミュレーションする。
+
+    `place` で線路上に置くと、線路上の本当の位置を追跡し、センサー (RFID タグ) の上を通過したときに
+    その UID を通知する。本当の位置はモーターの回転数から進む距離を `odometry_error` の割合だけずらして進めるので、
+    control が回転数から推定する位置と次第にずれていき、センサーによる位置の修正が起こる。
+    ポイントは control の指令どおりに切り替わっているものとして、control の分岐器の向きに従って進む。
+    電池電圧は時間とともに下がっていく値を、実機 (train.ino) と同じく 1 秒ごとに通知する。
+
+    `dynamics` を指定すると、実機と同じくモーターへの入力値 (`send_motor_input`) を受け取り、
+    不感帯や加速の遅れを含む動特性のモデル (TrainDynamics) に従って回転する。
+    指定しなければ、速度指令値 (`send_speed`) を受け取り、即座にその速度で走る。
     """
 
     id: str
+    odometry_error: float  # 本当に進んだ距離が、回転数から計算される距離より何割長いか
+    dynamics: TrainDynamics | None
     _current_speed_cm_s: float
     _target_speed_cm_s: float
+    _motor_input: int
+    _rotation_rate: float  # 回転の速さ[回転/s] (`dynamics` を使うとき)
     _total_rotation: float
+    _elapsed_seconds: float
+    _next_voltage_notify_seconds: float
+    _true_position: DirectedPosition | None
+    _delta_per_motor_rotation: float
+    _sensor_positions: dict[str, list[SensorPosition]]  # セクションの ID ごとのセンサー位置
     _task: asyncio.Task | None
     _notify_rotation_callback: NotifyRotationCallback | None
+    _notify_position_uid_callback: NotifyPositionIdCallback | None
+    _notify_voltage_callback: NotifyVoltageCallback | None
 
     INTERVAL_SECONDS = 0.1
     INPUT_TO_CENTIMETERS_PER_SECOND = 30.0 / 255
     WHEEL_PERIMETER_CENTIMETERS = 2.4 * math.pi
     GEAR_RATIO = 175 / 8448
 
-    def __init__(self, id: str) -> None:
+    VOLTAGE_NOTIFY_INTERVAL_SECONDS = 1.0
+    INITIAL_VOLTAGE_mV = 4000
+    FINAL_VOLTAGE_mV = 3300
+    VOLTAGE_TIME_CONSTANT_SECONDS = 3600.0  # 電圧が FINAL_VOLTAGE_mV に向かって指数関数的に下がる時定数
+    VOLTAGE_SAG_mV_PER_CENTIMETERS_PER_SECOND = 5.0  # 走行中にモーターの負荷で電圧が下がる量
+
+    def __init__(self, id: str, odometry_error: float = 0.0, dynamics: TrainDynamics | None = None) -> None:
         self.id = id
+        self.odometry_error = odometry_error
+        self.dynamics = dynamics
         self._current_speed_cm_s = 0.0
         self._target_speed_cm_s = 0.0
+        self._motor_input = 0
+        self._rotation_rate = 0.0
         self._total_rotation = 0.0
+        self._elapsed_seconds = 0.0
+        self._next_voltage_notify_seconds = self.VOLTAGE_NOTIFY_INTERVAL_SECONDS
+        self._true_position = None
+        self._delta_per_motor_rotation = 0.0
+        self._sensor_positions = {}
         self._task = None
         self._notify_rotation_callback = None
+        self._notify_position_uid_callback = None
+        self._notify_voltage_callback = None
 
     def __str__(self) -> str:
         return f"TrainSimulator({self.id})"
 
+    @property
+    def rotation_rate(self) -> float:
+        """現在のモーターの回転の速さ[回転/s]"""
+        if self.dynamics is None:
+            return self._current_speed_cm_s / self.WHEEL_PERIMETER_CENTIMETERS / self.GEAR_RATIO
+        return self._rotation_rate
+
+    @property
+    def total_rotation(self) -> float:
+        """これまでのモーターの回転数 (端数を含む)"""
+        return self._total_rotation
+
+    @property
+    def true_position(self) -> DirectedPosition | None:
+        """線路上の本当の位置 (`place` で置いていなければ None)"""
+        return self._true_position
+
+    def place(self, train: Train, sensor_positions: Iterable[SensorPosition]) -> None:
+        """
+        control の列車 `train` の現在の位置に置き、`sensor_positions` の上を通過したら UID を通知するようにする。
+        """
+        self._true_position = train.head_position
+        self._delta_per_motor_rotation = train.delta_per_motor_rotation
+        self._sensor_positions = {}
+        for sensor_position in sensor_positions:
+            self._sensor_positions.setdefault(sensor_position.section.id, []).append(sensor_position)
+
     async def _loop(self):
         while True:
             await asyncio.sleep(self.INTERVAL_SECONDS)
+            self.step(self.INTERVAL_SECONDS)
 
+    def step(self, dt: float) -> int:
+        """
+        時間を `dt` 秒だけ進め、その間のモーターの回転数を返す。
+        回転していれば、回転数をまとめて一度だけ通知する。
+        時計を使わないので、仮想的な時刻で動かすこともできる (ptcs_server/headless.py)。
+        """
+
+        prev_total_rotation = self._total_rotation
+        if self.dynamics is None:
             # とりあえず簡単に、即座に指令速度に変わるものとする
             prev_speed_cm_s = self._current_speed_cm_s
             self._current_speed_cm_s = self._target_speed_cm_s
 
-            delta_cm = (prev_speed_cm_s + self._current_speed_cm_s) / 2 * self.INTERVAL_SECONDS
+            delta_cm = (prev_speed_cm_s + self._current_speed_cm_s) / 2 * dt
 
-            prev_total_rotation = self._total_rotation
             self._total_rotation += delta_cm / self.WHEEL_PERIMETER_CENTIMETERS / self.GEAR_RATIO
+        else:
+            prev_rotation_rate = self._rotation_rate
+            self._rotation_rate = self.dynamics.calc_next_rotation_rate(prev_rotation_rate, self._motor_input, dt)
+            self._current_speed_cm_s = self._rotation_rate * self.WHEEL_PERIMETER_CENTIMETERS * self.GEAR_RATIO
+
+            self._total_rotation += (prev_rotation_rate + self._rotation_rate) / 2 * dt
+
+        rotation = math.floor(self._total_rotation) - math.floor(prev_total_rotation)
+
+        if self._notify_rotation_callback is not None and rotation > 0:
+            # logger.info("%s notify rotation %s", self, rotation)
+            self._notify_rotation_callback(self, rotation)
+
+        self._emulate_sensors(self._total_rotation - prev_total_rotation, self._current_speed_cm_s, dt)
 
-            rotation = math.floor(self._total_rotation) - math.floor(prev_total_rotation)
+        return rotation
 
-            if self._notify_rotation_callback is not None:
-                for _ in range(rotation):
-                    # logger.info("%s notify rotation %s", self, 1)
-                    self._notify_rotation_callback(self, 1)
+    def _emulate_sensors(self, delta_rotation: float, speed_cm_s: float, dt: float) -> None:
+        """
+        モーターが `delta_rotation` 回転する間に通過したセンサーの UID と、電池電圧を通知する。
+        """
+
+        if self._true_position is not None and delta_rotation > 0:
+            delta_cm = delta_rotation * self._delta_per_motor_rotation * (1 + self.odometry_error)
+            prev_position = self._true_position
+            self._true_position, path = prev_position.get_advanced_position_with_path(delta_cm)
+            if self._notify_position_uid_callback is not None and self._sensor_positions:
+                for sensor_position in self._find_passed_sensor_positions(prev_position, self._true_position, path):
+                    logger.debug("%s notify position uid %s", self, sensor_position.uid)
+                    self._notify_position_uid_callback(self, sensor_position.uid)
+
+        self._elapsed_seconds += dt
+        if self._elapsed_seconds >= self._next_voltage_notify_seconds:
+            self._next_voltage_notify_seconds += self.VOLTAGE_NOTIFY_INTERVAL_SECONDS
+            if self._notify_voltage_callback is not None:
+                self._notify_voltage_callback(self, self._calc_voltage_mV(speed_cm_s))
+
+    def _find_passed_sensor_positions(
+        self, prev_position: DirectedPosition, position: DirectedPosition, path: list[Section]
+    ) -> list[SensorPosition]:
+        """
+        `prev_position` から `path` を通って `position` まで進む間に通過したセンサー位置を、通過した順に返す。
+        実機の RFID タグはどちら向きに通過しても読み取られるので、センサー位置の向きは見ない。
+        """
+
+        # セクションごとに、通過したキロ程の範囲を (始点, 終点) で表す。範囲は始点を含まず終点を含む
+        ranges: list[tuple[Section, float, float]] = []
+        if path or position.section != prev_position.section:
+            ranges.append((prev_position.section, prev_position.mileage, _end_mileage(prev_position)))
+            for section in path:
+                # 通り抜けたセクションは、どちら向きでも全体を通過している
+                ranges.append((section, -1.0, section.length))
+            ranges.append((position.section, _start_mileage(position), position.mileage))
+        else:
+            ranges.append((position.section, prev_position.mileage, position.mileage))
+
+        passed: list[SensorPosition] = []
+        for section, start, end in ranges:
+            sensor_positions = self._sensor_positions.get(section.id)
+            if not sensor_positions:
+                continue
+            if start <= end:
+                candidates = [sp for sp in sensor_positions if start < sp.mileage <= end]
+                passed.extend(sorted(candidates, key=lambda sp: sp.mileage))
+            else:
+                candidates = [sp for sp in sensor_positions if end <= sp.mileage < start]
+                passed.extend(sorted(candidates, key=lambda sp: sp.mileage, reverse=True))
+        return passed
+
+    def _calc_voltage_mV(self, speed_cm_s: float) -> int:
+        decay = math.exp(-self._elapsed_seconds / self.VOLTAGE_TIME_CONSTANT_SECONDS)
+        voltage_mV = self.FINAL_VOLTAGE_mV + (self.INITIAL_VOLTAGE_mV - self.FINAL_VOLTAGE_mV) * decay
+        voltage_mV -= self.VOLTAGE_SAG_mV_PER_CENTIMETERS_PER_SECOND * speed_cm_s
+        return round(voltage_mV)
 
     async def connect(self) -> None:
         assert self._task is None
@@ -77,17 +231,44 @@ class TrainSimulator(TrainBase):
         logger.info("%s disconnected", self)
 
     async def send_speed(self, speed: float) -> None:
-        self._target_speed_cm_s = speed * self.INPUT_TO_CENTIMETERS_PER_SECOND
+        self.set_speed(speed)
         logger.info("%s send speed %s", self, speed)
 
+    def set_speed(self, speed: float) -> None:
+        self._target_speed_cm_s = speed * self.INPUT_TO_CENTIMETERS_PER_SECOND
+
+    async def send_motor_input(self, motor_input: int) -> None:
+        self.set_motor_input(motor_input)
+        logger.info("%s send motor input %s", self, motor_input)
+
+    def set_motor_input(self, motor_input: int) -> None:
+        assert self.dynamics is not None, "motor input requires dynamics"
+        self._motor_input = motor_input
+
     async def start_notify_position_uid(self, callback: NotifyPositionIdCallback) -> None:
-        raise NotImplementedError()
+        self._notify_position_uid_callback = callback
 
     async def start_notify_rotation(self, callback: NotifyRotationCallback) -> None:
         self._notify_rotation_callback = callback
 
     async def start_notify_voltage(self, callback: NotifyVoltageCallback) -> None:
-        raise NotImplementedError()
+        self._notify_voltage_callback = callback
+
+
+def _start_mileage(position: DirectedPosition) -> float:
+    """`position` のセクションに入ったときのキロ程 (範囲の始点として、入った端を含むように少し外側にずらす)"""
+    if position.target_junction == position.section.connected_junctions[SectionConnection.B]:
+        return -1.0
+    else:
+        return position.section.length + 1.0
+
+
+def _end_mileage(position: DirectedPosition) -> float:
+    """`position` のセクションから出るときのキロ程"""
+    if position.target_junction == position.section.connected_junctions[SectionConnection.B]:
+        return position.section.length
+    else:
+        return 0.0
 
 
 async def main():
@@ -96,8 +277,8 @@ async def main():
     await t0.connect()
     await t1.connect()
 
-    def handle_rotation(train: TrainSimulator, _rotation: int):
-        print(f"{train} rotated!")
+    def handle_rotation(train: TrainSimulator, rotation: int):
+        print(f"{train} rotated {rotation} times!")
 
     await t0.start_notify_rotation(handle_rotation)
     await t1.start_notify_rotation(handle_rotation)
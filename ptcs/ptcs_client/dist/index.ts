@@ -6,22 +6,49 @@ export { CancelablePromise, CancelError } from './core/CancelablePromise';
 export { OpenAPI } from './core/OpenAPI';
 export type { OpenAPIConfig } from './core/OpenAPI';
 
+export type { BatchCommandsParams } from './models/BatchCommandsParams';
+export type { BatchCommandsResult } from './models/BatchCommandsResult';
+export type { BlockSectionCommand } from './models/BlockSectionCommand';
+export type { ClearObstacleCommand } from './models/ClearObstacleCommand';
+export type { Coordinate } from './models/Coordinate';
+export type { DetectObstacleCommand } from './models/DetectObstacleCommand';
 export type { DirectedPosition } from './models/DirectedPosition';
 export type { HTTPValidationError } from './models/HTTPValidationError';
 export { JunctionConnection } from './models/JunctionConnection';
+export type { JunctionDynamicState } from './models/JunctionDynamicState';
+export type { JunctionHistory } from './models/JunctionHistory';
 export type { JunctionState } from './models/JunctionState';
+export type { JunctionTopology } from './models/JunctionTopology';
+export type { MoveTrainCommand } from './models/MoveTrainCommand';
 export type { MoveTrainParams } from './models/MoveTrainParams';
+export type { ObstacleDynamicState } from './models/ObstacleDynamicState';
 export type { ObstacleState } from './models/ObstacleState';
+export type { ObstacleTopology } from './models/ObstacleTopology';
+export type { PartialRailwayState } from './models/PartialRailwayState';
 export { PointDirection } from './models/PointDirection';
+export type { PutTrainCommand } from './models/PutTrainCommand';
 export type { PutTrainParams } from './models/PutTrainParams';
+export type { RailwayDynamicState } from './models/RailwayDynamicState';
+export type { RailwayHistory } from './models/RailwayHistory';
 export type { RailwayState } from './models/RailwayState';
+export type { RailwayStateDelta } from './models/RailwayStateDelta';
+export type { RailwayTopology } from './models/RailwayTopology';
 export { SectionConnection } from './models/SectionConnection';
+export type { SectionDynamicState } from './models/SectionDynamicState';
+export type { SectionHistory } from './models/SectionHistory';
 export type { SectionState } from './models/SectionState';
+export type { SectionTopology } from './models/SectionTopology';
 export type { SensorPositionState } from './models/SensorPositionState';
 export type { StationState } from './models/StationState';
 export type { StopState } from './models/StopState';
+export type { TopologyIndex } from './models/TopologyIndex';
+export type { TrainDynamicState } from './models/TrainDynamicState';
+export type { TrainHistory } from './models/TrainHistory';
 export type { TrainState } from './models/TrainState';
+export type { TrainTopology } from './models/TrainTopology';
+export type { UnblockSectionCommand } from './models/UnblockSectionCommand';
 export type { UndirectedPosition } from './models/UndirectedPosition';
+export type { UpdateJunctionCommand } from './models/UpdateJunctionCommand';
 export type { UpdateJunctionParams } from './models/UpdateJunctionParams';
 export type { ValidationError } from './models/ValidationError';
 
@@ -0,0 +1,15 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { BlockSectionCommand } from './BlockSectionCommand';
+import type { ClearObstacleCommand } from './ClearObstacleCommand';
+import type { DetectObstacleCommand } from './DetectObstacleCommand';
+import type { MoveTrainCommand } from './MoveTrainCommand';
+import type { PutTrainCommand } from './PutTrainCommand';
+import type { UnblockSectionCommand } from './UnblockSectionCommand';
+import type { UpdateJunctionCommand } from './UpdateJunctionCommand';
+
+export type BatchCommandsParams = {
+    commands: Array<(MoveTrainCommand | PutTrainCommand | UpdateJunctionCommand | DetectObstacleCommand | ClearObstacleCommand | BlockSectionCommand | UnblockSectionCommand)>;
+};
@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type BlockSectionCommand = {
+    type: 'block_section';
+    section_id: string;
+};
@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type ClearObstacleCommand = {
+    type: 'clear_obstacle';
+    obstacle_id: string;
+};
@@ -0,0 +1,11 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+/**
+ * UI 上の座標
+ */
+export type Coordinate = {
+    x: number;
+    y: number;
+};
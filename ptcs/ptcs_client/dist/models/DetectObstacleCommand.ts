@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type DetectObstacleCommand = {
+    type: 'detect_obstacle';
+    obstacle_id: string;
+};
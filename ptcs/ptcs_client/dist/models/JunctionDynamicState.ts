@@ -0,0 +1,12 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { PointDirection } from './PointDirection';
+
+export type JunctionDynamicState = {
+    id: string;
+    manual_direction: (PointDirection | null);
+    current_direction: PointDirection;
+    direction_command: PointDirection;
+};
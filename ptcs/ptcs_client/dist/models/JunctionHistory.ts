@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { PointDirection } from './PointDirection';
+
+export type JunctionHistory = {
+    current_directions: Array<PointDirection>;
+};
@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type JunctionTopology = {
+    id: string;
+    connected_section_ids: Record<string, string>;
+};
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type MoveTrainCommand = {
+    type: 'move_train';
+    train_id: string;
+    delta: number;
+};
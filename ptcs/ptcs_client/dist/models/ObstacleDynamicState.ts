@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type ObstacleDynamicState = {
+    id: string;
+    is_detected: boolean;
+};
@@ -0,0 +1,10 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { UndirectedPosition } from './UndirectedPosition';
+
+export type ObstacleTopology = {
+    id: string;
+    position: UndirectedPosition;
+};
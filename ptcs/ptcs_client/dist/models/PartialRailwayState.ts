@@ -0,0 +1,26 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { JunctionState } from './JunctionState';
+import type { ObstacleState } from './ObstacleState';
+import type { SectionState } from './SectionState';
+import type { SensorPositionState } from './SensorPositionState';
+import type { StationState } from './StationState';
+import type { StopState } from './StopState';
+import type { TrainState } from './TrainState';
+
+/**
+ * `RailwayState` のうち、`include` などで選ばれたコンポーネントのみを含むもの。
+ * 選ばれなかった種類のキーは含まれない。
+ */
+export type PartialRailwayState = {
+    current_time: number;
+    junctions?: (Record<string, JunctionState> | null);
+    sections?: (Record<string, SectionState> | null);
+    trains?: (Record<string, TrainState> | null);
+    stops?: (Record<string, StopState> | null);
+    stations?: (Record<string, StationState> | null);
+    sensor_positions?: (Record<string, SensorPositionState> | null);
+    obstacles?: (Record<string, ObstacleState> | null);
+};
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type PutTrainCommand = {
+    type: 'put_train';
+    train_id: string;
+    position_id: string;
+};
@@ -0,0 +1,23 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { JunctionDynamicState } from './JunctionDynamicState';
+import type { ObstacleDynamicState } from './ObstacleDynamicState';
+import type { SectionDynamicState } from './SectionDynamicState';
+import type { TrainDynamicState } from './TrainDynamicState';
+
+/**
+ * 実行中に変化する状態のみ。
+ * 路線の構成は `layout_hash` に対応する `RailwayTopology` から得ること。
+ */
+export type RailwayDynamicState = {
+    version: number;
+    layout_hash: string;
+    timestamp: number;
+    current_time: number;
+    junctions: Record<string, JunctionDynamicState>;
+    sections: Record<string, SectionDynamicState>;
+    trains: Record<string, TrainDynamicState>;
+    obstacles: Record<string, ObstacleDynamicState>;
+};
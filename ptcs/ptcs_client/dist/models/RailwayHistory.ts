@@ -0,0 +1,20 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { JunctionHistory } from './JunctionHistory';
+import type { SectionHistory } from './SectionHistory';
+import type { TrainHistory } from './TrainHistory';
+
+/**
+ * 実行中に変化する状態の履歴。
+ * 各リストの `i` 番目の要素は、`timestamps[i]` の時刻に記録された値になる。
+ */
+export type RailwayHistory = {
+    timestamps: Array<number>;
+    current_times: Array<number>;
+    versions: Array<number>;
+    trains: Record<string, TrainHistory>;
+    junctions: Record<string, JunctionHistory>;
+    sections: Record<string, SectionHistory>;
+};
@@ -0,0 +1,26 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { JunctionDynamicState } from './JunctionDynamicState';
+import type { ObstacleDynamicState } from './ObstacleDynamicState';
+import type { SectionDynamicState } from './SectionDynamicState';
+import type { TrainDynamicState } from './TrainDynamicState';
+
+/**
+ * 状態の配信で送られるメッセージ。
+ * `type` が `snapshot` のときはすべてのコンポーネントを含み、
+ * `delta` のときはバージョン `since` より後に変化したコンポーネントのみを含む。
+ */
+export type RailwayStateDelta = {
+    type: 'snapshot' | 'delta';
+    version: number;
+    since: (number | null);
+    layout_hash: string;
+    timestamp: number;
+    current_time: number;
+    junctions: Record<string, JunctionDynamicState>;
+    sections: Record<string, SectionDynamicState>;
+    trains: Record<string, TrainDynamicState>;
+    obstacles: Record<string, ObstacleDynamicState>;
+};
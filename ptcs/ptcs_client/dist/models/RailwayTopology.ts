@@ -0,0 +1,28 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { JunctionTopology } from './JunctionTopology';
+import type { ObstacleTopology } from './ObstacleTopology';
+import type { SectionTopology } from './SectionTopology';
+import type { SensorPositionState } from './SensorPositionState';
+import type { StationState } from './StationState';
+import type { StopState } from './StopState';
+import type { TopologyIndex } from './TopologyIndex';
+import type { TrainTopology } from './TrainTopology';
+
+/**
+ * 実行中に変化しない路線の構成。
+ * `layout_hash` は `layout_hash` 自身を除いた内容から計算される。
+ */
+export type RailwayTopology = {
+    layout_hash: string;
+    junctions: Record<string, JunctionTopology>;
+    sections: Record<string, SectionTopology>;
+    trains: Record<string, TrainTopology>;
+    stops: Record<string, StopState>;
+    stations: Record<string, StationState>;
+    sensor_positions: Record<string, SensorPositionState>;
+    obstacles: Record<string, ObstacleTopology>;
+    index: TopologyIndex;
+};
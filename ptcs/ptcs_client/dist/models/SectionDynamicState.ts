@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type SectionDynamicState = {
+    id: string;
+    is_blocked: boolean;
+};
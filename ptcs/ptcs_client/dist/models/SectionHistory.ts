@@ -0,0 +1,7 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type SectionHistory = {
+    is_blocked: Array<boolean>;
+};
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type SectionTopology = {
+    id: string;
+    length: number;
+    connected_junction_ids: Record<string, string>;
+};
@@ -0,0 +1,15 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+/**
+ * バイナリ形式の状態で、各コンポーネントを参照するのに使う整数のインデックス。
+ * リスト内の位置がインデックスになる。
+ */
+export type TopologyIndex = {
+    junction_ids: Array<string>;
+    section_ids: Array<string>;
+    train_ids: Array<string>;
+    stop_ids: Array<string>;
+    obstacle_ids: Array<string>;
+};
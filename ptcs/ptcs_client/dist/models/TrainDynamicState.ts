@@ -0,0 +1,21 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { Coordinate } from './Coordinate';
+import type { DirectedPosition } from './DirectedPosition';
+
+export type TrainDynamicState = {
+    id: string;
+    head_position: DirectedPosition;
+    tail_position: DirectedPosition;
+    covered_section_ids: Array<string>;
+    stop_id: (string | null);
+    stop_distance: number;
+    departure_time: (number | null);
+    speed_command: number;
+    voltage_mV: number;
+    manual_speed: (number | null);
+    next_junction_distance: number;
+    body_points: Array<Coordinate>;
+};
@@ -0,0 +1,11 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type TrainHistory = {
+    section_ids: Array<string>;
+    target_junction_ids: Array<string>;
+    mileages: Array<number>;
+    speed_commands: Array<number>;
+    voltages_mV: Array<number>;
+};
@@ -2,6 +2,7 @@
 /* tslint:disable */
 /* eslint-disable */
 
+import type { Coordinate } from './Coordinate';
 import type { DirectedPosition } from './DirectedPosition';
 
 export type TrainState = {
@@ -19,4 +20,7 @@ export type TrainState = {
     departure_time: (number | null);
     speed_command: number;
     voltage_mV: number;
+    manual_speed: (number | null);
+    next_junction_distance: number;
+    body_points: Array<Coordinate>;
 };
@@ -0,0 +1,12 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type TrainTopology = {
+    id: string;
+    min_input: number;
+    max_input: number;
+    max_speed: number;
+    length: number;
+    delta_per_motor_rotation: number;
+};
@@ -0,0 +1,8 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type UnblockSectionCommand = {
+    type: 'unblock_section';
+    section_id: string;
+};
@@ -0,0 +1,11 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { PointDirection } from './PointDirection';
+
+export type UpdateJunctionCommand = {
+    type: 'update_junction';
+    junction_id: string;
+    direction: PointDirection;
+};
@@ -1,9 +1,16 @@
 /* istanbul ignore file */
 /* tslint:disable */
 /* eslint-disable */
+import type { BatchCommandsParams } from '../models/BatchCommandsParams';
+import type { BatchCommandsResult } from '../models/BatchCommandsResult';
 import type { MoveTrainParams } from '../models/MoveTrainParams';
+import type { PartialRailwayState } from '../models/PartialRailwayState';
 import type { PutTrainParams } from '../models/PutTrainParams';
+import type { RailwayDynamicState } from '../models/RailwayDynamicState';
+import type { RailwayHistory } from '../models/RailwayHistory';
 import type { RailwayState } from '../models/RailwayState';
+import type { RailwayStateDelta } from '../models/RailwayStateDelta';
+import type { RailwayTopology } from '../models/RailwayTopology';
 import type { UpdateJunctionParams } from '../models/UpdateJunctionParams';
 
 import type { CancelablePromise } from '../core/CancelablePromise';
@@ -26,13 +33,162 @@ export class DefaultService {
 
     /**
      * Get State
-     * @returns RailwayState Successful Response
+     * tick ごとに一度だけ JSON に変換された状態を返す。
+ * `If-None-Match` が ETag に一致すれば 304 を返す。
+ *
+ * `include=trains,junctions` のように指定すると、指定した種類のコンポーネントのみを返す。
+ * `trains=t1,t2` のように指定すると、その種類のコンポーネントを ID で絞り込む。
+ * 選ばれなかったコンポーネントは計算もしない。`since` とは同時に使えない。
+ *
+ * `since` を指定した場合は、状態のバージョンが `since` から進むまで待ち (ロングポーリング)、
+ * `since` から変化したコンポーネントのみを `RailwayStateDelta` として返す。
+ * 一定時間内に変化がなければ、何も含まない差分を返す。
+ * `Accept` にバイナリ形式 (`application/x-ptcs-state`) が含まれていれば、差分をバイナリ形式で返す。
+     * @param since 
+     * @param include 
+     * @param junctions 
+     * @param sections 
+     * @param trains 
+     * @param stops 
+     * @param stations 
+     * @param sensorPositions 
+     * @param obstacles 
+     * @returns any Successful Response
      * @throws ApiError
      */
-    public static getState(): CancelablePromise<RailwayState> {
+    public static getState(
+since?: (number | null),
+include?: (string | null),
+junctions?: (string | null),
+sections?: (string | null),
+trains?: (string | null),
+stops?: (string | null),
+stations?: (string | null),
+sensorPositions?: (string | null),
+obstacles?: (string | null),
+): CancelablePromise<(RailwayState | PartialRailwayState | RailwayStateDelta)> {
         return __request(OpenAPI, {
             method: 'GET',
             url: '/api/state',
+            query: {
+                'since': since,
+                'include': include,
+                'junctions': junctions,
+                'sections': sections,
+                'trains': trains,
+                'stops': stops,
+                'stations': stations,
+                'sensor_positions': sensorPositions,
+                'obstacles': obstacles,
+            },
+            errors: {
+                422: `Validation Error`,
+            },
+        });
+    }
+
+    /**
+     * Get Dynamic State
+     * 実行中に変化する状態のみを返す。
+ * 路線の構成は `/topology` から一度だけ取得すること。
+ * `Accept` にバイナリ形式 (`application/x-ptcs-state`) が含まれていれば、バイナリ形式で返す。
+     * @returns RailwayDynamicState Successful Response
+     * @throws ApiError
+     */
+    public static getDynamicState(): CancelablePromise<RailwayDynamicState> {
+        return __request(OpenAPI, {
+            method: 'GET',
+            url: '/api/state/dynamic',
+        });
+    }
+
+    /**
+     * Stream State Sse
+     * `/state/ws` と同じメッセージを Server-Sent Events で送る。
+ * WebSocket が使えない環境向け。
+ * `format=binary` を指定すると、バイナリ形式のメッセージを Base64 に変換して送る (イベントはテキストしか送れないため)。
+     * @param format
+     * @returns any Successful Response
+     * @throws ApiError
+     */
+    public static streamStateSse(
+format: 'json' | 'binary' = 'json',
+): CancelablePromise<any> {
+        return __request(OpenAPI, {
+            method: 'GET',
+            url: '/api/state/sse',
+            query: {
+                'format': format,
+            },
+            errors: {
+                422: `Validation Error`,
+            },
+        });
+    }
+
+    /**
+     * Get Topology
+     * 路線の構成を返す。ETag は `layout_hash` になる。
+     * @returns RailwayTopology Successful Response
+     * @throws ApiError
+     */
+    public static getTopology(): CancelablePromise<RailwayTopology> {
+        return __request(OpenAPI, {
+            method: 'GET',
+            url: '/api/topology',
+        });
+    }
+
+    /**
+     * Get Topology By Hash
+     * `layout_hash` に対応する路線の構成を返す。
+ * 内容は `layout_hash` ごとに変わらないので、無期限にキャッシュしてよい。
+     * @param layoutHash 
+     * @returns RailwayTopology Successful Response
+     * @throws ApiError
+     */
+    public static getTopologyByHash(
+layoutHash: string,
+): CancelablePromise<RailwayTopology> {
+        return __request(OpenAPI, {
+            method: 'GET',
+            url: '/api/topology/{layout_hash}',
+            path: {
+                'layout_hash': layoutHash,
+            },
+            errors: {
+                422: `Validation Error`,
+            },
+        });
+    }
+
+    /**
+     * Get History
+     * 時刻 (UNIX 時間、秒) が `from` から `to` までの、実行中に変化する状態の履歴を返す。
+ * `step` を指定すると、`step` 秒ごとに間引いて返す。
+ * サーバーが保持しているのは直近の一定時間分のみで、それより前の記録は返さない。
+     * @param from 
+     * @param to 
+     * @param step 
+     * @returns RailwayHistory Successful Response
+     * @throws ApiError
+     */
+    public static getHistory(
+from?: (number | null),
+to?: (number | null),
+step?: (number | null),
+): CancelablePromise<RailwayHistory> {
+        return __request(OpenAPI, {
+            method: 'GET',
+            url: '/api/history',
+            query: {
+                'from': from,
+                'to': to,
+                'step': step,
+            },
+            errors: {
+                422: `Validation Error`,
+            },
         });
     }
 
@@ -209,4 +365,27 @@ sectionId: string,
         });
     }
 
+    /**
+     * Batch Commands
+     * 複数のコマンドをまとめて適用し、最後に一度だけ再計算する。
+ * ひとつでも存在しない ID を参照していれば、何も適用せずに 404 を返す。
+ * 制御ループと同じイベントループ上で実行されるため、途中で tick が割り込むことはない。
+     * @param requestBody 
+     * @returns BatchCommandsResult Successful Response
+     * @throws ApiError
+     */
+    public static batchCommands(
+requestBody: BatchCommandsParams,
+): CancelablePromise<BatchCommandsResult> {
+        return __request(OpenAPI, {
+            method: 'POST',
+            url: '/api/commands/batch',
+            body: requestBody,
+            mediaType: 'application/json',
+            errors: {
+                422: `Validation Error`,
+            },
+        });
+    }
+
 }
@@ -0,0 +1,4 @@
+export * from "./dist";
+export * from "./lib/binary";
+export * from "./lib/extrapolate";
+export * from "./lib/stream";
@@ -0,0 +1,180 @@
+import type { DirectedPosition } from "../dist/models/DirectedPosition";
+import type { JunctionDynamicState } from "../dist/models/JunctionDynamicState";
+import type { ObstacleDynamicState } from "../dist/models/ObstacleDynamicState";
+import { PointDirection } from "../dist/models/PointDirection";
+import type { RailwayDynamicState } from "../dist/models/RailwayDynamicState";
+import type { RailwayStateDelta } from "../dist/models/RailwayStateDelta";
+import type { RailwayTopology } from "../dist/models/RailwayTopology";
+import type { SectionDynamicState } from "../dist/models/SectionDynamicState";
+import type { TrainDynamicState } from "../dist/models/TrainDynamicState";
+
+/**
+ * バイナリ形式の状態の Content-Type。
+ * 形式の詳細は ptcs_server/binary.py を参照。
+ */
+export const BINARY_MEDIA_TYPE = "application/x-ptcs-state";
+
+const FORMAT_VERSION = 5;
+const NO_INDEX = 0xffff;
+const NO_DIRECTION = 0xff;
+const FLAG_DEPARTURE_TIME = 1 << 0;
+const FLAG_MANUAL_SPEED = 1 << 1;
+const DIRECTIONS = [PointDirection.STRAIGHT, PointDirection.CURVE];
+
+/**
+ * バイナリ形式の状態を `RailwayStateDelta` に変換する。
+ * インデックスは `topology.index` を使って ID に戻す。
+ */
+export const decodeStateMessage = (
+  buffer: ArrayBuffer,
+  topology: RailwayTopology
+): RailwayStateDelta => {
+  const view = new DataView(buffer);
+  const { index } = topology;
+  let offset = 0;
+
+  const u8 = () => view.getUint8((offset += 1) - 1);
+  const u16 = () => view.getUint16((offset += 2) - 2, true);
+  const u32 = () => view.getUint32((offset += 4) - 4, true);
+  const i32 = () => view.getInt32((offset += 4) - 4, true);
+  const f32 = () => view.getFloat32((offset += 4) - 4, true);
+  const f64 = () => view.getFloat64((offset += 8) - 8, true);
+  const ascii = (length: number) =>
+    String.fromCharCode(
+      ...new Uint8Array(buffer, (offset += length) - length, length)
+    );
+  const position = (): DirectedPosition => ({
+    section_id: index.section_ids[u16()],
+    target_junction_id: index.junction_ids[u16()],
+    mileage: f32(),
+  });
+
+  if (ascii(4) !== "PTCS") {
+    throw new Error("not a ptcs state message");
+  }
+  const format = u8();
+  if (format !== FORMAT_VERSION) {
+    throw new Error(`unsupported format version ${format}`);
+  }
+  const type = u8() === 0 ? "snapshot" : "delta";
+  const version = u32();
+  const since = i32();
+  const current_time = i32();
+  const layout_hash = ascii(16);
+  const timestamp = f64();
+  if (layout_hash !== topology.layout_hash) {
+    throw new Error(`layout ${layout_hash} does not match the topology`);
+  }
+
+  const junctions: Record<string, JunctionDynamicState> = {};
+  for (let count = u16(); count > 0; count--) {
+    const id = index.junction_ids[u16()];
+    const manual_direction = u8();
+    junctions[id] = {
+      id,
+      manual_direction:
+        manual_direction === NO_DIRECTION ? null : DIRECTIONS[manual_direction],
+      current_direction: DIRECTIONS[u8()],
+      direction_command: DIRECTIONS[u8()],
+    };
+  }
+
+  const sections: Record<string, SectionDynamicState> = {};
+  for (let count = u16(); count > 0; count--) {
+    const id = index.section_ids[u16()];
+    sections[id] = { id, is_blocked: u8() !== 0 };
+  }
+
+  const trains: Record<string, TrainDynamicState> = {};
+  for (let count = u16(); count > 0; count--) {
+    const id = index.train_ids[u16()];
+    const flags = u8();
+    const head_position = position();
+    const tail_position = position();
+    const stop = u16();
+    const stop_distance = f32();
+    const departure_time = i32();
+    const speed_command = f32();
+    const voltage_mV = i32();
+    const manual_speed = f32();
+    const next_junction_distance = f32();
+    const covered_section_ids = Array.from(
+      { length: u16() },
+      () => index.section_ids[u16()]
+    );
+    const body_points = Array.from({ length: u16() }, () => ({
+      x: f32(),
+      y: f32(),
+    }));
+    trains[id] = {
+      id,
+      head_position,
+      tail_position,
+      covered_section_ids,
+      stop_id: stop === NO_INDEX ? null : index.stop_ids[stop],
+      stop_distance,
+      departure_time: flags & FLAG_DEPARTURE_TIME ? departure_time : null,
+      speed_command,
+      voltage_mV,
+      manual_speed: flags & FLAG_MANUAL_SPEED ? manual_speed : null,
+      next_junction_distance,
+      body_points,
+    };
+  }
+
+  const obstacles: Record<string, ObstacleDynamicState> = {};
+  for (let count = u16(); count > 0; count--) {
+    const id = index.obstacle_ids[u16()];
+    obstacles[id] = { id, is_detected: u8() !== 0 };
+  }
+
+  return {
+    type,
+    version,
+    since: since < 0 ? null : since,
+    layout_hash,
+    timestamp,
+    current_time,
+    junctions,
+    sections,
+    trains,
+    obstacles,
+  };
+};
+
+/**
+ * `/api/state/dynamic` をバイナリ形式で取得する。
+ */
+export const fetchDynamicStateBinary = async (
+  topology: RailwayTopology,
+  url = "/api/state/dynamic"
+): Promise<RailwayDynamicState> => {
+  const response = await fetch(url, {
+    headers: { Accept: BINARY_MEDIA_TYPE },
+  });
+  if (!response.ok) {
+    throw new Error(`${response.status} ${response.statusText}`);
+  }
+  const { type, since, ...state } = decodeStateMessage(
+    await response.arrayBuffer(),
+    topology
+  );
+  return state;
+};
+
+/**
+ * `/api/state?since=<version>` をバイナリ形式で取得する (ロングポーリング)。
+ */
+export const fetchStateDeltaBinary = async (
+  topology: RailwayTopology,
+  since: number,
+  url = "/api/state"
+): Promise<RailwayStateDelta> => {
+  const response = await fetch(`${url}?since=${since}`, {
+    headers: { Accept: BINARY_MEDIA_TYPE },
+  });
+  if (!response.ok) {
+    throw new Error(`${response.status} ${response.statusText}`);
+  }
+  return decodeStateMessage(await response.arrayBuffer(), topology);
+};
@@ -0,0 +1,173 @@
+import type { Coordinate } from "../dist/models/Coordinate";
+import type { DirectedPosition } from "../dist/models/DirectedPosition";
+import type { RailwayDynamicState } from "../dist/models/RailwayDynamicState";
+import type { RailwayTopology } from "../dist/models/RailwayTopology";
+import type { TrainDynamicState } from "../dist/models/TrainDynamicState";
+
+/**
+ * 状態を受け取ってから `elapsedSeconds` 秒経ったときの列車の位置を推定する。
+ *
+ * 列車は速度指令値 `speed_command` の速さで進み続けるとみなす。
+ * (サーバーは実際の速さを送らないので、加減速の途中では推定がずれる。次の状態を受け取れば正しい位置に戻る)
+ * ただし先頭が次の分岐点を越える (分岐の向きによって進路が変わる) ところまでは進めない。
+ * `body_points` は最後尾側を切り詰め、先頭側を最後の線分の向きに伸ばす。
+ */
+export const extrapolateTrain = (
+  train: TrainDynamicState,
+  topology: RailwayTopology,
+  elapsedSeconds: number
+): TrainDynamicState => {
+  const distance = Math.min(
+    Math.max(train.speed_command * elapsedSeconds, 0),
+    train.next_junction_distance
+  );
+  if (distance === 0) {
+    return train;
+  }
+
+  const [tail_position, covered_section_ids] = advanceTail(
+    train,
+    topology,
+    distance
+  );
+  const length = topology.trains[train.id]?.length ?? 0;
+  return {
+    ...train,
+    head_position: advance(train.head_position, topology, distance),
+    tail_position,
+    covered_section_ids,
+    next_junction_distance: train.next_junction_distance - distance,
+    body_points: shiftPolyline(
+      train.body_points,
+      length > 0 ? (distance * polylineLength(train.body_points)) / length : 0
+    ),
+  };
+};
+
+/**
+ * `state` のすべての列車について `extrapolateTrain()` を行う。
+ * `elapsedSeconds` を省略すると、`state.timestamp` からの経過時間を使う。
+ * (サーバーとクライアントの時計がずれている場合は、受け取った時刻からの経過時間を渡すこと)
+ */
+export const extrapolateState = (
+  state: RailwayDynamicState,
+  topology: RailwayTopology,
+  elapsedSeconds = Date.now() / 1000 - state.timestamp
+): RailwayDynamicState => ({
+  ...state,
+  trains: Object.fromEntries(
+    Object.entries(state.trains).map(([id, train]) => [
+      id,
+      extrapolateTrain(train, topology, elapsedSeconds),
+    ])
+  ),
+});
+
+const isTargetB = (
+  position: DirectedPosition,
+  topology: RailwayTopology
+): boolean =>
+  topology.sections[position.section_id].connected_junction_ids["B"] ===
+  position.target_junction_id;
+
+const getDistanceToTargetJunction = (
+  position: DirectedPosition,
+  topology: RailwayTopology
+): number =>
+  isTargetB(position, topology)
+    ? topology.sections[position.section_id].length - position.mileage
+    : position.mileage;
+
+/**
+ * `position` を同じセクションの中で `distance` だけ進める。
+ */
+const advance = (
+  position: DirectedPosition,
+  topology: RailwayTopology,
+  distance: number
+): DirectedPosition => ({
+  ...position,
+  mileage: isTargetB(position, topology)
+    ? position.mileage + distance
+    : position.mileage - distance,
+});
+
+/**
+ * 最後尾を `distance` だけ進める。
+ * 最後尾がセクションの端を越えたら、列車がかかっているセクションのうち次のものに移る。
+ */
+const advanceTail = (
+  train: TrainDynamicState,
+  topology: RailwayTopology,
+  distance: number
+): [DirectedPosition, Array<string>] => {
+  let position = train.tail_position;
+  const covered = [...train.covered_section_ids];
+  let remaining = distance;
+  for (;;) {
+    const toJunction = getDistanceToTargetJunction(position, topology);
+    const next = covered[0] ?? train.head_position.section_id;
+    if (remaining <= toJunction || next === position.section_id) {
+      break;
+    }
+    remaining -= toJunction;
+    covered.shift();
+    const { connected_junction_ids, length } = topology.sections[next];
+    const fromA = connected_junction_ids["A"] === position.target_junction_id;
+    position = {
+      section_id: next,
+      target_junction_id: connected_junction_ids[fromA ? "B" : "A"],
+      mileage: fromA ? 0 : length,
+    };
+  }
+  return [advance(position, topology, remaining), covered];
+};
+
+const polylineLength = (points: Array<Coordinate>): number =>
+  points
+    .slice(1)
+    .reduce(
+      (sum, point, i) =>
+        sum + Math.hypot(point.x - points[i].x, point.y - points[i].y),
+      0
+    );
+
+/**
+ * 折れ線に沿って `shift` だけ進める。
+ * 始点側は折れ線に沿って切り詰め、終点側は最後の線分の向きに伸ばす。
+ */
+const shiftPolyline = (
+  points: Array<Coordinate>,
+  shift: number
+): Array<Coordinate> => {
+  if (points.length < 2 || shift <= 0) {
+    return points;
+  }
+
+  const trimmed = [...points];
+  let remaining = shift;
+  while (trimmed.length > 2) {
+    const [p, q] = trimmed;
+    const segment = Math.hypot(q.x - p.x, q.y - p.y);
+    if (remaining < segment) {
+      break;
+    }
+    remaining -= segment;
+    trimmed.shift();
+  }
+  const [p, q] = trimmed;
+  const first = Math.hypot(q.x - p.x, q.y - p.y);
+  const t = first > 0 ? Math.min(remaining / first, 1) : 0;
+  trimmed[0] = { x: p.x + (q.x - p.x) * t, y: p.y + (q.y - p.y) * t };
+
+  const a = points[points.length - 2];
+  const b = points[points.length - 1];
+  const last = Math.hypot(b.x - a.x, b.y - a.y);
+  if (last > 0) {
+    trimmed.push({
+      x: b.x + ((b.x - a.x) / last) * shift,
+      y: b.y + ((b.y - a.y) / last) * shift,
+    });
+  }
+  return trimmed;
+};
@@ -0,0 +1,119 @@
+import type { RailwayDynamicState } from "../dist/models/RailwayDynamicState";
+import type { RailwayStateDelta } from "../dist/models/RailwayStateDelta";
+import type { RailwayTopology } from "../dist/models/RailwayTopology";
+import { decodeStateMessage } from "./binary";
+
+/**
+ * `/api/state/ws` などから受け取ったメッセージを、手元の状態に適用する。
+ * スナップショットを受け取るまでは `null` を返す。
+ */
+export const applyStateDelta = (
+  state: RailwayDynamicState | null,
+  message: RailwayStateDelta
+): RailwayDynamicState | null => {
+  const { type, since, ...rest } = message;
+  if (type === "snapshot") {
+    return rest;
+  }
+  if (state === null) {
+    return null;
+  }
+  return {
+    ...rest,
+    junctions: { ...state.junctions, ...message.junctions },
+    sections: { ...state.sections, ...message.sections },
+    trains: { ...state.trains, ...message.trains },
+    obstacles: { ...state.obstacles, ...message.obstacles },
+  };
+};
+
+/**
+ * `/api/state/ws` に接続し、状態が更新されるたびに `onState` を呼ぶ。
+ * `topology` を渡すと、バイナリ形式 (`format=binary`) で受け取って `topology.index` で ID に戻す。
+ * 接続が切れたら `reconnectDelay` ミリ秒後に接続し直す。
+ * 返り値の関数を呼ぶと購読をやめる。
+ */
+export const subscribeState = (
+  onState: (state: RailwayDynamicState) => void,
+  {
+    url = `${location.protocol === "https:" ? "wss:" : "ws:"}//${
+      location.host
+    }/api/state/ws`,
+    reconnectDelay = 1000,
+    topology,
+  }: { url?: string; reconnectDelay?: number; topology?: RailwayTopology } = {}
+): (() => void) => {
+  let state: RailwayDynamicState | null = null;
+  let socket: WebSocket | null = null;
+  let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  let closed = false;
+
+  const connect = () => {
+    socket = new WebSocket(topology ? withBinaryFormat(url) : url);
+    socket.binaryType = "arraybuffer";
+    socket.onmessage = (event) => {
+      const message: RailwayStateDelta = topology
+        ? decodeStateMessage(event.data, topology)
+        : JSON.parse(event.data);
+      state = applyStateDelta(state, message);
+      if (state) {
+        onState(state);
+      }
+    };
+    socket.onclose = () => {
+      state = null;
+      if (!closed) {
+        reconnectTimer = setTimeout(connect, reconnectDelay);
+      }
+    };
+  };
+
+  connect();
+
+  return () => {
+    closed = true;
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer);
+    }
+    socket?.close();
+  };
+};
+
+/**
+ * `/api/state/sse` に接続し、状態が更新されるたびに `onState` を呼ぶ。
+ * WebSocket が使えない環境向け。接続が切れた場合は EventSource が自動で接続し直す。
+ * `topology` を渡すと、Base64 に変換されたバイナリ形式 (`format=binary`) で受け取る。
+ * 返り値の関数を呼ぶと購読をやめる。
+ */
+export const subscribeStateSSE = (
+  onState: (state: RailwayDynamicState) => void,
+  {
+    url = "/api/state/sse",
+    topology,
+  }: { url?: string; topology?: RailwayTopology } = {}
+): (() => void) => {
+  let state: RailwayDynamicState | null = null;
+  const source = new EventSource(topology ? withBinaryFormat(url) : url);
+  source.onmessage = (event) => {
+    const message: RailwayStateDelta = topology
+      ? decodeStateMessage(decodeBase64(event.data), topology)
+      : JSON.parse(event.data);
+    state = applyStateDelta(state, message);
+    if (state) {
+      onState(state);
+    }
+  };
+  source.onerror = () => {
+    // 接続し直すと最初にスナップショットが届く
+    state = null;
+  };
+  return () => {
+    source.close();
+  };
+};
+
+const withBinaryFormat = (url: string): string =>
+  `${url}${url.includes("?") ? "&" : "?"}format=binary`;
+
+const decodeBase64 = (data: string): ArrayBuffer =>
+  Uint8Array.from(atob(data), (c) => c.charCodeAt(0)).buffer;
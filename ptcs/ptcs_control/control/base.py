@@ -11,6 +11,7 @@ from ..components.station import Station
 from ..components.stop import Stop
 from ..components.train import Train
 from .events import Event
+from .traversal import Traversal
 
 
 def create_empty_logger() -> logging.Logger:
@@ -26,6 +27,7 @@ class BaseControl(ABC):
 
     状態変化に応じて再計算を行う `update()` メソッドはこのクラスに実装されていないので、
     固定閉塞か移動閉塞かといったシステムの特性に応じて派生クラスを作って実装すること。
+    `update()` の中の路線の探索は `traversal` を通して行い、探索の実装を差し替えられるようにすること。
     """
 
     _current_time: int = field(default=0)  # 現在時刻
@@ -42,6 +44,8 @@ class BaseControl(ABC):
 
     logger: logging.Logger = field(default_factory=create_empty_logger)
 
+    traversal: Traversal = field(default_factory=Traversal)  # 路線の探索の実装
+
     def add_junction(self, junction: Junction) -> None:
         assert junction.id not in self.junctions
         self.junctions[junction.id] = junction
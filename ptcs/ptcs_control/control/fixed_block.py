@@ -13,13 +13,22 @@ from .events import TrainSectionChanged
 class FixedBlockControl(BaseControl):
     """
     固定閉塞システムの全体を管理する。
+    パラメーターはクラス変数に置いているので、インスタンスごとに上書きできる (ptcs_server/sweep.py で調整する)。
     """
 
+    BREAK_ACCLT: float = 10  # ブレーキ減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
+    NORMAL_ACCLT: float = 5  # 常用加減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
+    MAX_SPEED: float = 40  # 最高速度[cm/s]  NOTE:将来的には車両のパラメータとしてとして定義
+    MERGIN: float = 25  # 停止余裕距離[cm]
+    STOPPAGE_TIME: int = 30  # 列車の停止時間[フレーム]
+    STOPPAGE_MERGIN: float = STRAIGHT_RAIL / 2  # 停止区間距離[cm]
+
     def update(self) -> None:
         """
         状態に変化が起こった後、すべてを再計算する。
         """
 
+        self.traversal.reset(self)
         self._calc_block()
         self._calc_direction()
         self._calc_stop()
@@ -32,7 +41,7 @@ class FixedBlockControl(BaseControl):
 
         for train_id, train in self.trains.items():
             train.head_position.section.is_blocked = True
-            train.compute_tail_position().section.is_blocked = True
+            self.traversal.get_retracted_position(train.head_position, train.length).section.is_blocked = True
 
     def _calc_direction(self) -> None:
         """
@@ -46,7 +55,7 @@ class FixedBlockControl(BaseControl):
         # 急行線上の分岐点では特急を急行線に、
         # 緩行線上の分岐点では各駅停車を緩行線に保つ。
         for junction in self.junctions.values():
-            nearest_train = junction.find_nearest_train()
+            nearest_train = self.traversal.find_nearest_train(junction)
 
             if not nearest_train:
                 continue
@@ -57,12 +66,12 @@ class FixedBlockControl(BaseControl):
                     section_d = junction.connected_sections.get(JunctionConnection.DIVERGING)
                     if (
                         section_t == nearest_train.head_position.section
-                        or section_t == nearest_train.head_position.get_advanced_position(1.0).section
+                        or section_t == self.traversal.get_advanced_position(nearest_train.head_position, 1.0).section
                     ):
                         junction.manual_direction = PointDirection.STRAIGHT
                     elif (
                         section_d == nearest_train.head_position.section
-                        or section_d == nearest_train.head_position.get_advanced_position(1.0).section
+                        or section_d == self.traversal.get_advanced_position(nearest_train.head_position, 1.0).section
                     ):
                         junction.manual_direction = PointDirection.CURVE
                     else:
@@ -101,13 +110,13 @@ class FixedBlockControl(BaseControl):
                         t1: Train | None = None
                         match current_section.block_id:
                             case "b00":  # 代々木上原 → 下北沢
-                                t1 = self.junctions["c141"].find_nearest_train()
+                                t1 = self.traversal.find_nearest_train(self.junctions["c141"])
                             case "b12":  # 豪徳寺 → 経堂
-                                t1 = self.junctions["c148"].find_nearest_train()
+                                t1 = self.traversal.find_nearest_train(self.junctions["c148"])
                             case "b30":  # 千歳船橋 ← 成城学園前
-                                t1 = self.junctions["c123"].find_nearest_train()
+                                t1 = self.traversal.find_nearest_train(self.junctions["c123"])
                             case "b41":  # 豪徳寺 ← 経堂
-                                t1 = self.junctions["j13"].find_nearest_train()
+                                t1 = self.traversal.find_nearest_train(self.junctions["j13"])
 
                         if t1 and t1.type == TrainType.CommuterSemiExpress:
                             # TODO
@@ -116,7 +125,7 @@ class FixedBlockControl(BaseControl):
         # ポイントの向きを適用する。
         for junction in self.junctions.values():
             if junction.manual_direction:
-                if not junction.is_toggle_prohibited():
+                if not self.traversal.is_toggle_prohibited(junction):
                     junction.set_direction(junction.manual_direction)
                     junction.manual_direction = None
 
@@ -126,9 +135,6 @@ class FixedBlockControl(BaseControl):
         この情報は列車の速度を計算するのに使われる。
         """
 
-        STOPPAGE_TIME: int = 30  # 列車の停止時間[フレーム] NOTE: 将来的にはパラメータとして定義
-        STOPPAGE_MERGIN: float = STRAIGHT_RAIL / 2  # 停止区間距離[cm]
-
         # 列車のセクション変更イベントを拾って停止駅を判断する
         for event in self.event_queue:
             match event:
@@ -155,13 +161,13 @@ class FixedBlockControl(BaseControl):
 
                     if current_section.id in stops:
                         t0.stop_distance = 0.0
-                        t0.departure_time = self.current_time + STOPPAGE_TIME
+                        t0.departure_time = self.current_time + self.STOPPAGE_TIME
 
         return
 
         for train in self.trains.values():
             # 列車より手前にある停止目標を取得する
-            forward_stop, forward_stop_distance = train.find_forward_stop() or (None, 1e9)
+            forward_stop, forward_stop_distance = self.traversal.find_forward_stop(train) or (None, 1e9)
 
             if train.departure_time is None:
                 # 「停止目標が変わらず、停止距離が区間外から区間内に変わる」のを検知することで駅の停止開始を判定する。
@@ -179,9 +185,9 @@ class FixedBlockControl(BaseControl):
                 #   - ただし、停止目標が次も同じになる (例: ループの中で駅がひとつしかない) ような路線ではないとする
                 # - ポイントが切り替わって停止目標が再計算された場合
                 #   - 停止目標が変わるような箇所はすべて区間外であるため無視
-                if train.stop == forward_stop and forward_stop_distance <= STOPPAGE_MERGIN < train.stop_distance:
+                if train.stop == forward_stop and forward_stop_distance <= self.STOPPAGE_MERGIN < train.stop_distance:
                     train.stop_distance = forward_stop_distance
-                    train.departure_time = self.current_time + STOPPAGE_TIME
+                    train.departure_time = self.current_time + self.STOPPAGE_TIME
                 else:
                     train.stop = forward_stop
                     train.stop_distance = forward_stop_distance
@@ -203,11 +209,6 @@ class FixedBlockControl(BaseControl):
                     train.departure_time = None
 
     def _calc_speed(self) -> None:
-        BREAK_ACCLT: float = 10  # ブレーキ減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
-        NORMAL_ACCLT: float = 5  # 常用加減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
-        MAX_SPEED: float = 40  # 最高速度[cm/s]  NOTE:将来的には車両のパラメータとしてとして定義
-        MERGIN: float = 25  # 停止余裕距離[cm]
-
         for train in self.trains.values():
             current_section = train.head_position.section
             target_junction = train.head_position.target_junction
@@ -218,7 +219,7 @@ class FixedBlockControl(BaseControl):
             elif next_section.is_blocked:
                 train.speed_command = 0.0
             else:
-                train.speed_command = MAX_SPEED
+                train.speed_command = self.MAX_SPEED
 
             if train.departure_time is not None and self.current_time >= train.departure_time:
                 train.departure_time = None
@@ -227,7 +228,10 @@ class FixedBlockControl(BaseControl):
 
         objects: list[tuple[Train, DirectedPosition] | tuple[Obstacle, UndirectedPosition]] = [
             *((train, train.head_position) for train in self.trains.values()),
-            *((train, train.compute_tail_position()) for train in self.trains.values()),
+            *(
+                (train, self.traversal.get_retracted_position(train.head_position, train.length))
+                for train in self.trains.values()
+            ),
             *((obstacle, obstacle.position) for obstacle in self.obstacles.values() if obstacle.is_detected),
         ]
 
@@ -239,9 +243,9 @@ class FixedBlockControl(BaseControl):
             current_section = train.head_position.section
             target_junction = train.head_position.target_junction
 
-            forward_object_and_distance = train.find_forward_object(objects)
+            forward_object_and_distance = self.traversal.find_forward_object(train, objects)
             if forward_object_and_distance:
-                distance += forward_object_and_distance[1] - MERGIN
+                distance += forward_object_and_distance[1] - self.MERGIN
             else:
                 while True:
                     next_section, next_junction = current_section.get_next_section_and_target_junction(target_junction)
@@ -253,8 +257,8 @@ class FixedBlockControl(BaseControl):
                         break
 
                     # 先行列車に到達できる -> 先行列車の手前で停止
-                    elif forward_train_and_distance := train.find_forward_train():
-                        distance += forward_train_and_distance[1] - MERGIN
+                    elif forward_train_and_distance := self.traversal.find_forward_train(train):
+                        distance += forward_train_and_distance[1] - self.MERGIN
                         break
 
                     # 目指すジャンクションが自列車側に開通していない or 次のセクションが閉鎖
@@ -265,21 +269,21 @@ class FixedBlockControl(BaseControl):
                     ):
                         if current_section == train.head_position.section:
                             if target_junction == current_section.connected_junctions[SectionConnection.A]:
-                                distance += train.head_position.mileage - MERGIN
+                                distance += train.head_position.mileage - self.MERGIN
                             elif target_junction == current_section.connected_junctions[SectionConnection.B]:
-                                distance += current_section.length - train.head_position.mileage - MERGIN
+                                distance += current_section.length - train.head_position.mileage - self.MERGIN
                             else:
                                 raise
                         else:
-                            distance += current_section.length - MERGIN
+                            distance += current_section.length - self.MERGIN
                         break
 
                     # 次のセクションが閉鎖 -> 目指すジャンクションの手前で停止
                     elif next_section.is_blocked is True:
                         if target_junction == current_section.connected_junctions[SectionConnection.A]:
-                            distance += train.head_position.mileage - MERGIN
+                            distance += train.head_position.mileage - self.MERGIN
                         elif target_junction == current_section.connected_junctions[SectionConnection.B]:
-                            distance += current_section.length - train.head_position.mileage - MERGIN
+                            distance += current_section.length - train.head_position.mileage - self.MERGIN
                         else:
                             raise
                         break
@@ -311,9 +315,9 @@ class FixedBlockControl(BaseControl):
 
             # [ATP]停止位置までの距離を使って、列車の許容速度`speedlimit`を計算する
 
-            speedlimit = math.sqrt(2 * BREAK_ACCLT * distance)
-            if speedlimit > MAX_SPEED:
-                speedlimit = MAX_SPEED
+            speedlimit = math.sqrt(2 * self.BREAK_ACCLT * distance)
+            if speedlimit > self.MAX_SPEED:
+                speedlimit = self.MAX_SPEED
 
             # [ATO]駅の停止目標までの距離と、ATP停止位置までの距離を比較して、より近い
             # 停止位置までの距離`stop_distance`を計算
@@ -328,14 +332,14 @@ class FixedBlockControl(BaseControl):
             # [ATO]運転速度を、許容速度の範囲内で計算する。
             # まず、停止位置でちゃんと止まれる速度`stop_speed`を計算。
 
-            stop_speed = min(math.sqrt(2 * NORMAL_ACCLT * stop_distance), speedlimit)
+            stop_speed = min(math.sqrt(2 * self.NORMAL_ACCLT * stop_distance), speedlimit)
 
             # [ATO]急加速しないよう緩やかに速度を増やす
 
             speed_command = train.speed_command
             loop_time = 0.1  # NOTE: 1回の制御ループが何秒で回るか？をあとで入れたい
-            if stop_speed > speed_command + NORMAL_ACCLT * loop_time:
-                speed_command = speed_command + NORMAL_ACCLT * loop_time
+            if stop_speed > speed_command + self.NORMAL_ACCLT * loop_time:
+                speed_command = speed_command + self.NORMAL_ACCLT * loop_time
             else:
                 speed_command = stop_speed
 
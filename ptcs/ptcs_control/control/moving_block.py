@@ -12,13 +12,22 @@ from .base import BaseControl
 class MovingBlockControl(BaseControl):
     """
     移動閉塞システムの全体を管理する。
+    パラメーターはクラス変数に置いているので、インスタンスごとに上書きできる (ptcs_server/sweep.py で調整する)。
     """
 
+    BREAK_ACCLT: float = 10  # ブレーキ減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
+    NORMAL_ACCLT: float = 5  # 常用加減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
+    MAX_SPEED: float = 40  # 最高速度[cm/s]  NOTE:将来的には車両のパラメータとしてとして定義
+    MERGIN: float = 25  # 停止余裕距離[cm]
+    STOPPAGE_TIME: int = 50  # 列車の停止時間[フレーム]
+    STOPPAGE_MERGIN: float = STRAIGHT_RAIL / 2  # 停止区間距離[cm]
+
     def update(self) -> None:
         """
         状態に変化が起こった後、すべてを再計算する。
         """
 
+        self.traversal.reset(self)
         self._calc_direction()
         self._calc_stop()
         self._calc_speed()
@@ -36,7 +45,7 @@ class MovingBlockControl(BaseControl):
         # obstacle_0 が出ていないときは、t0-t3 を内側、t4 を外側に運ぶ。
         # obstacle_0 が出ているときは、すべて外側に運ぶ。
         for junction in self.junctions.values():
-            nearest_train = junction.find_nearest_train()
+            nearest_train = self.traversal.find_nearest_train(junction)
 
             if not nearest_train:
                 continue
@@ -99,19 +108,17 @@ class MovingBlockControl(BaseControl):
 
         for junction in self.junctions.values():
             if junction.manual_direction:
-                if not junction.is_toggle_prohibited():
+                if not self.traversal.is_toggle_prohibited(junction):
                     junction.set_direction(junction.manual_direction)
                     junction.manual_direction = None
 
     def _calc_speed(self) -> None:
-        BREAK_ACCLT: float = 10  # ブレーキ減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
-        NORMAL_ACCLT: float = 5  # 常用加減速度[cm/s/s]  NOTE:将来的には車両のパラメータとして定義
-        MAX_SPEED: float = 40  # 最高速度[cm/s]  NOTE:将来的には車両のパラメータとしてとして定義
-        MERGIN: float = 25  # 停止余裕距離[cm]
-
         objects: list[tuple[Train, DirectedPosition] | tuple[Obstacle, UndirectedPosition]] = [
             *((train, train.head_position) for train in self.trains.values()),
-            *((train, train.compute_tail_position()) for train in self.trains.values()),
+            *(
+                (train, self.traversal.get_retracted_position(train.head_position, train.length))
+                for train in self.trains.values()
+            ),
             *((obstacle, obstacle.position) for obstacle in self.obstacles.values() if obstacle.is_detected),
         ]
 
@@ -123,9 +130,9 @@ class MovingBlockControl(BaseControl):
             current_section = train.head_position.section
             target_junction = train.head_position.target_junction
 
-            forward_object_and_distance = train.find_forward_object(objects)
+            forward_object_and_distance = self.traversal.find_forward_object(train, objects)
             if forward_object_and_distance:
-                distance += forward_object_and_distance[1] - MERGIN
+                distance += forward_object_and_distance[1] - self.MERGIN
             else:
                 while True:
                     next_section, next_junction = current_section.get_next_section_and_target_junction(target_junction)
@@ -137,8 +144,8 @@ class MovingBlockControl(BaseControl):
                         break
 
                     # 先行列車に到達できる -> 先行列車の手前で停止
-                    elif forward_train_and_distance := train.find_forward_train():
-                        distance += forward_train_and_distance[1] - MERGIN
+                    elif forward_train_and_distance := self.traversal.find_forward_train(train):
+                        distance += forward_train_and_distance[1] - self.MERGIN
                         break
 
                     # 目指すジャンクションが自列車側に開通していない or 次のセクションが閉鎖
@@ -149,21 +156,21 @@ class MovingBlockControl(BaseControl):
                     ):
                         if current_section == train.head_position.section:
                             if target_junction == current_section.connected_junctions[SectionConnection.A]:
-                                distance += train.head_position.mileage - MERGIN
+                                distance += train.head_position.mileage - self.MERGIN
                             elif target_junction == current_section.connected_junctions[SectionConnection.B]:
-                                distance += current_section.length - train.head_position.mileage - MERGIN
+                                distance += current_section.length - train.head_position.mileage - self.MERGIN
                             else:
                                 raise
                         else:
-                            distance += current_section.length - MERGIN
+                            distance += current_section.length - self.MERGIN
                         break
 
                     # 次のセクションが閉鎖 -> 目指すジャンクションの手前で停止
                     elif next_section.is_blocked is True:
                         if target_junction == current_section.connected_junctions[SectionConnection.A]:
-                            distance += train.mileage - MERGIN
+                            distance += train.mileage - self.MERGIN
                         elif target_junction == current_section.connected_junctions[SectionConnection.B]:
-                            distance += current_section.length - train.mileage - MERGIN
+                            distance += current_section.length - train.mileage - self.MERGIN
                         else:
                             raise
                         break
@@ -195,9 +202,9 @@ class MovingBlockControl(BaseControl):
 
             # [ATP]停止位置までの距離を使って、列車の許容速度`speedlimit`を計算する
 
-            speedlimit = math.sqrt(2 * BREAK_ACCLT * distance)
-            if speedlimit > MAX_SPEED:
-                speedlimit = MAX_SPEED
+            speedlimit = math.sqrt(2 * self.BREAK_ACCLT * distance)
+            if speedlimit > self.MAX_SPEED:
+                speedlimit = self.MAX_SPEED
 
             # [ATO]駅の停止目標までの距離と、ATP停止位置までの距離を比較して、より近い
             # 停止位置までの距離`stop_distance`を計算
@@ -212,14 +219,14 @@ class MovingBlockControl(BaseControl):
             # [ATO]運転速度を、許容速度の範囲内で計算する。
             # まず、停止位置でちゃんと止まれる速度`stop_speed`を計算。
 
-            stop_speed = min(math.sqrt(2 * NORMAL_ACCLT * stop_distance), speedlimit)
+            stop_speed = min(math.sqrt(2 * self.NORMAL_ACCLT * stop_distance), speedlimit)
 
             # [ATO]急加速しないよう緩やかに速度を増やす
 
             speed_command = train.speed_command
             loop_time = 0.1  # NOTE: 1回の制御ループが何秒で回るか？をあとで入れたい
-            if stop_speed > speed_command + NORMAL_ACCLT * loop_time:
-                speed_command = speed_command + NORMAL_ACCLT * loop_time
+            if stop_speed > speed_command + self.NORMAL_ACCLT * loop_time:
+                speed_command = speed_command + self.NORMAL_ACCLT * loop_time
             else:
                 speed_command = stop_speed
 
@@ -247,12 +254,9 @@ class MovingBlockControl(BaseControl):
         この情報は列車の速度を計算するのに使われる。
         """
 
-        STOPPAGE_TIME: int = 50  # 列車の停止時間[フレーム] NOTE: 将来的にはパラメータとして定義
-        STOPPAGE_MERGIN: float = STRAIGHT_RAIL / 2  # 停止区間距離[cm]
-
         for train in self.trains.values():
             # 列車より手前にある停止目標を取得する
-            forward_stop, forward_stop_distance = train.find_forward_stop() or (None, 0.0)
+            forward_stop, forward_stop_distance = self.traversal.find_forward_stop(train) or (None, 0.0)
 
             if train.departure_time is None:
                 # 「停止目標が変わらず、停止距離が区間外から区間内に変わる」のを検知することで駅の停止開始を判定する。
@@ -270,9 +274,9 @@ class MovingBlockControl(BaseControl):
                 #   - ただし、停止目標が次も同じになる (例: ループの中で駅がひとつしかない) ような路線ではないとする
                 # - ポイントが切り替わって停止目標が再計算された場合
                 #   - 停止目標が変わるような箇所はすべて区間外であるため無視
-                if train.stop == forward_stop and forward_stop_distance <= STOPPAGE_MERGIN < train.stop_distance:
+                if train.stop == forward_stop and forward_stop_distance <= self.STOPPAGE_MERGIN < train.stop_distance:
                     train.stop_distance = forward_stop_distance
-                    train.departure_time = self.current_time + STOPPAGE_TIME
+                    train.departure_time = self.current_time + self.STOPPAGE_TIME
                 else:
                     train.stop = forward_stop
                     train.stop_distance = forward_stop_distance
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, TypeVar
+
+if TYPE_CHECKING:
+    from ..components.junction import Junction
+    from ..components.position import DirectedPosition, UndirectedPosition
+    from ..components.stop import Stop
+    from ..components.train import Train
+    from .base import BaseControl
+
+T = TypeVar("T")
+
+
+class Traversal:
+    """
+    control の update が行う、路線の探索の実装。
+
+    update はコンポーネントのメソッドを直接呼ばずに、`control.traversal` を通して探索する。
+    索引やキャッシュを使う速い実装は、このクラスを継承してメソッドを差し替え、
+    ptcs_control/equivalence.py でこのクラス (素直な実装) と同じ結果になることを確かめてから使うこと。
+
+    update の途中でもポイントの向き (`Junction.set_direction`) は変わり、
+    後退した位置や次のセクションはポイントの向きによって変わるので、キャッシュはそれも考慮すること。
+    """
+
+    def reset(self, control: BaseControl) -> None:
+        """
+        update の最初に呼ばれる。前回の update から後に列車の位置やポイントの向きが変わっているかもしれない。
+        """
+
+    def get_advanced_position(self, position: DirectedPosition, delta: float) -> DirectedPosition:
+        return position.get_advanced_position(delta)
+
+    def get_retracted_position(self, position: DirectedPosition, delta: float) -> DirectedPosition:
+        return position.get_retracted_position(delta)
+
+    def find_nearest_train(self, junction: Junction) -> Train | None:
+        return junction.find_nearest_train()
+
+    def is_toggle_prohibited(self, junction: Junction) -> bool:
+        return junction.is_toggle_prohibited()
+
+    def find_forward_train(self, train: Train) -> tuple[Train, float] | None:
+        return train.find_forward_train()
+
+    def find_forward_stop(self, train: Train) -> tuple[Stop, float] | None:
+        return train.find_forward_stop()
+
+    def find_forward_object(
+        self, train: Train, object_position_pairs: Iterable[tuple[T, UndirectedPosition | DirectedPosition]]
+    ) -> tuple[T, float] | None:
+        return train.find_forward_object(object_position_pairs)
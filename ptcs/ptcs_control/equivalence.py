@@ -0,0 +1,360 @@
+"""
+探索や update の別の実装 (バックエンド) が、素直な実装と同じ結果を出すことを確かめる。
+
+路線・列車・ポイントの初期の向き・列車の進み方を乱数で決めたシナリオを作り、
+同じシナリオを 2 つのバックエンドで tick ごとに動かして、速度指令・停止目標・ポイントの向きなどを比べる。
+路線は自動生成したもの (ptcs_control/synthetic.py) のほか、実際の路線も使う。
+FixedBlockControl のポイントの切り替えは実際の路線のジャンクションの ID を決め打ちしているので、
+自動生成した路線だけではポイントの切り替えが起こらないためである。
+食い違いが見つかれば、食い違いが残る範囲でシナリオを小さくしていき (縮小)、最小のシナリオを報告する。
+
+```
+from ptcs_control.control.fixed_block import FixedBlockControl
+from ptcs_control.control.traversal import Traversal
+from ptcs_control.equivalence import REFERENCE_BACKENDS, Backend, check_equivalence
+
+class CachedTraversal(Traversal):
+    # 同じ update の中では、ジャンクションに最も近い列車を覚えておく
+    def reset(self, control):
+        self._nearest_trains = {}
+
+    def find_nearest_train(self, junction):
+        if junction.id not in self._nearest_trains:
+            self._nearest_trains[junction.id] = junction.find_nearest_train()
+        return self._nearest_trains[junction.id]
+
+candidate = Backend("cached", lambda: FixedBlockControl(traversal=CachedTraversal()))
+failure = check_equivalence(REFERENCE_BACKENDS["fixed_block"], candidate, cases=200)
+assert failure is None, failure
+```
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterator
+
+from . import gogatsusai2024, gogatsusai2024_generated
+from .components.junction import JunctionConnection, PointDirection
+from .control.base import BaseControl
+from .control.fixed_block import FixedBlockControl
+from .control.moving_block import MovingBlockControl
+from .synthetic import MIN_SECTIONS_PER_LOOP, SyntheticLayout, configure
+
+CONTROL_INTERVAL_SECONDS = 0.1  # 1 tick で列車を進める時間 (server.py の `control_loop` の周期)
+MAX_SPEED_FACTOR = 1.5  # 列車が速度指令の何倍まで進むか (空転や滑走、回転数の通知の遅れを模す)
+MAX_SHRINK_RUNS = 500  # 縮小のためにシナリオを実行する回数の上限
+REAL_LAYOUT_RATE = 0.25  # シナリオのうち、実際の路線を使うものの割合
+
+
+@dataclass(frozen=True)
+class Backend:
+    """
+    update と探索の実装。`create_control` は路線が空の control を返す。
+    探索だけを差し替えるなら `FixedBlockControl(traversal=...)` のように作る。
+    """
+
+    name: str
+    create_control: Callable[[], BaseControl]
+
+
+REFERENCE_BACKENDS: dict[str, Backend] = {
+    "fixed_block": Backend("fixed_block", FixedBlockControl),
+    "moving_block": Backend("moving_block", MovingBlockControl),
+}
+
+
+def configure_gogatsusai2024(control: BaseControl) -> None:
+    gogatsusai2024_generated.configure(control)
+    gogatsusai2024.configure(control)
+
+
+# 実際の路線の名前と、空の control に路線を設定する関数
+REAL_LAYOUTS: dict[str, Callable[[BaseControl], None]] = {
+    "gogatsusai2024": configure_gogatsusai2024,
+}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    layout: SyntheticLayout | str  # 自動生成する路線か、実際の路線の名前
+    curve_junctions: tuple[str, ...]  # 最初に CURVE にしておく分岐器
+    ticks: int
+    seed: int  # 列車の進み方を決める乱数の種
+    sensor_fix_rate: float  # 1 tick あたりに、どれかの列車の位置がセンサー位置で修正される確率
+
+    def __str__(self) -> str:
+        layout = self.layout
+        if isinstance(layout, str):
+            return (
+                f"Scenario(layout={layout}, curve_junctions={list(self.curve_junctions)}, "
+                f"ticks={self.ticks}, seed={self.seed}, sensor_fix_rate={self.sensor_fix_rate})"
+            )
+        return (
+            f"Scenario(sections={layout.sections}, loops={layout.loops}, "
+            f"junction_density={layout.junction_density}, crossovers={layout.crossovers}, "
+            f"trains={layout.trains}, stops={layout.stops}, sensor_positions={layout.sensor_positions}, "
+            f"layout_seed={layout.seed}, curve_junctions={list(self.curve_junctions)}, "
+            f"ticks={self.ticks}, seed={self.seed}, sensor_fix_rate={self.sensor_fix_rate})"
+        )
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    tick: int  # 食い違いが見つかった tick (0 は最初の update の後)
+    differences: list[str]
+
+
+@dataclass(frozen=True)
+class Failure:
+    scenario: Scenario  # 縮小した後のシナリオ
+    mismatch: Mismatch
+    original_scenario: Scenario
+
+    def __str__(self) -> str:
+        lines = [
+            f"backends disagree at tick {self.mismatch.tick}",
+            f"  shrunk:   {self.scenario}",
+            f"  original: {self.original_scenario}",
+            *(f"  {difference}" for difference in self.mismatch.differences),
+        ]
+        return "\n".join(lines)
+
+
+def generate_scenario(rng: random.Random, ticks: int) -> Scenario:
+    layout: SyntheticLayout | str
+    if rng.random() < REAL_LAYOUT_RATE:
+        layout = rng.choice(list(REAL_LAYOUTS))
+    else:
+        loops = rng.randint(1, 3)
+        sections = rng.randint(loops * MIN_SECTIONS_PER_LOOP, 120)
+        layout = SyntheticLayout(
+            sections=sections,
+            loops=loops,
+            junction_density=round(rng.uniform(0.0, 0.5), 2),
+            crossovers=rng.randint(0, 4),
+            trains=rng.randint(1, sections // 2),
+            stops=rng.randint(0, 10),
+            sensor_positions=rng.randint(0, 20),
+            seed=rng.getrandbits(32),
+        )
+    turnouts = _find_turnouts(_build(REFERENCE_BACKENDS["fixed_block"], layout))
+    curve_junctions = tuple(junction_id for junction_id in turnouts if rng.random() < 0.3)
+    return Scenario(
+        layout=layout,
+        curve_junctions=curve_junctions,
+        ticks=ticks,
+        seed=rng.getrandbits(32),
+        sensor_fix_rate=rng.choice([0.0, 0.05, 0.2]),
+    )
+
+
+def run_scenario(reference: Backend, candidate: Backend, scenario: Scenario) -> Mismatch | None:
+    """
+    シナリオを 2 つのバックエンドで動かし、最初の食い違いを返す。
+    例外も結果の一部として比べる (両方が同じ例外を出せば、そこで打ち切って一致とみなす)。
+    """
+
+    controls = [_setup(backend, scenario) for backend in [reference, candidate]]
+    rng = random.Random(scenario.seed)
+
+    for tick in range(scenario.ticks + 1):
+        if tick > 0:
+            speed_factors = [rng.uniform(0.0, MAX_SPEED_FACTOR) for _ in controls[0].trains]
+            fix = None
+            if controls[0].sensor_positions and rng.random() < scenario.sensor_fix_rate:
+                fix = (rng.choice(list(controls[0].trains)), rng.choice(list(controls[0].sensor_positions)))
+            outcomes = [_step(control, speed_factors, fix) for control in controls]
+        else:
+            outcomes = [_update(control) for control in controls]
+
+        differences = _compare(outcomes[0], outcomes[1])
+        if differences:
+            return Mismatch(tick, differences)
+        if isinstance(outcomes[0], Exception):
+            return None
+    return None
+
+
+def shrink(reference: Backend, candidate: Backend, scenario: Scenario, mismatch: Mismatch) -> tuple[Scenario, Mismatch]:
+    """
+    食い違いが残る範囲で、シナリオを小さくできなくなるまで小さくする。
+    """
+
+    scenario = replace(scenario, ticks=mismatch.tick)
+    runs = 0
+    shrunk = True
+    while shrunk and runs < MAX_SHRINK_RUNS:
+        shrunk = False
+        for smaller in _smaller_scenarios(scenario):
+            runs += 1
+            try:
+                smaller_mismatch = run_scenario(reference, candidate, smaller)
+            except Exception:
+                # 小さくした路線をどちらかのバックエンドが組み立てられなければ、反例とはみなさない
+                smaller_mismatch = None
+            if smaller_mismatch is not None:
+                scenario = replace(smaller, ticks=smaller_mismatch.tick)
+                mismatch = smaller_mismatch
+                shrunk = True
+                break
+            if runs >= MAX_SHRINK_RUNS:
+                break
+    return scenario, mismatch
+
+
+def check_equivalence(
+    reference: Backend,
+    candidate: Backend,
+    cases: int = 100,
+    ticks: int = 200,
+    seed: int = 0,
+    on_case: Callable[[int, Scenario], None] | None = None,
+) -> Failure | None:
+    """
+    乱数で作った `cases` 個のシナリオで 2 つのバックエンドを比べ、最初に見つかった食い違いを縮小して返す。
+    """
+
+    rng = random.Random(seed)
+    for i in range(cases):
+        scenario = generate_scenario(rng, ticks)
+        if on_case is not None:
+            on_case(i, scenario)
+        mismatch = run_scenario(reference, candidate, scenario)
+        if mismatch is not None:
+            shrunk_scenario, shrunk_mismatch = shrink(reference, candidate, scenario, mismatch)
+            return Failure(shrunk_scenario, shrunk_mismatch, scenario)
+    return None
+
+
+def _build(backend: Backend, layout: SyntheticLayout | str) -> BaseControl:
+    control = backend.create_control()
+    if isinstance(layout, str):
+        REAL_LAYOUTS[layout](control)
+    else:
+        configure(control, layout)
+    control.verify()
+    return control
+
+
+def _find_turnouts(control: BaseControl) -> list[str]:
+    return [
+        junction.id
+        for junction in control.junctions.values()
+        if JunctionConnection.DIVERGING in junction.connected_sections
+    ]
+
+
+def _setup(backend: Backend, scenario: Scenario) -> BaseControl:
+    control = _build(backend, scenario.layout)
+    for junction_id in scenario.curve_junctions:
+        control.junctions[junction_id].set_direction(PointDirection.CURVE)
+    return control
+
+
+def _update(control: BaseControl) -> dict[str, Any] | Exception:
+    try:
+        control.update()
+    except Exception as e:
+        return e
+    return _snapshot(control)
+
+
+def _step(control: BaseControl, speed_factors: list[float], fix: tuple[str, str] | None) -> dict[str, Any] | Exception:
+    """サーバーの制御ループの 1 周期。列車は速度指令の `speed_factors` 倍だけ進んだものとする"""
+
+    try:
+        control.tick()
+        for train, speed_factor in zip(control.trains.values(), speed_factors):
+            delta = train.speed_command * CONTROL_INTERVAL_SECONDS * speed_factor
+            if delta > 0:
+                train.move_forward(delta)
+        if fix is not None:
+            train_id, sensor_position_id = fix
+            control.trains[train_id].fix_position(control.sensor_positions[sensor_position_id])
+    except Exception as e:
+        return e
+    return _update(control)
+
+
+def _snapshot(control: BaseControl) -> dict[str, Any]:
+    """比べる状態。浮動小数点数も完全に一致することを求める"""
+
+    snapshot: dict[str, Any] = {}
+    for train in control.trains.values():
+        position = train.head_position
+        snapshot[f"{train.id}.speed_command"] = train.speed_command
+        snapshot[f"{train.id}.stop"] = train.stop.id if train.stop else None
+        snapshot[f"{train.id}.stop_distance"] = train.stop_distance
+        snapshot[f"{train.id}.departure_time"] = train.departure_time
+        snapshot[f"{train.id}.head_position"] = (position.section.id, position.target_junction.id, position.mileage)
+    for junction in control.junctions.values():
+        snapshot[f"{junction.id}.current_direction"] = junction.current_direction
+        snapshot[f"{junction.id}.manual_direction"] = junction.manual_direction
+    for section in control.sections.values():
+        snapshot[f"{section.id}.is_blocked"] = section.is_blocked
+    return snapshot
+
+
+def _compare(a: dict[str, Any] | Exception, b: dict[str, Any] | Exception) -> list[str]:
+    if isinstance(a, Exception) or isinstance(b, Exception):
+        if type(a) is type(b) and str(a) == str(b):
+            return []
+        return [f"reference: {a!r}", f"candidate: {b!r}"]
+    return [f"{key}: {a[key]!r} != {b.get(key)!r}" for key in a if a[key] != b.get(key)]
+
+
+def _smaller_scenarios(scenario: Scenario) -> Iterator[Scenario]:
+    """縮小の候補。効果の大きそうなものから順に返す"""
+
+    if scenario.ticks > 1:
+        yield replace(scenario, ticks=scenario.ticks // 2)
+    if scenario.sensor_fix_rate > 0:
+        yield replace(scenario, sensor_fix_rate=0.0)
+    layout = scenario.layout
+    if isinstance(layout, SyntheticLayout):
+        for trains in _smaller_counts(layout.trains, minimum=1):
+            yield from _with_layout(scenario, layout, trains=trains)
+        for sections in _smaller_counts(layout.sections, minimum=layout.loops * MIN_SECTIONS_PER_LOOP):
+            yield from _with_layout(scenario, layout, sections=sections)
+        if layout.loops > 1:
+            yield from _with_layout(scenario, layout, loops=layout.loops - 1)
+        for crossovers in _smaller_counts(layout.crossovers, minimum=0):
+            yield from _with_layout(scenario, layout, crossovers=crossovers)
+        if layout.junction_density > 0:
+            yield from _with_layout(scenario, layout, junction_density=0.0)
+            yield from _with_layout(scenario, layout, junction_density=round(layout.junction_density / 2, 2))
+        for stops in _smaller_counts(layout.stops, minimum=0):
+            yield from _with_layout(scenario, layout, stops=stops)
+        for sensor_positions in _smaller_counts(layout.sensor_positions, minimum=0):
+            yield from _with_layout(scenario, layout, sensor_positions=sensor_positions)
+    for i in range(len(scenario.curve_junctions)):
+        curve_junctions = tuple(junction_id for j, junction_id in enumerate(scenario.curve_junctions) if j != i)
+        yield replace(scenario, curve_junctions=curve_junctions)
+
+
+def _with_layout(scenario: Scenario, layout: SyntheticLayout, **changes: Any) -> Iterator[Scenario]:
+    # 路線として成り立たないもの (作れない、組み立てられない、verify を通らない) は候補にしない
+    try:
+        smaller = replace(layout, **changes)
+        if smaller == layout:
+            return
+        smaller_control = _build(REFERENCE_BACKENDS["fixed_block"], smaller)
+    except Exception:
+        return
+    # 小さくした路線にない分岐器は、CURVE にする分岐器から外す
+    turnouts = set(_find_turnouts(smaller_control))
+    curve_junctions = tuple(junction_id for junction_id in scenario.curve_junctions if junction_id in turnouts)
+    yield replace(scenario, layout=smaller, curve_junctions=curve_junctions)
+
+
+def _smaller_counts(count: int, minimum: int) -> list[int]:
+    """`count` より小さい候補を、小さいものから (最小値から、`count` との差を半分ずつにしていく)"""
+
+    counts: list[int] = []
+    delta = count - minimum
+    while delta > 0:
+        counts.append(count - delta)
+        delta //= 2
+    return counts
@@ -6,7 +6,7 @@ from .components.position import DirectedPosition
 from .components.section import SectionConnection
 from .components.sensor_position import SensorPosition
 from .components.train import Train, TrainType
-from .control.base import create_empty_logger
+from .control.base import BaseControl, create_empty_logger
 from .control.fixed_block import FixedBlockControl
 
 
@@ -27,7 +27,7 @@ def create_control(logger: logging.Logger | None = None) -> FixedBlockControl:
     return control
 
 
-def configure(control: FixedBlockControl) -> None:
+def configure(control: BaseControl) -> None:
     t0 = Train(
         id="t0",
         type=TrainType.LimitedExpress,
@@ -0,0 +1,206 @@
+"""
+ベンチマークやテスト、シミュレーションのために、任意の大きさの路線と列車を自動生成する。
+
+路線は `loops` 本の環状線 (本線) からなり、列車は各環状線を SectionConnection.A から B の向きに走る。
+本線の継ぎ目 (ジャンクション) の一部は分岐器に置き換え、次の 2 種類の線路をつなぐ。
+
+- 待避線: 本線から分岐し、同じ本線の少し先で合流する (`junction_density` で数を決める)
+- 渡り線: ある本線から分岐し、別の本線で合流する (`crossovers` で数を決める。本線が 1 本なら同じ本線の先で合流する)
+
+列車・停止目標・センサー位置は本線上に置く。乱数の種 `seed` が同じなら、同じ路線が生成される。
+
+```
+from ptcs_control.synthetic import SyntheticLayout, create_control
+
+control = create_control(SyntheticLayout(sections=1000, loops=4, trains=50))
+```
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+from dataclasses import dataclass
+
+from .components.junction import Junction, JunctionConnection
+from .components.position import DirectedPosition
+from .components.section import Section, SectionConnection
+from .components.sensor_position import SensorPosition
+from .components.stop import Stop
+from .components.train import Train
+from .control.base import BaseControl, create_empty_logger
+from .control.fixed_block import FixedBlockControl
+
+SECTION_LENGTHS = [40.0, 60.0, 80.0, 100.0, 120.0, 140.0]  # 実際の路線 (gogatsusai2024) にあるセクションの長さ
+MIN_SECTIONS_PER_LOOP = 3
+
+TRAIN_LENGTH = 40.0
+TRAIN_MIN_INPUT = 180
+TRAIN_MAX_INPUT = 210
+TRAIN_MAX_SPEED = 40.0
+TRAIN_DELTA_PER_MOTOR_ROTATION = 0.4241
+
+
+@dataclass(frozen=True)
+class SyntheticLayout:
+    """自動生成する路線の大きさ"""
+
+    sections: int = 200  # 本線のセクションの数 (待避線・渡り線のセクションは含まない)
+    loops: int = 2  # 環状線の数
+    junction_density: float = 0.1  # 本線の継ぎ目のうち、待避線の分岐・合流になるものの割合
+    crossovers: int = 2  # 渡り線の数
+    trains: int = 10
+    stops: int = 20
+    sensor_positions: int = 100
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        assert self.loops >= 1
+        assert self.sections >= self.loops * MIN_SECTIONS_PER_LOOP, "each loop needs at least 3 sections"
+        assert 0.0 <= self.junction_density <= 1.0
+        assert self.trains * 2 <= self.sections, "trains need an empty section between them"
+
+
+def create_control(layout: SyntheticLayout | None = None, logger: logging.Logger | None = None) -> FixedBlockControl:
+    if logger is None:
+        logger = create_empty_logger()
+
+    control = FixedBlockControl(logger=logger)
+    configure(control, layout or SyntheticLayout())
+    control.verify()
+
+    return control
+
+
+def configure(control: BaseControl, layout: SyntheticLayout) -> None:
+    rng = random.Random(layout.seed)
+
+    # 本線のセクションを環状線に分ける
+    loops: list[list[Section]] = []
+    section_count = 0
+    for loop_index in range(layout.loops):
+        size = layout.sections // layout.loops + (1 if loop_index < layout.sections % layout.loops else 0)
+        loop = [
+            Section(id=f"S{section_count + i:04d}", length=rng.choice(SECTION_LENGTHS), block_id=None)
+            for i in range(size)
+        ]
+        section_count += size
+        loops.append(loop)
+        for section in loop:
+            control.add_section(section)
+
+    # 本線の継ぎ目 (i 番目のセクションの B 端と i + 1 番目のセクションの A 端の間) を、
+    # 分岐点・合流点・ただの継ぎ目のいずれにするかを決める
+    diverging: dict[tuple[int, int], Section] = {}  # (環状線, 継ぎ目) -> 分岐していくセクション
+    converging: dict[tuple[int, int], Section] = {}  # (環状線, 継ぎ目) -> 合流してくるセクション
+    free_joints = [(loop_index, i) for loop_index, loop in enumerate(loops) for i in range(len(loop))]
+    rng.shuffle(free_joints)
+    used_joints: set[tuple[int, int]] = set()
+    branch_count = 0
+
+    def add_branch(from_joint: tuple[int, int], to_joint: tuple[int, int]) -> None:
+        nonlocal branch_count
+        section = Section(id=f"X{branch_count:04d}", length=rng.choice(SECTION_LENGTHS), block_id=None)
+        branch_count += 1
+        control.add_section(section)
+        diverging[from_joint] = section
+        converging[to_joint] = section
+        used_joints.add(from_joint)
+        used_joints.add(to_joint)
+
+    def find_free_joint(loop_index: int, after: int) -> tuple[int, int] | None:
+        """環状線 `loop_index` の継ぎ目 `after` より先で、最も近い空いている継ぎ目"""
+        loop_size = len(loops[loop_index])
+        for offset in range(1, loop_size):
+            joint = (loop_index, (after + offset) % loop_size)
+            if joint not in used_joints:
+                return joint
+        return None
+
+    siding_count = int(layout.junction_density * layout.sections / 2)
+    for _ in range(siding_count):
+        from_joint = next((joint for joint in free_joints if joint not in used_joints), None)
+        if from_joint is None:
+            break
+        used_joints.add(from_joint)
+        to_joint = find_free_joint(from_joint[0], from_joint[1] + rng.randrange(2))
+        if to_joint is None:
+            used_joints.discard(from_joint)
+            break
+        add_branch(from_joint, to_joint)
+
+    for _ in range(layout.crossovers):
+        from_joint = next((joint for joint in free_joints if joint not in used_joints), None)
+        if from_joint is None:
+            break
+        used_joints.add(from_joint)
+        to_loop = (from_joint[0] + 1 + rng.randrange(max(layout.loops - 1, 1))) % layout.loops
+        to_joint = find_free_joint(to_loop, rng.randrange(len(loops[to_loop])))
+        if to_joint is None:
+            used_joints.discard(from_joint)
+            break
+        add_branch(from_joint, to_joint)
+
+    # 継ぎ目ごとにジャンクションを作ってつなぐ
+    joint_count = 0
+    for loop_index, loop in enumerate(loops):
+        for i, section in enumerate(loop):
+            next_section = loop[(i + 1) % len(loop)]
+            joint = (loop_index, i)
+            if joint in diverging:
+                junction = Junction(id=f"j{joint_count:04d}")
+                control.add_junction(junction)
+                control.connect(section, SectionConnection.B, junction, JunctionConnection.CONVERGING)
+                control.connect(next_section, SectionConnection.A, junction, JunctionConnection.THROUGH)
+                control.connect(diverging[joint], SectionConnection.A, junction, JunctionConnection.DIVERGING)
+            elif joint in converging:
+                junction = Junction(id=f"j{joint_count:04d}")
+                control.add_junction(junction)
+                control.connect(section, SectionConnection.B, junction, JunctionConnection.THROUGH)
+                control.connect(converging[joint], SectionConnection.B, junction, JunctionConnection.DIVERGING)
+                control.connect(next_section, SectionConnection.A, junction, JunctionConnection.CONVERGING)
+            else:
+                junction = Junction(id=f"c{joint_count:04d}")
+                control.add_junction(junction)
+                control.connect(section, SectionConnection.B, junction, JunctionConnection.CONVERGING)
+                control.connect(next_section, SectionConnection.A, junction, JunctionConnection.THROUGH)
+            joint_count += 1
+
+    main_sections = [section for loop in loops for section in loop]
+
+    def forward_position(section: Section, mileage: float) -> DirectedPosition:
+        return DirectedPosition(
+            section=section, target_junction=section.connected_junctions[SectionConnection.B], mileage=mileage
+        )
+
+    # 列車は本線上に、間に 1 つ以上のセクションを空けて等間隔に置く
+    spacing = len(main_sections) // max(layout.trains, 1)
+    for i in range(layout.trains):
+        section = main_sections[i * spacing]
+        control.add_train(
+            Train(
+                id=f"t{i:04d}",
+                min_input=TRAIN_MIN_INPUT,
+                max_input=TRAIN_MAX_INPUT,
+                max_speed=TRAIN_MAX_SPEED,
+                length=TRAIN_LENGTH,
+                delta_per_motor_rotation=TRAIN_DELTA_PER_MOTOR_ROTATION,
+                head_position=forward_position(section, section.length),
+            )
+        )
+
+    for i, section in enumerate(rng.sample(main_sections, min(layout.stops, len(main_sections)))):
+        control.add_stop(Stop(id=f"stop_{i:04d}", position=forward_position(section, section.length / 2)))
+
+    for i in range(layout.sensor_positions):
+        section = rng.choice(main_sections)
+        mileage = round(rng.uniform(0.0, section.length), 1)
+        control.add_sensor_position(
+            SensorPosition(
+                id=f"P{i:04d}",
+                uid=f"{rng.getrandbits(32):08x}",
+                section=section,
+                mileage=mileage,
+                target_junction=section.connected_junctions[SectionConnection.B],
+            )
+        )
@@ -1,23 +1,291 @@
+import asyncio
+import base64
+from collections.abc import AsyncIterator
+from typing import Annotated, Literal
+
 import pydantic
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 
 from ptcs_control.components.junction import PointDirection
 from ptcs_control.control.base import BaseControl
 
-from .types.state import RailwayState, get_state_from_control
+from .binary import MEDIA_TYPE as BINARY_MEDIA_TYPE
+from .binary import is_binary_accepted
+from .compression import MIN_COMPRESS_SIZE, parse_accept_encoding
+from .history import StateHistory
+from .recording import BridgeInputs
+from .serializer import StateQuery, dump_json
+from .snapshot import StateCache, StateSnapshot, is_etag_matched
+from .stream import StateBroadcaster, StateMessage
+from .types.state import (
+    PartialRailwayState,
+    RailwayDynamicState,
+    RailwayHistory,
+    RailwayState,
+    RailwayStateDelta,
+    RailwayTopology,
+)
 
 api_router = APIRouter()
 
+# `/state/ws` と `/state/sse` で送るメッセージの形式
+StreamFormat = Literal["json", "binary"]
+
+
+def update_control(request: Request) -> int:
+    """
+    状態に変化が起こった後に control を再計算し、状態のバージョンを進める。
+
+    control・ジャーナル・状態のキャッシュは、制御ループと同じイベントループ上でしか触らない。
+    これを呼ぶエンドポイントは `async def` にすること (`def` だとスレッドプールで実行され、tick と競合する)。
+    """
+    inputs: BridgeInputs = request.app.state.inputs
+    state_cache: StateCache = request.app.state.state_cache
+    inputs.update()
+    return state_cache.publish()
+
 
 @api_router.get("/hello")
 def hello() -> dict:
     return {"message": "hello"}
 
 
-@api_router.get("/state")
-def get_state(request: Request) -> RailwayState:
-    control: BaseControl = request.app.state.control
-    return get_state_from_control(control)
+def encoded_response(
+    request: Request,
+    content: StateSnapshot | StateMessage,
+    *,
+    media_type: str,
+    headers: dict[str, str],
+    vary: tuple[str, ...],
+) -> Response:
+    """
+    JSON などに変換済みの状態を返す。
+    大きなものは、クライアントが受け入れるなら gzip で圧縮して返す。圧縮したものはバージョンごとに使い回す。
+    """
+    if len(content.body) >= MIN_COMPRESS_SIZE:
+        vary = (*vary, "Accept-Encoding")
+        if "gzip" in parse_accept_encoding(request.headers.get("Accept-Encoding")):
+            headers = {**headers, "Content-Encoding": "gzip", "Vary": ", ".join(vary)}
+            return Response(content=content.gzip_body, media_type=media_type, headers=headers)
+    if vary:
+        headers = {**headers, "Vary": ", ".join(vary)}
+    return Response(content=content.body, media_type=media_type, headers=headers)
+
+
+def snapshot_response(
+    request: Request,
+    snapshot: StateSnapshot,
+    *,
+    cache_control: str = "no-cache",
+    media_type: str = "application/json",
+    vary: tuple[str, ...] = (),
+) -> Response:
+    """
+    JSON などに変換済みの状態を返す。
+    `If-None-Match` が ETag に一致すれば 304 を返す。
+    """
+    headers = {"ETag": snapshot.etag, "Cache-Control": cache_control}
+    if is_etag_matched(request.headers.get("If-None-Match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return encoded_response(request, snapshot, media_type=media_type, headers=headers, vary=vary)
+
+
+@api_router.get(
+    "/state",
+    response_model=RailwayState | PartialRailwayState | RailwayStateDelta,
+    responses={200: {"content": {BINARY_MEDIA_TYPE: {}}}, 304: {"description": "Not Modified"}},
+)
+async def get_state(
+    request: Request,
+    since: int | None = None,
+    include: str | None = None,
+    junctions: str | None = None,
+    sections: str | None = None,
+    trains: str | None = None,
+    stops: str | None = None,
+    stations: str | None = None,
+    sensor_positions: str | None = None,
+    obstacles: str | None = None,
+) -> Response:
+    """
+    tick ごとに一度だけ JSON に変換された状態を返す。
+    `If-None-Match` が ETag に一致すれば 304 を返す。
+
+    `include=trains,junctions` のように指定すると、指定した種類のコンポーネントのみを返す。
+    `trains=t1,t2` のように指定すると、その種類のコンポーネントを ID で絞り込む。
+    選ばれなかったコンポーネントは計算もしない。`since` とは同時に使えない。
+
+    `since` を指定した場合は、状態のバージョンが `since` から進むまで待ち (ロングポーリング)、
+    `since` から変化したコンポーネントのみを `RailwayStateDelta` として返す。
+    一定時間内に変化がなければ、何も含まない差分を返す。
+    `Accept` にバイナリ形式 (`application/x-ptcs-state`) が含まれていれば、差分をバイナリ形式で返す。
+    """
+    ids = {
+        "junctions": junctions,
+        "sections": sections,
+        "trains": trains,
+        "stops": stops,
+        "stations": stations,
+        "sensor_positions": sensor_positions,
+        "obstacles": obstacles,
+    }
+    is_query = include is not None or any(value is not None for value in ids.values())
+
+    if since is not None:
+        if is_query:
+            raise HTTPException(status_code=422, detail="since cannot be combined with include or id filters")
+        state_broadcaster: StateBroadcaster = request.app.state.state_broadcaster
+        binary = is_binary_accepted(request.headers.get("Accept"))
+        await state_broadcaster.wait_for_update(since)
+        message = state_broadcaster.get_message(since, binary=binary)
+        return encoded_response(
+            request,
+            message,
+            media_type=BINARY_MEDIA_TYPE if binary else "application/json",
+            headers={"Cache-Control": "no-store"},
+            vary=("Accept",),
+        )
+
+    state_cache: StateCache = request.app.state.state_cache
+    if not is_query:
+        return snapshot_response(request, state_cache.get())
+    try:
+        query = StateQuery.parse(include, ids)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return snapshot_response(request, state_cache.get_query(query))
+
+
+@api_router.get(
+    "/state/dynamic",
+    response_model=RailwayDynamicState,
+    responses={200: {"content": {BINARY_MEDIA_TYPE: {}}}, 304: {"description": "Not Modified"}},
+)
+async def get_dynamic_state(request: Request) -> Response:
+    """
+    実行中に変化する状態のみを返す。
+    路線の構成は `/topology` から一度だけ取得すること。
+    `Accept` にバイナリ形式 (`application/x-ptcs-state`) が含まれていれば、バイナリ形式で返す。
+    """
+    state_cache: StateCache = request.app.state.state_cache
+    if is_binary_accepted(request.headers.get("Accept")):
+        return snapshot_response(
+            request, state_cache.get_dynamic_binary(), media_type=BINARY_MEDIA_TYPE, vary=("Accept",)
+        )
+    return snapshot_response(request, state_cache.get_dynamic(), vary=("Accept",))
+
+
+@api_router.websocket("/state/ws")
+async def stream_state(websocket: WebSocket, format: StreamFormat = "json") -> None:
+    """
+    接続直後に実行中に変化する状態のスナップショットを送り、
+    以降は tick ごとに変化したコンポーネントのみを `RailwayStateDelta` として送る。
+    `format=binary` を指定すると、バイナリ形式 (`application/x-ptcs-state`) のメッセージをバイナリフレームで送る。
+    """
+    state_broadcaster: StateBroadcaster = websocket.app.state.state_broadcaster
+    await websocket.accept()
+    binary = format == "binary"
+    subscriber = state_broadcaster.subscribe(binary=binary)
+
+    async def send_messages() -> None:
+        while True:
+            message = await subscriber.get()
+            if binary:
+                await websocket.send_bytes(message.body)
+            else:
+                await websocket.send_text(message.text)
+
+    async def wait_for_disconnect() -> None:
+        # クライアントからのメッセージは使わないが、読み続けないと切断に次の送信まで気づけない
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # どちらかが終われば (切断されたか、送信に失敗すれば) 接続は終わり
+    tasks = {asyncio.create_task(send_messages()), asyncio.create_task(wait_for_disconnect())}
+    try:
+        done, _pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # 切断による例外 (WebSocketDisconnect, RuntimeError, ConnectionClosed など) はここで受け取って捨てる
+            task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        state_broadcaster.unsubscribe(subscriber)
+
+
+@api_router.get("/state/sse", response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def stream_state_sse(request: Request, format: StreamFormat = "json") -> StreamingResponse:
+    """
+    `/state/ws` と同じメッセージを Server-Sent Events で送る。
+    WebSocket が使えない環境向け。
+    `format=binary` を指定すると、バイナリ形式のメッセージを Base64 に変換して送る (イベントはテキストしか送れないため)。
+    """
+    state_broadcaster: StateBroadcaster = request.app.state.state_broadcaster
+    binary = format == "binary"
+
+    async def generate() -> AsyncIterator[bytes]:
+        subscriber = state_broadcaster.subscribe(binary=binary)
+        try:
+            while True:
+                message = await subscriber.get()
+                data = base64.b64encode(message.body) if binary else message.body
+                yield b"id: %d\ndata: %s\n\n" % (message.version, data)
+        finally:
+            state_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_router.get("/topology", response_model=RailwayTopology, responses={304: {"description": "Not Modified"}})
+async def get_topology(request: Request) -> Response:
+    """
+    路線の構成を返す。ETag は `layout_hash` になる。
+    """
+    state_cache: StateCache = request.app.state.state_cache
+    return snapshot_response(request, state_cache.get_topology())
+
+
+@api_router.get(
+    "/topology/{layout_hash}", response_model=RailwayTopology, responses={304: {"description": "Not Modified"}}
+)
+async def get_topology_by_hash(layout_hash: str, request: Request) -> Response:
+    """
+    `layout_hash` に対応する路線の構成を返す。
+    内容は `layout_hash` ごとに変わらないので、無期限にキャッシュしてよい。
+    """
+    state_cache: StateCache = request.app.state.state_cache
+    if layout_hash != state_cache.layout_hash:
+        raise HTTPException(status_code=404, detail=f"layout {layout_hash} not found")
+    return snapshot_response(request, state_cache.get_topology(), cache_control="public, max-age=31536000, immutable")
+
+
+@api_router.get("/history", response_model=RailwayHistory)
+async def get_history(
+    request: Request,
+    from_time: Annotated[float | None, Query(alias="from")] = None,
+    to_time: Annotated[float | None, Query(alias="to")] = None,
+    step: Annotated[float | None, Query(gt=0)] = None,
+) -> Response:
+    """
+    時刻 (UNIX 時間、秒) が `from` から `to` までの、実行中に変化する状態の履歴を返す。
+    `step` を指定すると、`step` 秒ごとに間引いて返す。
+    サーバーが保持しているのは直近の一定時間分のみで、それより前の記録は返さない。
+    """
+    state_cache: StateCache = request.app.state.state_cache
+    state_history: StateHistory = request.app.state.state_history
+    body = dump_json(state_history.query(from_time, to_time, step))
+    return encoded_response(
+        request,
+        StateMessage(version=state_cache.version, body=body),
+        media_type="application/json",
+        headers={"Cache-Control": "no-store"},
+        vary=(),
+    )
 
 
 class MoveTrainParams(pydantic.BaseModel):
@@ -25,15 +293,14 @@ class MoveTrainParams(pydantic.BaseModel):
 
 
 @api_router.post("/state/trains/{train_id}/move")
-def move_train(train_id: str, params: MoveTrainParams, request: Request) -> None:
+async def move_train(train_id: str, params: MoveTrainParams, request: Request) -> None:
     """
     指定された列車を距離 delta 分だけ進める。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    train = control.trains[train_id]
-    train.move_forward(params.delta)
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.move_train(train_id, params.delta)
+    update_control(request)
 
 
 class PutTrainParams(pydantic.BaseModel):
@@ -41,16 +308,14 @@ class PutTrainParams(pydantic.BaseModel):
 
 
 @api_router.post("/state/trains/{train_id}/put")
-def put_train(train_id: str, params: PutTrainParams, request: Request) -> None:
+async def put_train(train_id: str, params: PutTrainParams, request: Request) -> None:
     """
     指定された列車の位置を修正する。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    train = control.trains[train_id]
-    position = control.sensor_positions[params.position_id]
-    train.fix_position(position)
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.put_train(train_id, params.position_id)
+    update_control(request)
 
 
 class UpdateJunctionParams(pydantic.BaseModel):
@@ -58,60 +323,186 @@ class UpdateJunctionParams(pydantic.BaseModel):
 
 
 @api_router.post("/state/junctions/{junction_id}/update")
-def update_junction(junction_id: str, params: UpdateJunctionParams, request: Request) -> None:
+async def update_junction(junction_id: str, params: UpdateJunctionParams, request: Request) -> None:
     """
     指定された分岐点の方向を更新する。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    junction = control.junctions[junction_id]
-    junction.manual_direction = params.direction
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.set_manual_direction(junction_id, params.direction)
+    update_control(request)
 
 
 @api_router.post("/state/obstacles/{obstacle_id}/detect")
-def detect_obstacle(obstacle_id: str, request: Request) -> None:
+async def detect_obstacle(obstacle_id: str, request: Request) -> None:
     """
     指定された障害物を発生させる。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    obstacle = control.obstacles[obstacle_id]
-    obstacle.is_detected = True
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.set_obstacle_detected(obstacle_id, True)
+    update_control(request)
 
 
 @api_router.post("/state/obstacles/{obstacle_id}/clear")
-def clear_obstacle(obstacle_id: str, request: Request) -> None:
+async def clear_obstacle(obstacle_id: str, request: Request) -> None:
     """
     指定された障害物を撤去する。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    obstacle = control.obstacles[obstacle_id]
-    obstacle.is_detected = False
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.set_obstacle_detected(obstacle_id, False)
+    update_control(request)
 
 
 @api_router.post("/state/sections/{section_id}/block")
-def block_section(section_id: str, request: Request) -> None:
+async def block_section(section_id: str, request: Request) -> None:
     """
     指定された区間に障害物を発生させる。
     デバッグ用。
     """
-    control: BaseControl = request.app.state.control
-    section = control.sections[section_id]
-    section.block()
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.set_section_blocked(section_id, True)
+    update_control(request)
 
 
 @api_router.post("/state/sections/{section_id}/unblock")
-def unblock_section(section_id: str, request: Request) -> None:
+async def unblock_section(section_id: str, request: Request) -> None:
     """
     指定された区間の障害物を取り除く。
     デバッグ用。
     """
+    inputs: BridgeInputs = request.app.state.inputs
+    inputs.set_section_blocked(section_id, False)
+    update_control(request)
+
+
+class MoveTrainCommand(pydantic.BaseModel):
+    type: Literal["move_train"]
+    train_id: str
+    delta: float
+
+
+class PutTrainCommand(pydantic.BaseModel):
+    type: Literal["put_train"]
+    train_id: str
+    position_id: str
+
+
+class UpdateJunctionCommand(pydantic.BaseModel):
+    type: Literal["update_junction"]
+    junction_id: str
+    direction: PointDirection
+
+
+class DetectObstacleCommand(pydantic.BaseModel):
+    type: Literal["detect_obstacle"]
+    obstacle_id: str
+
+
+class ClearObstacleCommand(pydantic.BaseModel):
+    type: Literal["clear_obstacle"]
+    obstacle_id: str
+
+
+class BlockSectionCommand(pydantic.BaseModel):
+    type: Literal["block_section"]
+    section_id: str
+
+
+class UnblockSectionCommand(pydantic.BaseModel):
+    type: Literal["unblock_section"]
+    section_id: str
+
+
+Command = Annotated[
+    MoveTrainCommand
+    | PutTrainCommand
+    | UpdateJunctionCommand
+    | DetectObstacleCommand
+    | ClearObstacleCommand
+    | BlockSectionCommand
+    | UnblockSectionCommand,
+    pydantic.Field(discriminator="type"),
+]
+
+
+class BatchCommandsParams(pydantic.BaseModel):
+    commands: list[Command]
+
+
+class BatchCommandsResult(pydantic.BaseModel):
+    version: int
+
+
+def verify_command(control: BaseControl, command: Command) -> None:
+    """
+    コマンドが参照する ID が存在するかを確認する。
+    存在しなければ 404 を返す。
+    """
+
+    missing: str | None = None
+
+    match command:
+        case MoveTrainCommand(train_id=train_id):
+            if train_id not in control.trains:
+                missing = f"train {train_id}"
+        case PutTrainCommand(train_id=train_id, position_id=position_id):
+            if train_id not in control.trains:
+                missing = f"train {train_id}"
+            elif position_id not in control.sensor_positions:
+                missing = f"sensor position {position_id}"
+        case UpdateJunctionCommand(junction_id=junction_id):
+            if junction_id not in control.junctions:
+                missing = f"junction {junction_id}"
+        case DetectObstacleCommand(obstacle_id=obstacle_id) | ClearObstacleCommand(obstacle_id=obstacle_id):
+            if obstacle_id not in control.obstacles:
+                missing = f"obstacle {obstacle_id}"
+        case BlockSectionCommand(section_id=section_id) | UnblockSectionCommand(section_id=section_id):
+            if section_id not in control.sections:
+                missing = f"section {section_id}"
+
+    if missing is not None:
+        raise HTTPException(status_code=404, detail=f"{missing} not found")
+
+
+def apply_command(inputs: BridgeInputs, command: Command) -> None:
+    """
+    コマンドを control に適用する。再計算は行わない。
+    """
+
+    match command:
+        case MoveTrainCommand(train_id=train_id, delta=delta):
+            inputs.move_train(train_id, delta)
+        case PutTrainCommand(train_id=train_id, position_id=position_id):
+            inputs.put_train(train_id, position_id)
+        case UpdateJunctionCommand(junction_id=junction_id, direction=direction):
+            inputs.set_manual_direction(junction_id, direction)
+        case DetectObstacleCommand(obstacle_id=obstacle_id):
+            inputs.set_obstacle_detected(obstacle_id, True)
+        case ClearObstacleCommand(obstacle_id=obstacle_id):
+            inputs.set_obstacle_detected(obstacle_id, False)
+        case BlockSectionCommand(section_id=section_id):
+            inputs.set_section_blocked(section_id, True)
+        case UnblockSectionCommand(section_id=section_id):
+            inputs.set_section_blocked(section_id, False)
+
+
+@api_router.post("/commands/batch")
+async def batch_commands(params: BatchCommandsParams, request: Request) -> BatchCommandsResult:
+    """
+    複数のコマンドをまとめて適用し、最後に一度だけ再計算する。
+    ひとつでも存在しない ID を参照していれば、何も適用せずに 404 を返す。
+    制御ループと同じイベントループ上で実行されるため、途中で tick が割り込むことはない。
+    """
     control: BaseControl = request.app.state.control
-    section = control.sections[section_id]
-    section.unblock()
-    control.update()
+    inputs: BridgeInputs = request.app.state.inputs
+
+    for command in params.commands:
+        verify_command(control, command)
+
+    for command in params.commands:
+        apply_command(inputs, command)
+
+    version = update_control(request)
+    return BatchCommandsResult(version=version)
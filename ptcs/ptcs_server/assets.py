@@ -0,0 +1,141 @@
+"""
+UI の静的ファイル (ptcs_ui/dist) を起動時にメモリに読み込んで配信する。
+
+圧縮したものも起動時に一度だけ作っておき、リクエストごとにディスクを読んだり圧縮したりしない。
+ビルド時に作られた `.br` や `.gz` のファイルがあれば、それも配信する。
+"""
+
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from .compression import MIN_COMPRESS_SIZE, compress_gzip, parse_accept_encoding
+from .snapshot import is_etag_matched
+
+# ファイル名にハッシュが含まれるので、内容が変わることのないディレクトリ (vite の出力先)
+IMMUTABLE_DIRECTORY = "assets/"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+)
+
+# 配信するエンコーディングと、ビルド時に作られたファイルの拡張子 (優先度の高い順)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+@dataclass(frozen=True)
+class StaticAsset:
+    """メモリ上に読み込んだ静的ファイルひとつ分"""
+
+    media_type: str
+    etag: str
+    cache_control: str
+    body: bytes
+    encoded_bodies: dict[str, bytes]  # エンコーディング → 圧縮されたもの
+
+
+def load_assets(directory: str) -> dict[str, StaticAsset]:
+    """
+    `directory` 以下のファイルを読み込み、URL のパス (`/` 始まり) から `StaticAsset` への対応を作る。
+    `directory` や `index.html` が無ければ (UI をビルドしていなければ)、すべて 404 になるのを避けて RuntimeError を投げる。
+    """
+    if not os.path.isdir(directory):
+        raise RuntimeError(f"Directory '{directory}' does not exist (build the UI with `npm run ui:build`)")
+    assets = {}
+    for root, _dirs, files in os.walk(directory):
+        for file in files:
+            if any(file.endswith(suffix) for _, suffix in ENCODINGS):
+                continue
+            path = os.path.join(root, file)
+            relative_path = os.path.relpath(path, directory).replace(os.sep, "/")
+
+            with open(path, "rb") as f:
+                body = f.read()
+            media_type = mimetypes.guess_type(file)[0] or "application/octet-stream"
+
+            encoded_bodies = {}
+            for encoding, suffix in ENCODINGS:
+                if os.path.exists(path + suffix):
+                    with open(path + suffix, "rb") as f:
+                        encoded_bodies[encoding] = f.read()
+            if "gzip" not in encoded_bodies and is_compressible(media_type, len(body)):
+                gzip_body = compress_gzip(body, compresslevel=9)
+                if len(gzip_body) < len(body):
+                    encoded_bodies["gzip"] = gzip_body
+
+            assets["/" + relative_path] = StaticAsset(
+                media_type=media_type,
+                etag=f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+                cache_control=(
+                    IMMUTABLE_CACHE_CONTROL if relative_path.startswith(IMMUTABLE_DIRECTORY) else DEFAULT_CACHE_CONTROL
+                ),
+                body=body,
+                encoded_bodies=encoded_bodies,
+            )
+    if "/index.html" not in assets:
+        raise RuntimeError(f"'{directory}' has no index.html (build the UI with `npm run ui:build`)")
+    return assets
+
+
+def is_compressible(media_type: str, size: int) -> bool:
+    return size >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+
+
+class StaticAssets:
+    """
+    メモリ上に読み込んだ静的ファイルを配信する ASGI アプリケーション。
+    `StaticFiles(directory=..., html=True)` の代わりに `app.mount()` で使う。
+    """
+
+    assets: dict[str, StaticAsset]
+
+    def __init__(self, directory: str) -> None:
+        self.assets = load_assets(directory)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        request = Request(scope, receive)
+        response = self.get_response(request)
+        await response(scope, receive, send)
+
+    def get_response(self, request: Request) -> Response:
+        if request.method not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+
+        path = request.scope["path"]
+        if path == "" or path.endswith("/"):
+            path += "index.html"
+        asset = self.assets.get(path)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        headers = {"ETag": asset.etag, "Cache-Control": asset.cache_control}
+        if asset.encoded_bodies:
+            headers["Vary"] = "Accept-Encoding"
+        if is_etag_matched(request.headers.get("If-None-Match"), asset.etag):
+            return Response(status_code=304, headers=headers)
+
+        body = asset.body
+        accepted_encodings = parse_accept_encoding(request.headers.get("Accept-Encoding"))
+        for encoding, _ in ENCODINGS:
+            if encoding in asset.encoded_bodies and encoding in accepted_encodings:
+                body = asset.encoded_bodies[encoding]
+                headers["Content-Encoding"] = encoding
+                break
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(media_type=asset.media_type, headers=headers)
+        return Response(content=body, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,194 @@
+"""
+実行中に変化する状態を、固定長のバイナリ形式に変換する。
+
+JSON ではコンポーネントごとにキーや ID の文字列が繰り返されるので、
+列車や区間が多いとデータ量が大きくなる。
+バイナリ形式では、各コンポーネントを `RailwayTopology.index` のインデックスで参照する。
+
+すべてリトルエンディアン。`since` が無い場合は -1、インデックスが無い場合は 0xFFFF になる。
+
+```
+header   : magic "PTCS", format (u8), type (u8), version (u32), since (i32), current_time (i32), layout_hash (16 bytes),
+           timestamp (f64)
+junctions: count (u16), [index (u16), manual_direction (u8), current_direction (u8), direction_command (u8)] * count
+sections : count (u16), [index (u16), is_blocked (u8)] * count
+trains   : count (u16), [TRAIN, covered_section_index (u16) * covered_count,
+                         body_point_count (u16), [x (f32), y (f32)] * body_point_count] * count
+obstacles: count (u16), [index (u16), is_detected (u8)] * count
+
+TRAIN    : index (u16), flags (u8),
+           head_position (section_index (u16), target_junction_index (u16), mileage (f32)),
+           tail_position (section_index (u16), target_junction_index (u16), mileage (f32)),
+           stop_index (u16), stop_distance (f32), departure_time (i32), speed_command (f32),
+           voltage_mV (i32), manual_speed (f32), next_junction_distance (f32), covered_count (u16)
+```
+
+方向は `PointDirection` の定義順 (straight = 0, curve = 1) で、`manual_direction` が無い場合は 0xFF になる。
+`flags` は `departure_time` があれば 1 ビット目、`manual_speed` があれば 2 ビット目が立つ。
+"""
+
+from __future__ import annotations
+
+import struct
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Literal
+
+from ptcs_control.components.junction import PointDirection
+from ptcs_control.control.base import BaseControl
+
+from .serializer import JSONObject
+
+MEDIA_TYPE = "application/x-ptcs-state"
+
+FORMAT_VERSION = 5
+MAGIC = b"PTCS"
+NO_INDEX = 0xFFFF
+NO_DIRECTION = 0xFF
+
+FLAG_DEPARTURE_TIME = 1 << 0
+FLAG_MANUAL_SPEED = 1 << 1
+
+HEADER = struct.Struct("<4sBBIii16sd")
+COUNT = struct.Struct("<H")
+JUNCTION = struct.Struct("<HBBB")
+SECTION = struct.Struct("<HB")
+TRAIN = struct.Struct("<HBHHfHHfHfififfH")
+OBSTACLE = struct.Struct("<HB")
+
+DIRECTIONS = [direction.value for direction in PointDirection]
+
+
+@dataclass(frozen=True)
+class StateIndex:
+    """ID からインデックスへの対応。`RailwayTopology.index` と同じ順序になる。"""
+
+    junctions: dict[str, int]
+    sections: dict[str, int]
+    trains: dict[str, int]
+    stops: dict[str, int]
+    obstacles: dict[str, int]
+
+    @staticmethod
+    def from_control(control: BaseControl) -> StateIndex:
+        return StateIndex(
+            junctions={id: i for i, id in enumerate(control.junctions)},
+            sections={id: i for i, id in enumerate(control.sections)},
+            trains={id: i for i, id in enumerate(control.trains)},
+            stops={id: i for i, id in enumerate(control.stops)},
+            obstacles={id: i for i, id in enumerate(control.obstacles)},
+        )
+
+
+def is_binary_accepted(accept: str | None) -> bool:
+    """
+    `Accept` ヘッダーがバイナリ形式を求めているかを判定する。
+    """
+    if accept is None:
+        return False
+    return any(candidate.split(";")[0].strip() == MEDIA_TYPE for candidate in accept.split(","))
+
+
+def encode_state_message(
+    index: StateIndex,
+    *,
+    type: Literal["snapshot", "delta"],
+    version: int,
+    since: int | None,
+    layout_hash: str,
+    timestamp: float,
+    current_time: int,
+    junctions: Mapping[str, JSONObject],
+    sections: Mapping[str, JSONObject],
+    trains: Mapping[str, JSONObject],
+    obstacles: Mapping[str, JSONObject],
+) -> bytes:
+    """
+    状態 (`RailwayDynamicState`) や差分 (`RailwayStateDelta`) をバイナリ形式に変換する。
+    各コンポーネントは serializer.py で作った dict で渡す。
+    """
+    parts = [
+        HEADER.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            0 if type == "snapshot" else 1,
+            version,
+            -1 if since is None else since,
+            current_time,
+            layout_hash.encode(),
+            timestamp,
+        )
+    ]
+
+    parts.append(COUNT.pack(len(junctions)))
+    for junction in junctions.values():
+        parts.append(
+            JUNCTION.pack(
+                index.junctions[junction["id"]],
+                _encode_direction(junction["manual_direction"]),
+                _encode_direction(junction["current_direction"]),
+                _encode_direction(junction["direction_command"]),
+            )
+        )
+
+    parts.append(COUNT.pack(len(sections)))
+    for section in sections.values():
+        parts.append(SECTION.pack(index.sections[section["id"]], section["is_blocked"]))
+
+    parts.append(COUNT.pack(len(trains)))
+    for train in trains.values():
+        flags = 0
+        if train["departure_time"] is not None:
+            flags |= FLAG_DEPARTURE_TIME
+        if train["manual_speed"] is not None:
+            flags |= FLAG_MANUAL_SPEED
+        parts.append(
+            TRAIN.pack(
+                index.trains[train["id"]],
+                flags,
+                *_encode_position(index, train["head_position"]),
+                *_encode_position(index, train["tail_position"]),
+                NO_INDEX if train["stop_id"] is None else index.stops[train["stop_id"]],
+                train["stop_distance"],
+                train["departure_time"] or 0,
+                train["speed_command"],
+                train["voltage_mV"],
+                train["manual_speed"] or 0.0,
+                train["next_junction_distance"],
+                len(train["covered_section_ids"]),
+            )
+        )
+        parts.append(
+            struct.pack(
+                f"<{len(train['covered_section_ids'])}H",
+                *(index.sections[section_id] for section_id in train["covered_section_ids"]),
+            )
+        )
+        body_points = train["body_points"]
+        parts.append(
+            struct.pack(
+                f"<H{len(body_points) * 2}f",
+                len(body_points),
+                *(coordinate for point in body_points for coordinate in (point["x"], point["y"])),
+            )
+        )
+
+    parts.append(COUNT.pack(len(obstacles)))
+    for obstacle in obstacles.values():
+        parts.append(OBSTACLE.pack(index.obstacles[obstacle["id"]], obstacle["is_detected"]))
+
+    return b"".join(parts)
+
+
+def _encode_direction(direction: str | None) -> int:
+    if direction is None:
+        return NO_DIRECTION
+    return DIRECTIONS.index(direction)
+
+
+def _encode_position(index: StateIndex, position: JSONObject) -> tuple[int, int, float]:
+    return (
+        index.sections[position["section_id"]],
+        index.junctions[position["target_junction_id"]],
+        position["mileage"],
+    )
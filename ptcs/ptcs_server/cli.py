@@ -6,8 +6,42 @@ from . import server
 @click.command()
 @click.option("--bridge", is_flag=True)
 @click.option("--debug", is_flag=True)
-def main(bridge: bool, debug: bool) -> None:
-    server.serve(bridge=bridge, debug=debug)
+@click.option("--journal", default=None, help="入力を記録するディレクトリ (指定しなければ記録しない)")
+@click.option("--recover", is_flag=True, help="起動時に --journal のディレクトリから前回の状態を復元する")
+@click.option("--record", default=None, help="BLE の入力と指令を記録するファイル")
+@click.option(
+    "--motor-keepalive",
+    default=server.DEFAULT_MOTOR_KEEPALIVE,
+    help="列車への指令が変わらなくても送り直す間隔[s] (0 なら毎回送る)",
+)
+@click.option("--write-without-response", is_flag=True, help="列車への指令を応答なしで書き込む (ファームウェアが対応していれば)")
+@click.option(
+    "--point-refresh",
+    default=server.DEFAULT_POINT_REFRESH,
+    help="ポイントの向きが変わらなくても送り直す間隔[s]",
+)
+def main(
+    bridge: bool,
+    debug: bool,
+    journal: str | None,
+    recover: bool,
+    record: str | None,
+    motor_keepalive: float,
+    write_without_response: bool,
+    point_refresh: float,
+) -> None:
+    if recover and journal is None:
+        raise click.UsageError("--recover requires --journal")
+    server.serve(
+        bridge=bridge,
+        debug=debug,
+        journal=journal,
+        recover=recover,
+        record=record,
+        motor_keepalive=motor_keepalive,
+        write_without_response=write_without_response,
+        point_refresh=point_refresh,
+    )
 
 
 if __name__ == "__main__":
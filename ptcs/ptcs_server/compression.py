@@ -0,0 +1,31 @@
+"""
+レスポンスの圧縮 (Content-Encoding) に関する処理。
+"""
+
+import gzip
+
+MIN_COMPRESS_SIZE = 1024  # これより小さいレスポンスは圧縮しない
+
+
+def parse_accept_encoding(accept_encoding: str | None) -> set[str]:
+    """
+    `Accept-Encoding` ヘッダーから、受け入れ可能なエンコーディングの集合を得る。
+    `q=0` が指定されたものは除く。
+    """
+    if accept_encoding is None:
+        return set()
+    encodings = set()
+    for candidate in accept_encoding.split(","):
+        name, *params = [part.strip() for part in candidate.split(";")]
+        if any(param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for param in params):
+            continue
+        if name:
+            encodings.add(name.lower())
+    return encodings
+
+
+def compress_gzip(body: bytes, compresslevel: int = 6) -> bytes:
+    """
+    gzip で圧縮する。`mtime` を固定して、同じ内容からは同じバイト列が得られるようにする。
+    """
+    return gzip.compress(body, compresslevel=compresslevel, mtime=0)
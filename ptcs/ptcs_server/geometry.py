@@ -0,0 +1,129 @@
+"""
+UI 上の路線の座標 (data/*/railway_ui_*.json) を読み込み、列車の位置を UI 上の座標に変換する。
+
+セクションの折れ線の累積の長さを起動時に計算しておき、
+tick ごとの変換は二分探索と線形補間だけで済むようにする。
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from ptcs_control.components.junction import Junction
+from ptcs_control.components.position import DirectedPosition
+from ptcs_control.components.section import Section, SectionConnection
+
+Point = tuple[float, float]
+
+COORDINATE_DIGITS = 1  # UI 上の座標を丸める桁数
+
+
+@dataclass(frozen=True)
+class SectionGeometry:
+    """UI 上のセクションひとつ分の折れ線。A 側の端から B 側の端に向かう。"""
+
+    points: list[Point]
+    cumulative_lengths: list[float]  # `points[i]` までの折れ線の長さ
+
+    @staticmethod
+    def from_points(points: list[Point]) -> SectionGeometry:
+        cumulative_lengths = [0.0]
+        for (px, py), (qx, qy) in zip(points, points[1:]):
+            cumulative_lengths.append(cumulative_lengths[-1] + math.hypot(qx - px, qy - py))
+        return SectionGeometry(points=points, cumulative_lengths=cumulative_lengths)
+
+    def locate(self, ratio: float) -> tuple[Point, int]:
+        """
+        A 側の端から折れ線の長さの `ratio` 倍だけ進んだ位置の座標と、
+        その位置より B 側にある最初の頂点のインデックスを返す。
+        """
+        target = min(max(ratio, 0.0), 1.0) * self.cumulative_lengths[-1]
+        i = bisect_right(self.cumulative_lengths, target)
+        if i >= len(self.points):
+            return self.points[-1], len(self.points)
+        (px, py), (qx, qy) = self.points[i - 1], self.points[i]
+        segment_length = self.cumulative_lengths[i] - self.cumulative_lengths[i - 1]
+        t = (target - self.cumulative_lengths[i - 1]) / segment_length if segment_length > 0 else 0.0
+        return (px + (qx - px) * t, py + (qy - py) * t), i
+
+    def path(self, from_ratio: float, to_ratio: float) -> list[Point]:
+        """
+        `from_ratio` の位置から `to_ratio` の位置まで、折れ線に沿って進むときに通る点を返す。
+        """
+        from_point, from_index = self.locate(from_ratio)
+        to_point, to_index = self.locate(to_ratio)
+        if from_ratio <= to_ratio:
+            return [from_point, *self.points[from_index:to_index], to_point]
+        else:
+            return [from_point, *reversed(self.points[to_index:from_index]), to_point]
+
+
+@dataclass(frozen=True)
+class RailwayGeometry:
+    """UI 上の路線の座標"""
+
+    sections: dict[str, SectionGeometry]
+
+    @staticmethod
+    def load(path: str) -> RailwayGeometry:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return RailwayGeometry(
+            sections={
+                section_id: SectionGeometry.from_points([(point["x"], point["y"]) for point in section["points"]])
+                for section_id, section in data["sections"].items()
+            }
+        )
+
+    def get_train_body_points(
+        self,
+        head_position: DirectedPosition,
+        tail_position: DirectedPosition,
+        covered_sections: list[Section],
+    ) -> list[Point]:
+        """
+        列車の最後尾から先頭までを UI 上で結ぶ折れ線の点を返す。
+        UI 上の座標が無いセクションにかかっている場合は空のリストを返す。
+        """
+        sections = [tail_position.section, *covered_sections, head_position.section]
+        if any(section.id not in self.sections for section in sections):
+            return []
+
+        tail_geometry = self.sections[tail_position.section.id]
+        tail_ratio = tail_position.mileage / tail_position.section.length
+
+        if head_position.section == tail_position.section and not covered_sections:
+            head_ratio = head_position.mileage / head_position.section.length
+            return _round_points(tail_geometry.path(tail_ratio, head_ratio))
+
+        junction = tail_position.target_junction
+        points = tail_geometry.path(tail_ratio, _get_end_ratio(tail_position.section, junction))
+        for section in covered_sections:
+            geometry = self.sections[section.id]
+            if junction == section.connected_junctions[SectionConnection.A]:
+                points.extend(geometry.points)
+            else:
+                points.extend(reversed(geometry.points))
+            junction = section.get_opposite_junction(junction)
+
+        head_geometry = self.sections[head_position.section.id]
+        head_ratio = head_position.mileage / head_position.section.length
+        points.extend(head_geometry.path(_get_end_ratio(head_position.section, junction), head_ratio))
+        return _round_points(points)
+
+
+def _get_end_ratio(section: Section, junction: Junction) -> float:
+    return 0.0 if junction == section.connected_junctions[SectionConnection.A] else 1.0
+
+
+def _round_points(points: list[Point]) -> list[Point]:
+    """座標を丸め、連続する同じ点を取り除く。"""
+    rounded: list[Point] = []
+    for x, y in points:
+        point = (round(x, COORDINATE_DIGITS), round(y, COORDINATE_DIGITS))
+        if not rounded or rounded[-1] != point:
+            rounded.append(point)
+    return rounded
@@ -0,0 +1,241 @@
+"""
+FastAPI も BLE も使わずに、control と列車のシミュレーターを仮想的な時刻で動かす。
+
+サーバーの制御ループや TrainSimulator は `asyncio.sleep` で実時間を待つので、10 分の走行には 10 分かかる。
+ここでは時刻を `step` 秒ずつ進めるだけで待たないので、CPU の許す限り速く動かせる。
+制御ループの周期や指令を送る周期はサーバー (server.py) と同じにしている。
+列車のシミュレーターはセンサー位置の UID と電池電圧も通知するので、位置の修正も実機と同じように起こる。
+
+使い方:
+    poetry run python -m ptcs_server.headless --duration 3600 --step 0.1
+    poetry run python -m ptcs_server.headless --synthetic-sections 500 --synthetic-trains 40
+    poetry run python -m ptcs_server.headless --synthetic-sections 2000 --synthetic-trains 300 --fleet
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import click
+
+from ptcs_bridge.fleet_simulator import FleetSimulator
+from ptcs_bridge.train_base import TrainBase
+from ptcs_bridge.train_dynamics import TrainDynamics, load_train_dynamics
+from ptcs_bridge.train_simulator import TrainSimulator
+from ptcs_control import gogatsusai2024, synthetic
+from ptcs_control.control.base import BaseControl
+
+from .journal import ControlJournal
+from .recording import BridgeInputs
+from .types.state import get_topology_from_control
+
+CONTROL_INTERVAL_SECONDS = 0.1  # 制御ループの周期 (server.py の `control_loop`)
+COMMAND_INTERVAL_SECONDS = 0.2  # 列車に速度指令を送る周期 (server.py の `train_loop`)
+STOPPED_ROTATION_RATE = 1.0  # モーターの回転がこれより遅ければ[回転/s]、止まりきったとみなす
+
+
+@dataclass(frozen=True)
+class HeadlessResult:
+    simulated_seconds: float
+    wall_seconds: float
+    ticks: int
+    rotations: int  # すべての列車のモーターの回転数の合計
+    position_uids: int  # すべての列車がセンサーの上を通過した回数
+    stopping_distances: list[float]  # control が停車を始めさせてから、列車が止まりきるまでに本当に進んだ距離[cm]
+    unfinished_stops: int  # 止まりきる前に発車の時刻になった停車の数
+
+    @property
+    def speedup(self) -> float:
+        """実時間 1 秒あたりにシミュレーションした秒数"""
+        return self.simulated_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+class HeadlessRunner:
+    """
+    control と、control のすべての列車に対応する TrainSimulator を仮想的な時刻で動かす。
+    入力の適用や指令の計算はサーバーと同じ `BridgeInputs` を使う。
+    """
+
+    control: BaseControl
+    simulators: dict[str, TrainSimulator]
+    current_time: float  # 仮想的な時刻 (秒)
+    _fleet: FleetSimulator | None  # 列車をまとめて動かすとき、それらを動かす FleetSimulator
+    _inputs: BridgeInputs
+    _next_tick_time: float
+    _next_command_time: float
+    _position_uids: int
+    # 停車中の列車の、停車を始めたときのモーターの回転数 (止まりきって距離を測り終えたら None)
+    _stopping_since: dict[str, float | None]
+    _unfinished_stops: int
+
+    def __init__(
+        self,
+        control: BaseControl,
+        odometry_error: float = 0.0,
+        dynamics: dict[str, TrainDynamics] | None = None,
+        fleet: bool = False,
+    ) -> None:
+        """
+        `dynamics` に動特性のモデルが与えられた列車は、実機と同じくモーターへの入力値で動かす。
+        `fleet` が True なら、列車を 1 両ずつではなく FleetSimulator でまとめて動かす (動特性には対応しない)。
+        """
+        self.control = control
+        dynamics = dynamics or {}
+        if fleet:
+            if dynamics:
+                raise ValueError("FleetSimulator does not support train dynamics")
+            self._fleet = FleetSimulator()
+            self.simulators = {train_id: self._fleet.add_train(train_id, odometry_error) for train_id in control.trains}
+        else:
+            self._fleet = None
+            self.simulators = {
+                train_id: TrainSimulator(train_id, odometry_error, dynamics.get(train_id))
+                for train_id in control.trains
+            }
+        self.current_time = 0.0
+        layout_hash = get_topology_from_control(control).layout_hash
+        self._inputs = BridgeInputs(control, ControlJournal(control, layout_hash, None))
+        self._next_tick_time = CONTROL_INTERVAL_SECONDS
+        self._next_command_time = COMMAND_INTERVAL_SECONDS
+        self._position_uids = 0
+        self._stopping_since = {}
+        self._unfinished_stops = 0
+
+        def handle_notify_position_uid(simulator: TrainBase, position_uid: str) -> None:
+            self._position_uids += 1
+            self._inputs.notify_position_uid(simulator.id, position_uid)
+
+        def handle_notify_voltage(simulator: TrainBase, voltage_mV: int) -> None:
+            self._inputs.notify_voltage(simulator.id, voltage_mV)
+
+        async def start_notify() -> None:
+            for train_id, simulator in self.simulators.items():
+                simulator.place(control.trains[train_id], control.sensor_positions.values())
+                await simulator.start_notify_position_uid(handle_notify_position_uid)
+                await simulator.start_notify_voltage(handle_notify_voltage)
+
+        asyncio.run(start_notify())
+
+    def run(self, duration: float, step: float = CONTROL_INTERVAL_SECONDS) -> HeadlessResult:
+        """
+        仮想的な時刻を `step` 秒ずつ、`duration` 秒だけ進める。
+        """
+        assert step > 0
+        ticks = 0
+        rotations = 0
+        position_uids = self._position_uids
+        stopping_distances: list[float] = []
+        unfinished_stops = self._unfinished_stops
+        end_time = self.current_time + duration
+        start = time.perf_counter()
+        # 浮動小数点の誤差で最後の 1 ステップが抜けないように、ステップ数を先に決める
+        for _ in range(round(duration / step)):
+            self.current_time = min(self.current_time + step, end_time)
+            if self._fleet is not None:
+                # fleet の列車は simulators と同じ順に追加してある
+                step_rotations = self._fleet.step(step)
+            else:
+                step_rotations = [simulator.step(step) for simulator in self.simulators.values()]
+            for train_id, rotation in zip(self.simulators, step_rotations):
+                if rotation > 0:
+                    self._inputs.notify_rotation(train_id, rotation)
+                    rotations += rotation
+            while self._next_command_time <= self.current_time + 1e-9:
+                for train_id, simulator in self.simulators.items():
+                    if simulator.dynamics is None:
+                        simulator.set_speed(self._inputs.command_speed(train_id))
+                    else:
+                        simulator.set_motor_input(self._inputs.command_motor_input(train_id))
+                    stopping_distance = self._measure_stopping_distance(train_id, simulator)
+                    if stopping_distance is not None:
+                        stopping_distances.append(stopping_distance)
+                self._next_command_time += COMMAND_INTERVAL_SECONDS
+            while self._next_tick_time <= self.current_time + 1e-9:
+                self._inputs.tick()
+                ticks += 1
+                self._next_tick_time += CONTROL_INTERVAL_SECONDS
+        return HeadlessResult(
+            simulated_seconds=duration,
+            wall_seconds=time.perf_counter() - start,
+            ticks=ticks,
+            rotations=rotations,
+            position_uids=self._position_uids - position_uids,
+            stopping_distances=stopping_distances,
+            unfinished_stops=self._unfinished_stops - unfinished_stops,
+        )
+
+    def _measure_stopping_distance(self, train_id: str, simulator: TrainSimulator) -> float | None:
+        """
+        control が停車を始めさせた列車が (加速の遅れのために少し遅れて) 止まりきったら、
+        その間に本当に進んだ距離を一度だけ返す。
+        """
+        train = self.control.trains[train_id]
+        if train.departure_time is None:
+            if self._stopping_since.pop(train_id, None) is not None:
+                self._unfinished_stops += 1
+            return None
+        if train_id not in self._stopping_since:
+            self._stopping_since[train_id] = simulator.total_rotation
+            return None
+        start_rotation = self._stopping_since[train_id]
+        if start_rotation is None or simulator.rotation_rate > STOPPED_ROTATION_RATE:
+            return None
+        self._stopping_since[train_id] = None
+        return (
+            (simulator.total_rotation - start_rotation)
+            * train.delta_per_motor_rotation
+            * (1 + simulator.odometry_error)
+        )
+
+
+@click.command()
+@click.option("--duration", default=600.0, help="シミュレーションする秒数")
+@click.option("--step", default=CONTROL_INTERVAL_SECONDS, help="仮想的な時刻を一度に進める秒数")
+@click.option("--odometry-error", default=0.0, help="列車が本当に進む距離の、回転数から計算される距離に対する誤差の割合")
+@click.option("--dynamics", "dynamics_path", help="scripts/fit_train_dynamics.py で求めた列車の動特性のファイル")
+@click.option("--synthetic-sections", type=int, help="指定すれば、このセクション数の路線を自動生成して使う")
+@click.option("--synthetic-trains", default=10, help="自動生成する路線に置く列車の数")
+@click.option("--fleet", is_flag=True, help="列車を FleetSimulator でまとめて動かす (--dynamics とは併用できない)")
+def main(
+    duration: float,
+    step: float,
+    odometry_error: float,
+    dynamics_path: str | None,
+    synthetic_sections: int | None,
+    synthetic_trains: int,
+    fleet: bool,
+) -> None:
+    if fleet and dynamics_path is not None:
+        raise click.UsageError("--fleet cannot be used with --dynamics")
+    dynamics = load_train_dynamics(dynamics_path) if dynamics_path is not None else None
+    if synthetic_sections is not None:
+        control = synthetic.create_control(
+            synthetic.SyntheticLayout(sections=synthetic_sections, trains=synthetic_trains)
+        )
+    else:
+        control = gogatsusai2024.create_control()
+    runner = HeadlessRunner(control, odometry_error, dynamics, fleet)
+    result = runner.run(duration, step)
+    print(
+        f"simulated {result.simulated_seconds:.1f} s in {result.wall_seconds:.2f} s "
+        f"({result.speedup:.0f} simulated s / wall s), {result.ticks} ticks, {result.rotations} rotations, "
+        f"{result.position_uids} position uids"
+    )
+    if result.stopping_distances:
+        mean_distance = sum(result.stopping_distances) / len(result.stopping_distances)
+        max_distance = max(result.stopping_distances)
+        print(
+            f"stopping distance: mean {mean_distance:.1f} cm, max {max_distance:.1f} cm "
+            f"over {len(result.stopping_distances)} stops"
+        )
+    if result.unfinished_stops > 0:
+        print(f"{result.unfinished_stops} stops did not come to a halt before departure")
+    for train in runner.control.trains.values():
+        position = train.head_position
+        print(f"  {train.id}: {position.section.id} {position.mileage:.1f} cm -> {position.target_junction.id}")
+
+
+if __name__ == "__main__":
+    main()
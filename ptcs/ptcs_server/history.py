@@ -0,0 +1,205 @@
+"""
+実行中に変化する状態を tick ごとに記録し、直近の履歴を返す。
+
+記録は起動時に確保した固定長の配列 (`array.array`) にリングバッファとして書き込む。
+値の種類ごとに配列を分けて持つ (列指向) ので、使うメモリは記録する tick 数に比例した一定の量になり、
+tick ごとの記録では辞書やモデルなどのオブジェクトを作らない。
+
+記録の時刻は単調な時計 (`time.monotonic()`) で持つ。
+NTP などで UNIX 時間が巻き戻っても記録は時刻順に並んだままなので、二分探索で範囲を選べる。
+UNIX 時間との変換は、問い合わせのたびにその時点の差を使って行う。
+"""
+
+from __future__ import annotations
+
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from ptcs_control.components.junction import Junction, PointDirection
+from ptcs_control.components.section import Section
+from ptcs_control.components.train import Train
+from ptcs_control.control.base import BaseControl
+
+from .binary import StateIndex
+from .serializer import JSONObject
+
+HISTORY_CAPACITY = 6000  # 記録しておく tick 数 (0.1 秒ごとに記録すると 10 分間)
+
+DIRECTIONS = [PointDirection.STRAIGHT, PointDirection.CURVE]  # 分岐の向きの記録は、このリストでのインデックス
+
+
+class StateHistory:
+    """
+    実行中に変化する状態 (列車の位置・速度指令値・電圧、分岐の向き、閉塞の有無) の履歴。
+
+    列車などは `StateIndex` の順序で並べ、`i` 番目の記録の `j` 番目の列車の値は
+    `_train_mileages[i * 列車の数 + j]` のように格納する。
+    """
+
+    capacity: int
+    size: int  # 記録されている tick 数
+    _cursor: int  # 次に書き込む位置
+    _index: StateIndex
+    _section_ids: list[str]
+    _junction_ids: list[str]
+    _trains: list[Train]
+    _junctions: list[Junction]
+    _sections: list[Section]
+
+    _monotonic_times: array[float]
+    _current_times: array[int]
+    _versions: array[int]
+    _train_section_indices: array[int]
+    _train_target_junction_indices: array[int]
+    _train_mileages: array[float]
+    _train_speed_commands: array[float]
+    _train_voltages_mV: array[int]
+    _junction_directions: array[int]
+    _section_blocked: array[int]
+
+    def __init__(self, control: BaseControl, index: StateIndex, capacity: int = HISTORY_CAPACITY) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self._cursor = 0
+        self._index = index
+        self._section_ids = list(index.sections)
+        self._junction_ids = list(index.junctions)
+        self._trains = [control.trains[id] for id in index.trains]
+        self._junctions = [control.junctions[id] for id in index.junctions]
+        self._sections = [control.sections[id] for id in index.sections]
+
+        trains = len(self._trains) * capacity
+        self._monotonic_times = array("d", bytes(8 * capacity))
+        self._current_times = array("q", bytes(8 * capacity))
+        self._versions = array("q", bytes(8 * capacity))
+        self._train_section_indices = array("H", bytes(2 * trains))
+        self._train_target_junction_indices = array("H", bytes(2 * trains))
+        self._train_mileages = array("d", bytes(8 * trains))
+        self._train_speed_commands = array("d", bytes(8 * trains))
+        self._train_voltages_mV = array("i", bytes(4 * trains))
+        self._junction_directions = array("B", bytes(len(self._junctions) * capacity))
+        self._section_blocked = array("B", bytes(len(self._sections) * capacity))
+
+    def record(self, control: BaseControl, version: int, monotonic_time: float | None = None) -> None:
+        """
+        現在の状態を記録する。記録が `capacity` を超えたら、古いものから上書きする。
+        `monotonic_time` は記録の時刻 (`time.monotonic()`、省略すれば現在)。
+        """
+        row = self._cursor
+        self._monotonic_times[row] = time.monotonic() if monotonic_time is None else monotonic_time
+        self._current_times[row] = control.current_time
+        self._versions[row] = version
+
+        section_indices = self._index.sections
+        junction_indices = self._index.junctions
+        offset = row * len(self._trains)
+        for train in self._trains:
+            position = train.head_position
+            self._train_section_indices[offset] = section_indices[position.section.id]
+            self._train_target_junction_indices[offset] = junction_indices[position.target_junction.id]
+            self._train_mileages[offset] = position.mileage
+            self._train_speed_commands[offset] = train.speed_command
+            self._train_voltages_mV[offset] = train.voltage_mV
+            offset += 1
+
+        offset = row * len(self._junctions)
+        for junction in self._junctions:
+            # Enum のハッシュの計算は遅いので、辞書を引かずに比較する
+            self._junction_directions[offset] = junction.current_direction is PointDirection.CURVE
+            offset += 1
+
+        offset = row * len(self._sections)
+        for section in self._sections:
+            self._section_blocked[offset] = section.is_blocked
+            offset += 1
+
+        self._cursor = (row + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def query(
+        self, from_time: float | None = None, to_time: float | None = None, step: float | None = None
+    ) -> JSONObject:
+        """
+        時刻 (UNIX 時間) が `from_time` から `to_time` までの記録を、`RailwayHistory` と同じスキーマの dict で返す。
+        `step` が指定されれば、`step` 秒ごとに区切った区間それぞれの最初の記録のみを返す (間引き)。
+        位置や分岐の向きは平均すると意味をなさないので、平均ではなく間引きにしている。
+        """
+        # UNIX 時間と単調な時計の、現時点での差
+        offset = time.time() - time.monotonic()
+        rows = self._select_rows(
+            None if from_time is None else from_time - offset,
+            None if to_time is None else to_time - offset,
+            step,
+        )
+        trains = len(self._trains)
+        junctions = len(self._junctions)
+        sections = len(self._sections)
+        section_ids = self._section_ids
+        junction_ids = self._junction_ids
+        return {
+            "timestamps": [self._monotonic_times[row] + offset for row in rows],
+            "current_times": [self._current_times[row] for row in rows],
+            "versions": [self._versions[row] for row in rows],
+            "trains": {
+                train.id: {
+                    "section_ids": [section_ids[self._train_section_indices[row * trains + j]] for row in rows],
+                    "target_junction_ids": [
+                        junction_ids[self._train_target_junction_indices[row * trains + j]] for row in rows
+                    ],
+                    "mileages": [self._train_mileages[row * trains + j] for row in rows],
+                    "speed_commands": [self._train_speed_commands[row * trains + j] for row in rows],
+                    "voltages_mV": [self._train_voltages_mV[row * trains + j] for row in rows],
+                }
+                for j, train in enumerate(self._trains)
+            },
+            "junctions": {
+                junction.id: {
+                    "current_directions": [
+                        DIRECTIONS[self._junction_directions[row * junctions + j]].value for row in rows
+                    ]
+                }
+                for j, junction in enumerate(self._junctions)
+            },
+            "sections": {
+                section.id: {"is_blocked": [bool(self._section_blocked[row * sections + j]) for row in rows]}
+                for j, section in enumerate(self._sections)
+            },
+        }
+
+    def _select_rows(self, from_time: float | None, to_time: float | None, step: float | None) -> list[int]:
+        """
+        単調な時計での時刻が `from_time` から `to_time` までの記録の、配列上の位置を古い順に返す。
+        """
+        start = (self._cursor - self.size) % self.capacity
+        # 記録は古い順に並んでいるので、時刻で二分探索できる
+        times = _RingView(self._monotonic_times, start, self.size)
+        first = 0 if from_time is None else bisect_left(times, from_time)
+        last = self.size if to_time is None else bisect_right(times, to_time)
+
+        rows: list[int] = []
+        previous_bucket = -1
+        for i in range(first, last):
+            row = (start + i) % self.capacity
+            if step is not None:
+                bucket = int((self._monotonic_times[row] - times[first]) // step)
+                if bucket == previous_bucket:
+                    continue
+                previous_bucket = bucket
+            rows.append(row)
+        return rows
+
+
+class _RingView:
+    """リングバッファを、古い順に並んだ列として `bisect` で扱うためのもの"""
+
+    def __init__(self, values: array[float], start: int, size: int) -> None:
+        self._values = values
+        self._start = start
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i: int) -> float:
+        return self._values[(self._start + i) % len(self._values)]
@@ -0,0 +1,520 @@
+"""
+control への入力 (モーターの回転、位置の補正、API からの操作など) を追記型のファイルに記録し、
+サーバーが落ちても再起動時に直前の状態を復元できるようにする。
+
+ディレクトリには、ある時点の control の状態 (スナップショット) と、その後の入力の記録 (ジャーナル) を置く。
+
+```
+snapshot-<seq>.bin : header, [TRAIN_STATE] * 列車の数, [JUNCTION_STATE] * 分岐点の数,
+                     [SECTION_STATE] * セクションの数, [OBSTACLE_STATE] * 障害物の数
+journal-<seq>.bin  : [RECORD] * 入力の数 (snapshot-<seq> の後の入力)
+```
+
+復元するときは、最新のスナップショットを読み込んでから、その後のジャーナルを先頭から再生する。
+control の計算は決定的なので、`update()` を呼んだ時点も記録しておけば同じ状態になる。
+
+入力を適用するときには、状態が変わりうるコンポーネントのバージョン (`ComponentVersions`) を進める。
+状態の配信 (stream.py) は、バージョンが進んだコンポーネントだけを JSON に変換し直す。
+
+入力は制御ループ上でメモリ上のバッファに溜めておき、`update()` ごとにまとめて書き込み用のスレッドに渡す。
+ファイルへの書き込みは制御ループを止めない。
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import queue
+import re
+import struct
+import threading
+from collections.abc import Mapping
+from enum import IntEnum
+from typing import BinaryIO
+
+from ptcs_control.components.junction import Junction, PointDirection
+from ptcs_control.components.obstacle import Obstacle
+from ptcs_control.components.position import DirectedPosition
+from ptcs_control.components.section import Section
+from ptcs_control.components.sensor_position import SensorPosition
+from ptcs_control.components.train import Train
+from ptcs_control.control.base import BaseControl
+
+FORMAT_VERSION = 1
+MAGIC = b"PTCJ"
+NO_INDEX = 0xFFFF
+NO_DIRECTION = 0xFF
+
+SNAPSHOT_INTERVAL = 100  # この回数だけ `update()` を呼ぶごとにスナップショットを作る (制御ループで 10 秒ごと)
+
+RECORD = struct.Struct("<BHd")  # kind (u8), index (u16), value (f64)
+
+# magic, format (u8), layout_hash (16 bytes), seq (u32), current_time (i64)
+SNAPSHOT_HEADER = struct.Struct("<4sB16sIq")
+# head_position (section_index (u16), target_junction_index (u16), mileage (f64)),
+# stop_index (u16), stop_distance (f64), has_departure_time (u8), departure_time (i64),
+# voltage_mV (i32), manual_speed (f64, 無ければ NaN), speed_command (f64)
+TRAIN_STATE = struct.Struct("<HHdHdBqidd")
+# manual_direction (u8, 無ければ 0xFF), current_direction (u8), direction_command (u8)
+JUNCTION_STATE = struct.Struct("<BBB")
+SECTION_STATE = struct.Struct("<B")  # is_blocked (u8)
+OBSTACLE_STATE = struct.Struct("<B")  # is_detected (u8)
+
+DIRECTIONS = list(PointDirection)
+
+SNAPSHOT_FILE_PATTERN = re.compile(r"snapshot-(\d+)\.bin")
+
+
+class RecordKind(IntEnum):
+    """入力の種類。`index` は対象のコンポーネントのインデックスで、`value` の意味は種類ごとに異なる。"""
+
+    TICK = 0  # value: 進める時間
+    UPDATE = 1
+    MOVE_FORWARD_MR = 2  # index: 列車, value: モーターの回転数
+    MOVE_FORWARD = 3  # index: 列車, value: 進める距離
+    FIX_POSITION = 4  # index: 列車, value: センサーの位置のインデックス
+    VOLTAGE = 5  # index: 列車, value: 電池電圧[mV]
+    MANUAL_SPEED = 6  # index: 列車, value: マスコンからの指令速度 (無ければ NaN)
+    MANUAL_DIRECTION = 7  # index: 分岐点, value: 方向のインデックス (無ければ NaN)
+    OBSTACLE = 8  # index: 障害物, value: 検知されているか (0 または 1)
+    SECTION_BLOCKED = 9  # index: セクション, value: 閉塞されているか (0 または 1)
+
+
+class ComponentVersions:
+    """
+    実行中に変化する状態を持つコンポーネント (`junctions`, `sections`, `trains`, `obstacles`) ごとのバージョン。
+
+    コンポーネントの状態が変わりうる操作のたびに、全体のバージョン `version` を進めて、そのコンポーネントのバージョンにする。
+    あるバージョンより後に変わったコンポーネントは、そのバージョンより大きいバージョンを持つ。
+    (変わりうるだけで実際には変わっていないこともある)
+    """
+
+    version: int
+    _versions: dict[str, dict[str, int]]
+
+    def __init__(self, control: BaseControl) -> None:
+        self.version = 0
+        self._versions = {
+            "junctions": dict.fromkeys(control.junctions, 0),
+            "sections": dict.fromkeys(control.sections, 0),
+            "trains": dict.fromkeys(control.trains, 0),
+            "obstacles": dict.fromkeys(control.obstacles, 0),
+        }
+
+    def get(self, kind: str) -> Mapping[str, int]:
+        return self._versions[kind]
+
+    def bump(self, kind: str, id: str) -> None:
+        self.version += 1
+        self._versions[kind][id] = self.version
+
+    def bump_all(self, kind: str | None = None) -> None:
+        """`kind` のコンポーネントすべて (`None` ならすべての種類) のバージョンを進める"""
+        self.version += 1
+        for versions in self._versions.values() if kind is None else (self._versions[kind],):
+            for id in versions:
+                versions[id] = self.version
+
+
+class ControlJournal:
+    """
+    control への入力を記録しつつ適用する。
+
+    control の状態を変える操作は、control を直接触らずにこのクラスのメソッドを通して行うこと。
+    `directory` が `None` なら、記録せずに適用だけを行う。
+    状態が変わりうるコンポーネントのバージョンは `versions` に残る。
+    """
+
+    versions: ComponentVersions
+
+    _control: BaseControl
+    _layout_hash: str
+    _directory: str | None
+    _logger: logging.Logger
+    _trains: list[Train]
+    _junctions: list[Junction]
+    _sections: list[Section]
+    _obstacles: list[Obstacle]
+    _sensor_positions: list[SensorPosition]
+    _train_indices: dict[str, int]
+    _junction_indices: dict[str, int]
+    _section_indices: dict[str, int]
+    _obstacle_indices: dict[str, int]
+    _sensor_position_indices: dict[str, int]
+    _stop_indices: dict[str, int]
+
+    _seq: int  # 現在書き込んでいるジャーナルの番号
+    _buffer: bytearray  # 書き込み用のスレッドにまだ渡していない入力
+    _updates_since_snapshot: int
+    _queue: queue.SimpleQueue[tuple[int, bytes] | None]  # (スナップショットの番号, 内容) または (-1, 入力)
+    _writer: threading.Thread | None
+
+    def __init__(
+        self,
+        control: BaseControl,
+        layout_hash: str,
+        directory: str | None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._control = control
+        self._layout_hash = layout_hash
+        self._directory = directory
+        self._logger = logger or logging.getLogger(__name__)
+        self._trains = list(control.trains.values())
+        self._junctions = list(control.junctions.values())
+        self._sections = list(control.sections.values())
+        self._obstacles = list(control.obstacles.values())
+        self._sensor_positions = list(control.sensor_positions.values())
+        self._train_indices = {id: i for i, id in enumerate(control.trains)}
+        self._junction_indices = {id: i for i, id in enumerate(control.junctions)}
+        self._section_indices = {id: i for i, id in enumerate(control.sections)}
+        self._obstacle_indices = {id: i for i, id in enumerate(control.obstacles)}
+        self._sensor_position_indices = {id: i for i, id in enumerate(control.sensor_positions)}
+        self._stop_indices = {id: i for i, id in enumerate(control.stops)}
+        self.versions = ComponentVersions(control)
+
+        self._seq = 0
+        self._buffer = bytearray()
+        self._updates_since_snapshot = 0
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+
+    # 入力
+
+    def tick(self, increment: int = 1) -> None:
+        self._record(RecordKind.TICK, 0, increment)
+
+    def update(self) -> None:
+        """
+        control を再計算する。溜まった入力を書き込み用のスレッドに渡し、必要ならスナップショットを作る。
+        """
+        self._record(RecordKind.UPDATE, 0, 0.0)
+        if self._writer is None:
+            return
+        self._queue.put((-1, bytes(self._buffer)))
+        self._buffer.clear()
+        self._updates_since_snapshot += 1
+        if self._updates_since_snapshot >= SNAPSHOT_INTERVAL:
+            self._write_snapshot()
+
+    def move_forward_mr(self, train: Train, motor_rotation: int) -> None:
+        self._record(RecordKind.MOVE_FORWARD_MR, self._train_indices[train.id], motor_rotation)
+
+    def move_forward(self, train: Train, delta: float) -> None:
+        self._record(RecordKind.MOVE_FORWARD, self._train_indices[train.id], delta)
+
+    def fix_position(self, train: Train, sensor_position: SensorPosition) -> None:
+        self._record(
+            RecordKind.FIX_POSITION, self._train_indices[train.id], self._sensor_position_indices[sensor_position.id]
+        )
+
+    def set_voltage(self, train: Train, voltage_mV: int) -> None:
+        self._record(RecordKind.VOLTAGE, self._train_indices[train.id], voltage_mV)
+
+    def set_manual_speed(self, train: Train, manual_speed: float | None) -> None:
+        self._record(
+            RecordKind.MANUAL_SPEED,
+            self._train_indices[train.id],
+            math.nan if manual_speed is None else manual_speed,
+        )
+
+    def set_manual_direction(self, junction: Junction, direction: PointDirection | None) -> None:
+        self._record(
+            RecordKind.MANUAL_DIRECTION,
+            self._junction_indices[junction.id],
+            math.nan if direction is None else DIRECTIONS.index(direction),
+        )
+
+    def set_obstacle_detected(self, obstacle: Obstacle, is_detected: bool) -> None:
+        self._record(RecordKind.OBSTACLE, self._obstacle_indices[obstacle.id], is_detected)
+
+    def set_section_blocked(self, section: Section, is_blocked: bool) -> None:
+        self._record(RecordKind.SECTION_BLOCKED, self._section_indices[section.id], is_blocked)
+
+    def _record(self, kind: RecordKind, index: int, value: float) -> None:
+        self._apply(kind, index, value)
+        if self._directory is not None:
+            self._buffer += RECORD.pack(kind, index, value)
+
+    def _apply(self, kind: int, index: int, value: float) -> None:
+        match kind:
+            case RecordKind.TICK:
+                self._control.tick(int(value))
+            case RecordKind.UPDATE:
+                self._update()
+            case RecordKind.MOVE_FORWARD_MR:
+                self._trains[index].move_forward_mr(int(value))
+                self.versions.bump("trains", self._trains[index].id)
+            case RecordKind.MOVE_FORWARD:
+                self._trains[index].move_forward(value)
+                self.versions.bump("trains", self._trains[index].id)
+            case RecordKind.FIX_POSITION:
+                self._trains[index].fix_position(self._sensor_positions[int(value)])
+                self.versions.bump("trains", self._trains[index].id)
+            case RecordKind.VOLTAGE:
+                self._trains[index].voltage_mV = int(value)
+                self.versions.bump("trains", self._trains[index].id)
+            case RecordKind.MANUAL_SPEED:
+                self._trains[index].manual_speed = None if math.isnan(value) else value
+                self.versions.bump("trains", self._trains[index].id)
+            case RecordKind.MANUAL_DIRECTION:
+                self._junctions[index].manual_direction = None if math.isnan(value) else DIRECTIONS[int(value)]
+                self.versions.bump("junctions", self._junctions[index].id)
+            case RecordKind.OBSTACLE:
+                self._obstacles[index].is_detected = bool(value)
+                self.versions.bump("obstacles", self._obstacles[index].id)
+            case RecordKind.SECTION_BLOCKED:
+                if value:
+                    self._sections[index].block()
+                else:
+                    self._sections[index].unblock()
+                self.versions.bump("sections", self._sections[index].id)
+            case _:
+                raise ValueError(f"unknown journal record kind {kind}")
+
+    def _update(self) -> None:
+        # update が書き換えるのは、列車の停止目標と速度指令、分岐点の向き、セクションの閉塞だけなので、
+        # その前後で値が変わったコンポーネントのバージョンを進める
+        trains_before = [_train_command(train) for train in self._trains]
+        junctions_before = [_junction_directions(junction) for junction in self._junctions]
+        sections_before = [section.is_blocked for section in self._sections]
+        self._control.update()
+        for train, train_before in zip(self._trains, trains_before):
+            if _train_command(train) != train_before:
+                self.versions.bump("trains", train.id)
+        for junction, junction_before in zip(self._junctions, junctions_before):
+            if _junction_directions(junction) != junction_before:
+                self.versions.bump("junctions", junction.id)
+                if junction.current_direction != junction_before[1]:
+                    # 列車の後端の位置や車体の形は、通ってきた分岐点の向きで変わる
+                    self.versions.bump_all("trains")
+        for section, is_blocked_before in zip(self._sections, sections_before):
+            if section.is_blocked != is_blocked_before:
+                self.versions.bump("sections", section.id)
+
+    # スナップショット
+
+    def encode_snapshot(self, seq: int) -> bytes:
+        """
+        control の現在の状態をスナップショットに変換する。
+        """
+        control = self._control
+        parts = [SNAPSHOT_HEADER.pack(MAGIC, FORMAT_VERSION, self._layout_hash.encode(), seq, control.current_time)]
+        for train in self._trains:
+            position = train.head_position
+            parts.append(
+                TRAIN_STATE.pack(
+                    self._section_indices[position.section.id],
+                    self._junction_indices[position.target_junction.id],
+                    position.mileage,
+                    NO_INDEX if train.stop is None else self._stop_indices[train.stop.id],
+                    train.stop_distance,
+                    train.departure_time is not None,
+                    train.departure_time or 0,
+                    train.voltage_mV,
+                    math.nan if train.manual_speed is None else train.manual_speed,
+                    train.speed_command,
+                )
+            )
+        for junction in self._junctions:
+            parts.append(
+                JUNCTION_STATE.pack(
+                    NO_DIRECTION if junction.manual_direction is None else DIRECTIONS.index(junction.manual_direction),
+                    DIRECTIONS.index(junction.current_direction),
+                    DIRECTIONS.index(junction.direction_command),
+                )
+            )
+        for section in self._sections:
+            parts.append(SECTION_STATE.pack(section.is_blocked))
+        for obstacle in self._obstacles:
+            parts.append(OBSTACLE_STATE.pack(obstacle.is_detected))
+        return b"".join(parts)
+
+    def apply_snapshot(self, data: bytes) -> int:
+        """
+        スナップショットを control に適用し、その番号を返す。
+        路線の構成が異なるものや壊れたものであれば `ValueError` を投げ、control は変更しない。
+        """
+        expected_size = (
+            SNAPSHOT_HEADER.size
+            + TRAIN_STATE.size * len(self._trains)
+            + JUNCTION_STATE.size * len(self._junctions)
+            + SECTION_STATE.size * len(self._sections)
+            + OBSTACLE_STATE.size * len(self._obstacles)
+        )
+        if len(data) != expected_size:
+            raise ValueError(f"snapshot size {len(data)} does not match the layout ({expected_size})")
+        magic, format, layout_hash, seq, current_time = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != MAGIC or format != FORMAT_VERSION:
+            raise ValueError("not a ptcs journal snapshot")
+        if layout_hash.decode() != self._layout_hash:
+            raise ValueError(f"snapshot layout {layout_hash.decode()} does not match {self._layout_hash}")
+
+        stops = list(self._control.stops.values())
+        self._control.current_time = current_time
+        offset = SNAPSHOT_HEADER.size
+        for train in self._trains:
+            (
+                section_index,
+                junction_index,
+                mileage,
+                stop_index,
+                stop_distance,
+                has_departure_time,
+                departure_time,
+                voltage_mV,
+                manual_speed,
+                speed_command,
+            ) = TRAIN_STATE.unpack_from(data, offset)
+            offset += TRAIN_STATE.size
+            train.head_position = DirectedPosition(
+                self._sections[section_index], self._junctions[junction_index], mileage
+            )
+            train.stop = None if stop_index == NO_INDEX else stops[stop_index]
+            train.stop_distance = stop_distance
+            train.departure_time = departure_time if has_departure_time else None
+            train.voltage_mV = voltage_mV
+            train.manual_speed = None if math.isnan(manual_speed) else manual_speed
+            train.speed_command = speed_command
+        for junction in self._junctions:
+            manual_direction, current_direction, direction_command = JUNCTION_STATE.unpack_from(data, offset)
+            offset += JUNCTION_STATE.size
+            junction.manual_direction = None if manual_direction == NO_DIRECTION else DIRECTIONS[manual_direction]
+            junction.current_direction = DIRECTIONS[current_direction]
+            junction.direction_command = DIRECTIONS[direction_command]
+        for section in self._sections:
+            section.is_blocked = bool(SECTION_STATE.unpack_from(data, offset)[0])
+            offset += SECTION_STATE.size
+        for obstacle in self._obstacles:
+            obstacle.is_detected = bool(OBSTACLE_STATE.unpack_from(data, offset)[0])
+            offset += OBSTACLE_STATE.size
+        self._control.event_queue.clear()
+        self.versions.bump_all()
+        return seq
+
+    def replay(self, data: bytes) -> int:
+        """
+        ジャーナルの入力を順に control に適用し、適用した数を返す。
+        書き込みの途中で落ちたために末尾が欠けている入力は無視する。
+        """
+        count = len(data) // RECORD.size
+        for kind, index, value in RECORD.iter_unpack(memoryview(data)[: count * RECORD.size]):
+            self._apply(kind, index, value)
+        return count
+
+    # ファイル
+
+    def recover(self) -> int | None:
+        """
+        ディレクトリにある最新のスナップショットとその後のジャーナルから、control の状態を復元する。
+        再生した入力の数を返す。復元できるものが無ければ何もせずに `None` を返す。
+        """
+        if self._directory is None or not os.path.isdir(self._directory):
+            return None
+        for seq in sorted(self._list_snapshots(), reverse=True):
+            try:
+                with open(self._snapshot_path(seq), "rb") as f:
+                    self._seq = self.apply_snapshot(f.read())
+            except (OSError, ValueError) as e:
+                self._logger.warning("skipped journal snapshot %d: %s", seq, e)
+                continue
+            try:
+                with open(self._journal_path(seq), "rb") as f:
+                    return self.replay(f.read())
+            except FileNotFoundError:
+                return 0
+        return None
+
+    def start(self) -> None:
+        """
+        書き込み用のスレッドを起動し、現在の状態を新しいスナップショットとして書き込む。
+        以降の入力は、そのスナップショットの後のジャーナルに記録される。
+        """
+        if self._directory is None:
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        # 復元に使えなかった古いスナップショットより後の番号から始める
+        self._seq = max([self._seq, *self._list_snapshots()])
+        self._writer = threading.Thread(target=self._write_loop, name="ptcs-journal", daemon=True)
+        self._writer.start()
+        if self._buffer:
+            self._queue.put((-1, bytes(self._buffer)))
+            self._buffer.clear()
+        self._write_snapshot()
+
+    def close(self) -> None:
+        """
+        最後のスナップショットを書き込み、書き込み用のスレッドが終わるのを待つ。
+        """
+        if self._writer is None:
+            return
+        self._write_snapshot()
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _write_snapshot(self) -> None:
+        self._seq += 1
+        self._updates_since_snapshot = 0
+        self._queue.put((self._seq, self.encode_snapshot(self._seq)))
+
+    def _write_loop(self) -> None:
+        journal_file: BinaryIO | None = None
+        try:
+            while (item := self._queue.get()) is not None:
+                seq, data = item
+                if seq < 0:
+                    if journal_file is not None:
+                        journal_file.write(data)
+                        journal_file.flush()
+                    continue
+                # スナップショットは書き終わってから置き換え、途中で落ちても壊れたものが残らないようにする
+                path = self._snapshot_path(seq)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(path + ".tmp", path)
+                if journal_file is not None:
+                    journal_file.close()
+                journal_file = open(self._journal_path(seq), "wb")
+                self._remove_old_files(seq)
+        except OSError:
+            self._logger.exception("failed to write the journal")
+        finally:
+            if journal_file is not None:
+                journal_file.close()
+
+    def _remove_old_files(self, seq: int) -> None:
+        for old_seq in self._list_snapshots():
+            if old_seq < seq:
+                for path in (self._snapshot_path(old_seq), self._journal_path(old_seq)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _list_snapshots(self) -> list[int]:
+        assert self._directory is not None
+        return [
+            int(match.group(1))
+            for name in os.listdir(self._directory)
+            if (match := SNAPSHOT_FILE_PATTERN.fullmatch(name)) is not None
+        ]
+
+    def _snapshot_path(self, seq: int) -> str:
+        assert self._directory is not None
+        return os.path.join(self._directory, f"snapshot-{seq}.bin")
+
+    def _journal_path(self, seq: int) -> str:
+        assert self._directory is not None
+        return os.path.join(self._directory, f"journal-{seq}.bin")
+
+
+def _train_command(train: Train) -> tuple[str | None, float, int | None, float]:
+    return (train.stop.id if train.stop else None, train.stop_distance, train.departure_time, train.speed_command)
+
+
+def _junction_directions(junction: Junction) -> tuple[PointDirection | None, PointDirection, PointDirection]:
+    return (junction.manual_direction, junction.current_direction, junction.direction_command)
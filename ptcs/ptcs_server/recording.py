@@ -0,0 +1,369 @@
+"""
+BLE で受け取った入力と API からの操作、列車やポイントに送った指令を記録し、あとから同じ入力で control を動かし直す。
+
+記録は JSON Lines 形式で、1 行目がヘッダー、2 行目以降が `[時刻, 種類, ID, 値]` の配列になる。
+時刻は記録を始めてからの秒数で、制御ループの tick も `tick` として記録する。
+ヘッダーの `snapshot` は記録を始めたときの control の状態 (ControlJournal のスナップショットを base64 にしたもの) で、
+ジャーナルから復元した状態から記録を始めても、再生は同じ状態から始められる。
+
+```
+{"format": 2, "layout_hash": "...", "snapshot": "UFRDSgE..."}
+[0.1003, "tick", "", null]
+[0.1421, "rotation", "t0", 1]
+[0.2007, "speed", "t0", 40.0]
+```
+
+再生では時計を進めずに (待たずに) 記録の順に入力を与え、
+記録された指令 (`speed`, `motor_input`, `direction`) のところで再生側が送るはずの指令と比べる。
+control の計算は決定的なので、同じ状態から同じ入力を同じ順で与えれば同じ指令が得られるはず。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+from ptcs_control.components.junction import PointDirection
+from ptcs_control.control.base import BaseControl
+
+from .journal import ControlJournal
+from .serializer import JSONObject
+
+RECORDING_FORMAT = 2
+
+MAX_REPORTED_DIVERGENCES = 20  # `ReplayResult.divergences` に残す食い違いの数
+
+# 種類ごとの値の意味
+#   tick        : なし (制御ループの 1 周期)
+#   rotation    : モーターの回転数
+#   position_uid: 読み取った位置の UID
+#   voltage     : 電池電圧[mV]
+#   collapse    : 電柱が倒れているか
+#   controller  : マスコンの値 (0〜255)
+#   move        : API で列車を進めた距離
+#   put         : API で列車を置いたセンサーの位置の ID
+#   manual_direction: API で指定した分岐点の方向 (解除なら null)
+#   obstacle    : API で障害物を発生させたか (撤去なら false)
+#   block       : API で区間を閉塞したか (解除なら false)
+#   update      : なし (API の操作の後の再計算)
+#   speed       : TrainSimulator に送った速度指令値
+#   motor_input : TrainClient に送ったモーターへの入力値
+#   direction   : ポイントに送った方向
+
+
+class SessionRecorder:
+    """入力と指令をファイルに記録する"""
+
+    _file: TextIO
+    _start: float
+
+    def __init__(self, path: str, layout_hash: str, snapshot: bytes) -> None:
+        """
+        `snapshot` には記録を始めるときの control の状態 (`ControlJournal.encode_snapshot`) を与える。
+        """
+        self._file = open(path, "w", encoding="utf-8")
+        self._start = time.monotonic()
+        header = {
+            "format": RECORDING_FORMAT,
+            "layout_hash": layout_hash,
+            "snapshot": base64.b64encode(snapshot).decode(),
+        }
+        self._file.write(json.dumps(header) + "\n")
+
+    def record(self, kind: str, id: str, value: Any) -> None:
+        self._file.write(json.dumps([round(time.monotonic() - self._start, 4), kind, id, value]) + "\n")
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BridgeInputs:
+    """
+    BLE で受け取った入力と API からの操作を control に適用し、列車やポイントに送る指令を計算する。
+    サーバーと再生で同じ処理を使うために、ここにまとめている。
+    `recorder` が指定されれば、入力と指令を記録する。
+
+    記録の順番がそのまま再生の順番になるので、すべての入力と指令は制御ループと同じスレッド (イベントループ) から与える。
+    最初に使われたスレッド以外から呼ばれたら RuntimeError を投げる
+    (API のエンドポイントを `def` にするとスレッドプールから呼ばれ、tick との順番が実行のたびに変わってしまう)。
+    """
+
+    _control: BaseControl
+    _journal: ControlJournal
+    _recorder: SessionRecorder | None
+    _logger: logging.Logger
+    _owner_thread: int | None  # 入力を与えてよいスレッド (最初に使われたときに決まる)
+    _directions: dict[str, tuple[PointDirection, float | None]]  # 分岐点ごとの、最後に見た向きとそれに変わった時刻
+
+    def __init__(
+        self,
+        control: BaseControl,
+        journal: ControlJournal,
+        recorder: SessionRecorder | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._control = control
+        self._journal = journal
+        self._recorder = recorder
+        self._logger = logger or logging.getLogger(__name__)
+        self._owner_thread = None
+        self._directions = {
+            junction_id: (junction_control.current_direction, None)
+            for junction_id, junction_control in control.junctions.items()
+        }
+
+    def tick(self) -> None:
+        """
+        制御ループの 1 周期分だけ時間を進め、再計算する。
+        """
+        self._record("tick", "", None)
+        self._journal.tick()
+        self._journal.update()
+        self._detect_direction_changes()
+        if self._recorder is not None:
+            self._recorder.flush()
+
+    def notify_rotation(self, train_id: str, rotation: int) -> None:
+        self._record("rotation", train_id, rotation)
+        train_control = self._control.trains.get(train_id)
+        if train_control is None:
+            return
+        self._journal.move_forward_mr(train_control, rotation)
+
+    def notify_position_uid(self, train_id: str, position_uid: str) -> None:
+        self._record("position_uid", train_id, position_uid)
+        train_control = self._control.trains.get(train_id)
+        position = next(filter(lambda sp: sp.uid == position_uid, self._control.sensor_positions.values()), None)
+        if train_control is None or position is None:
+            return
+        self._journal.fix_position(train_control, position)
+
+    def notify_voltage(self, train_id: str, voltage_mV: int) -> None:
+        self._record("voltage", train_id, voltage_mV)
+        train_control = self._control.trains.get(train_id)
+        if train_control is None:
+            return
+        self._journal.set_voltage(train_control, voltage_mV)
+
+    def notify_collapse(self, obstacle_id: str, is_collapsed: bool) -> None:
+        self._record("collapse", obstacle_id, is_collapsed)
+        obstacle_control = self._control.obstacles.get(obstacle_id)
+        if obstacle_control is None:
+            self._logger.warning(f"{obstacle_id} has no corresponding obstacle")
+            return
+        self._journal.set_obstacle_detected(obstacle_control, is_collapsed)
+
+    def notify_controller_speed(self, controller_id: str, speed: int) -> None:
+        self._record("controller", controller_id, speed)
+        train_control = self._control.trains.get(controller_id)
+        if train_control is None:
+            self._logger.warning(f"{controller_id} has no corresponding train")
+            return
+        self._journal.set_manual_speed(train_control, speed / 255 * train_control.max_speed)
+
+    # API からの操作 (存在しない ID なら KeyError を投げ、記録も適用もしない)
+
+    def move_train(self, train_id: str, delta: float) -> None:
+        train_control = self._control.trains[train_id]
+        self._record("move", train_id, delta)
+        self._journal.move_forward(train_control, delta)
+
+    def put_train(self, train_id: str, position_id: str) -> None:
+        train_control = self._control.trains[train_id]
+        position = self._control.sensor_positions[position_id]
+        self._record("put", train_id, position_id)
+        self._journal.fix_position(train_control, position)
+
+    def set_manual_direction(self, junction_id: str, direction: PointDirection | None) -> None:
+        junction_control = self._control.junctions[junction_id]
+        self._record("manual_direction", junction_id, None if direction is None else direction.value)
+        self._journal.set_manual_direction(junction_control, direction)
+
+    def set_obstacle_detected(self, obstacle_id: str, is_detected: bool) -> None:
+        obstacle_control = self._control.obstacles[obstacle_id]
+        self._record("obstacle", obstacle_id, is_detected)
+        self._journal.set_obstacle_detected(obstacle_control, is_detected)
+
+    def set_section_blocked(self, section_id: str, is_blocked: bool) -> None:
+        section_control = self._control.sections[section_id]
+        self._record("block", section_id, is_blocked)
+        self._journal.set_section_blocked(section_control, is_blocked)
+
+    def update(self) -> None:
+        """
+        API の操作の後に、時間を進めずに再計算する。
+        """
+        self._record("update", "", None)
+        self._journal.update()
+        self._detect_direction_changes()
+
+    def command_speed(self, train_id: str) -> float:
+        """TrainSimulator に送る速度指令値"""
+        speed = self._control.trains[train_id].speed_command
+        self._record("speed", train_id, speed)
+        return speed
+
+    def command_motor_input(self, train_id: str) -> int:
+        """TrainClient に送るモーターへの入力値"""
+        train_control = self._control.trains[train_id]
+        motor_input = train_control.calc_input(train_control.speed_command)
+        self._record("motor_input", train_id, motor_input)
+        return motor_input
+
+    def command_direction(self, junction_id: str) -> PointDirection:
+        """ポイントに送る方向"""
+        direction = self._control.junctions[junction_id].current_direction
+        self._record("direction", junction_id, direction.value)
+        return direction
+
+    def direction_changed_at(self, junction_id: str) -> float | None:
+        """
+        分岐点の向きが最後に変わった時刻 (time.monotonic())。まだ変わっていなければ None。
+        ポイントが指令を受け取るまでの遅れを測るためのもので、再生には使わない。
+        """
+        return self._directions[junction_id][1]
+
+    def _detect_direction_changes(self) -> None:
+        # 向きを変えうるのは再計算 (tick と update) だけなので、その直後に調べれば変わった時刻がわかる
+        now: float | None = None
+        for junction_id, (direction, _changed_at) in self._directions.items():
+            current_direction = self._control.junctions[junction_id].current_direction
+            if current_direction != direction:
+                if now is None:
+                    now = time.monotonic()
+                self._directions[junction_id] = (current_direction, now)
+
+    def _record(self, kind: str, id: str, value: Any) -> None:
+        thread = threading.get_ident()
+        if self._owner_thread is None:
+            self._owner_thread = thread
+        elif thread != self._owner_thread:
+            raise RuntimeError(f"{kind} must be given from the thread running the control loop")
+        if self._recorder is not None:
+            self._recorder.record(kind, id, value)
+
+
+@dataclass(frozen=True)
+class Divergence:
+    """記録された指令と、再生で得られた指令の食い違い"""
+
+    time: float
+    kind: str
+    id: str
+    recorded: Any
+    replayed: Any
+
+
+@dataclass
+class ReplayResult:
+    ticks: int = 0
+    events: int = 0
+    commands: int = 0  # 比べた指令の数
+    divergence_count: int = 0
+    divergences: list[Divergence] = field(default_factory=list)  # 最初の `MAX_REPORTED_DIVERGENCES` 個
+    virtual_seconds: float = 0.0  # 記録された時間の長さ
+    wall_seconds: float = 0.0  # 再生にかかった時間
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    @property
+    def speedup(self) -> float:
+        return self.virtual_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+def read_recording(path: str) -> tuple[JSONObject, Iterator[tuple[float, str, str, Any]]]:
+    """
+    記録を読み込み、ヘッダーと `(時刻, 種類, ID, 値)` のイテレーターを返す。
+    """
+    f = open(path, encoding="utf-8")
+    header = json.loads(f.readline())
+    if header.get("format") != RECORDING_FORMAT:
+        f.close()
+        raise ValueError(f"unsupported recording format {header.get('format')}")
+
+    def events() -> Iterator[tuple[float, str, str, Any]]:
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event_time, kind, id, value = json.loads(line)
+                except ValueError:
+                    return  # 書き込みの途中で落ちたために欠けた行
+                yield event_time, kind, id, value
+
+    return header, events()
+
+
+def replay_session(control: BaseControl, layout_hash: str, path: str) -> ReplayResult:
+    """
+    `path` の記録のヘッダーの状態を `control` に適用してから、記録の入力を時計を待たずに順に与える。
+    記録された指令のところで再生側の指令を計算し、食い違いを数える。
+    """
+    header, events = read_recording(path)
+    if header.get("layout_hash") != layout_hash:
+        raise ValueError(f"recording layout {header.get('layout_hash')} does not match {layout_hash}")
+
+    journal = ControlJournal(control, layout_hash, None)
+    journal.apply_snapshot(base64.b64decode(header["snapshot"]))
+    inputs = BridgeInputs(control, journal)
+    result = ReplayResult()
+
+    def compare(virtual_time: float, kind: str, id: str, recorded: Any, replayed: Any) -> None:
+        result.commands += 1
+        if replayed != recorded:
+            result.divergence_count += 1
+            if len(result.divergences) < MAX_REPORTED_DIVERGENCES:
+                result.divergences.append(Divergence(virtual_time, kind, id, recorded, replayed))
+
+    start = time.perf_counter()
+    for virtual_time, kind, id, value in events:
+        result.events += 1
+        result.virtual_seconds = virtual_time
+        match kind:
+            case "tick":
+                inputs.tick()
+                result.ticks += 1
+            case "rotation":
+                inputs.notify_rotation(id, value)
+            case "position_uid":
+                inputs.notify_position_uid(id, value)
+            case "voltage":
+                inputs.notify_voltage(id, value)
+            case "collapse":
+                inputs.notify_collapse(id, value)
+            case "controller":
+                inputs.notify_controller_speed(id, value)
+            case "move":
+                inputs.move_train(id, value)
+            case "put":
+                inputs.put_train(id, value)
+            case "manual_direction":
+                inputs.set_manual_direction(id, None if value is None else PointDirection(value))
+            case "obstacle":
+                inputs.set_obstacle_detected(id, value)
+            case "block":
+                inputs.set_section_blocked(id, value)
+            case "update":
+                inputs.update()
+            case "speed":
+                compare(virtual_time, kind, id, value, inputs.command_speed(id))
+            case "motor_input":
+                compare(virtual_time, kind, id, value, inputs.command_motor_input(id))
+            case "direction":
+                compare(virtual_time, kind, id, value, inputs.command_direction(id).value)
+            case _:
+                raise ValueError(f"unknown recording event {kind}")
+    result.wall_seconds = time.perf_counter() - start
+    return result
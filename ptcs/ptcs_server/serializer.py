@@ -0,0 +1,268 @@
+"""
+ptcs_control の状態を、pydantic.BaseModel を経由せずに直接 JSON に変換する。
+
+出力は types/state.py のモデル (`RailwayState` など) と同じスキーマになる。
+pydantic と同じ出力になるように、float のフィールドは float に変換してから書き出す。
+モデルは OpenAPI のスキーマとして残しておき、実行時の変換にはこちらを使う。
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, TypeVar
+
+from ptcs_control.components.junction import Junction
+from ptcs_control.components.obstacle import Obstacle
+from ptcs_control.components.position import DirectedPosition
+from ptcs_control.components.section import Section
+from ptcs_control.components.sensor_position import SensorPosition
+from ptcs_control.components.station import Station
+from ptcs_control.components.stop import Stop
+from ptcs_control.components.train import Train
+from ptcs_control.control.base import BaseControl
+
+from .geometry import RailwayGeometry
+from .types.state import get_distance_to_target_junction
+
+JSONObject = dict[str, Any]
+
+T = TypeVar("T")
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+
+
+def dump_json(obj: Any) -> bytes:
+    return _encoder.encode(obj).encode()
+
+
+STATE_COMPONENT_KINDS = ("junctions", "sections", "trains", "stops", "stations", "sensor_positions", "obstacles")
+
+
+@dataclass(frozen=True)
+class StateQuery:
+    """
+    `RailwayState` のうち、どのコンポーネントを含めるかの指定。
+    `ids` で種類ごとに ID を絞り込める。選ばれなかったコンポーネントは計算もしない。
+    """
+
+    include: frozenset[str]
+    ids: tuple[tuple[str, frozenset[str]], ...] = ()
+
+    @staticmethod
+    def parse(include: str | None, ids: Mapping[str, str | None]) -> StateQuery:
+        """
+        `include=trains,junctions` や `trains=t1,t2` のようなカンマ区切りの指定を読み取る。
+        `include` が無ければ、すべての種類を含める。
+        """
+        kinds = frozenset(STATE_COMPONENT_KINDS) if include is None else _split(include)
+        unknown_kinds = kinds - set(STATE_COMPONENT_KINDS)
+        if unknown_kinds:
+            raise ValueError(f"unknown component kinds: {', '.join(sorted(unknown_kinds))}")
+        return StateQuery(
+            include=kinds,
+            ids=tuple(sorted((kind, _split(value)) for kind, value in ids.items() if value is not None)),
+        )
+
+    @property
+    def key(self) -> str:
+        """キャッシュのキーに使う文字列"""
+        filters = ";".join(f"{kind}={','.join(sorted(ids))}" for kind, ids in self.ids)
+        return f"{','.join(sorted(self.include))};{filters}"
+
+    def select(self, kind: str, components: Mapping[str, T]) -> Iterator[T]:
+        """`kind` の種類のコンポーネントのうち、選ばれたものを順に返す。"""
+        ids = dict(self.ids).get(kind)
+        if ids is None:
+            yield from components.values()
+        else:
+            yield from (component for id, component in components.items() if id in ids)
+
+
+def state_to_dict(
+    control: BaseControl, query: StateQuery | None = None, geometry: RailwayGeometry | None = None
+) -> JSONObject:
+    """
+    `RailwayState` と同じスキーマの dict を作る。
+    `query` が指定されれば、選ばれたコンポーネントのみを含める。
+    `geometry` が指定されれば、列車の UI 上の座標 (`body_points`) を計算する。
+    """
+    state: JSONObject = {"current_time": control.current_time}
+    for kind in STATE_COMPONENT_KINDS:
+        if query is not None and kind not in query.include:
+            continue
+        components: Mapping[str, Any] = getattr(control, kind)
+        to_dict: Callable[[Any], JSONObject] = _STATE_COMPONENT_TO_DICT[kind]
+        if kind == "trains":
+            to_dict = partial(_train_to_dict, geometry=geometry)
+        selected = components.values() if query is None else query.select(kind, components)
+        state[kind] = {component.id: to_dict(component) for component in selected}
+    return state
+
+
+def _junction_to_dict(junction: Junction) -> JSONObject:
+    return {
+        "id": junction.id,
+        "connected_section_ids": {
+            connection.value: section.id for connection, section in junction.connected_sections.items()
+        },
+        "manual_direction": junction.manual_direction.value if junction.manual_direction else None,
+        "current_direction": junction.current_direction.value,
+        "direction_command": junction.direction_command.value,
+    }
+
+
+def _section_to_dict(section: Section) -> JSONObject:
+    return {
+        "id": section.id,
+        "length": float(section.length),
+        "connected_junction_ids": {
+            connection.value: junction.id for connection, junction in section.connected_junctions.items()
+        },
+        "is_blocked": section.is_blocked,
+    }
+
+
+def _train_to_dict(train: Train, geometry: RailwayGeometry | None = None) -> JSONObject:
+    return {
+        "id": train.id,
+        "min_input": train.min_input,
+        "max_input": train.max_input,
+        "max_speed": float(train.max_speed),
+        "length": float(train.length),
+        "delta_per_motor_rotation": float(train.delta_per_motor_rotation),
+        **_train_dynamic_items(train, geometry),
+    }
+
+
+def _stop_to_dict(stop: Stop) -> JSONObject:
+    return {"id": stop.id, "position": _directed_position(stop.position)}
+
+
+def _station_to_dict(station: Station) -> JSONObject:
+    return {"id": station.id, "stop_ids": [stop.id for stop in station.stops]}
+
+
+def _sensor_position_to_dict(sensor_position: SensorPosition) -> JSONObject:
+    return {
+        "id": sensor_position.id,
+        "section_id": sensor_position.section.id,
+        "mileage": float(sensor_position.mileage),
+        "target_junction_id": sensor_position.target_junction.id,
+    }
+
+
+def _obstacle_to_dict(obstacle: Obstacle) -> JSONObject:
+    return {
+        "id": obstacle.id,
+        "position": {"section_id": obstacle.position.section.id, "mileage": float(obstacle.position.mileage)},
+        "is_detected": obstacle.is_detected,
+    }
+
+
+_STATE_COMPONENT_TO_DICT: dict[str, Callable[[Any], JSONObject]] = {
+    "junctions": _junction_to_dict,
+    "sections": _section_to_dict,
+    "trains": _train_to_dict,
+    "stops": _stop_to_dict,
+    "stations": _station_to_dict,
+    "sensor_positions": _sensor_position_to_dict,
+    "obstacles": _obstacle_to_dict,
+}
+
+
+def dynamic_state_to_dict(
+    control: BaseControl,
+    *,
+    version: int,
+    layout_hash: str,
+    timestamp: float = 0.0,
+    geometry: RailwayGeometry | None = None,
+) -> JSONObject:
+    """
+    `RailwayDynamicState` と同じスキーマの dict を作る。
+    """
+    return {
+        "version": version,
+        "layout_hash": layout_hash,
+        "timestamp": float(timestamp),
+        "current_time": control.current_time,
+        "junctions": {junction.id: _junction_dynamic_to_dict(junction) for junction in control.junctions.values()},
+        "sections": {section.id: _section_dynamic_to_dict(section) for section in control.sections.values()},
+        "trains": {train.id: _train_dynamic_to_dict(train, geometry) for train in control.trains.values()},
+        "obstacles": {obstacle.id: _obstacle_dynamic_to_dict(obstacle) for obstacle in control.obstacles.values()},
+    }
+
+
+def dynamic_component_to_dict(
+    control: BaseControl, kind: str, id: str, geometry: RailwayGeometry | None = None
+) -> JSONObject:
+    """
+    `RailwayDynamicState` の `kind` (`junctions` など) のうち、`id` のコンポーネントひとつ分の dict を作る。
+    """
+    match kind:
+        case "junctions":
+            return _junction_dynamic_to_dict(control.junctions[id])
+        case "sections":
+            return _section_dynamic_to_dict(control.sections[id])
+        case "trains":
+            return _train_dynamic_to_dict(control.trains[id], geometry)
+        case "obstacles":
+            return _obstacle_dynamic_to_dict(control.obstacles[id])
+        case _:
+            raise ValueError(f"unknown dynamic component kind {kind}")
+
+
+def _junction_dynamic_to_dict(junction: Junction) -> JSONObject:
+    return {
+        "id": junction.id,
+        "manual_direction": junction.manual_direction.value if junction.manual_direction else None,
+        "current_direction": junction.current_direction.value,
+        "direction_command": junction.direction_command.value,
+    }
+
+
+def _section_dynamic_to_dict(section: Section) -> JSONObject:
+    return {"id": section.id, "is_blocked": section.is_blocked}
+
+
+def _train_dynamic_to_dict(train: Train, geometry: RailwayGeometry | None) -> JSONObject:
+    return {"id": train.id, **_train_dynamic_items(train, geometry)}
+
+
+def _obstacle_dynamic_to_dict(obstacle: Obstacle) -> JSONObject:
+    return {"id": obstacle.id, "is_detected": obstacle.is_detected}
+
+
+def _train_dynamic_items(train: Train, geometry: RailwayGeometry | None) -> JSONObject:
+    tail_position, covered_sections = train.head_position.get_retracted_position_with_path(train.length)
+    body_points = (
+        geometry.get_train_body_points(train.head_position, tail_position, covered_sections) if geometry else []
+    )
+    return {
+        "head_position": _directed_position(train.head_position),
+        "tail_position": _directed_position(tail_position),
+        "covered_section_ids": [section.id for section in covered_sections],
+        "stop_id": train.stop.id if train.stop else None,
+        "stop_distance": float(train.stop_distance),
+        "departure_time": train.departure_time,
+        "speed_command": float(train.speed_command),
+        "voltage_mV": train.voltage_mV,
+        "manual_speed": float(train.manual_speed) if train.manual_speed is not None else None,
+        "next_junction_distance": float(get_distance_to_target_junction(train.head_position)),
+        "body_points": [{"x": float(x), "y": float(y)} for x, y in body_points],
+    }
+
+
+def _directed_position(position: DirectedPosition) -> JSONObject:
+    return {
+        "section_id": position.section.id,
+        "target_junction_id": position.target_junction.id,
+        "mileage": float(position.mileage),
+    }
+
+
+def _split(value: str) -> frozenset[str]:
+    return frozenset(item.strip() for item in value.split(",") if item.strip())
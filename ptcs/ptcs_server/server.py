@@ -1,30 +1,51 @@
 import asyncio
 import logging
 import os
+import time
 
 import uvicorn
+from bleak.exc import BleakError
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
+from ptcs_bridge.command_filter import CommandFilter, WriteLatency
 from ptcs_bridge.master_controller_client import MasterControllerClient
 from ptcs_bridge.point_client import PointClient
 from ptcs_bridge.train_base import TrainBase
 from ptcs_bridge.train_client import TrainClient
 from ptcs_bridge.train_simulator import TrainSimulator
 from ptcs_bridge.wire_pole_client import WirePoleClient
+from ptcs_control.components.junction import PointDirection
 from ptcs_control.gogatsusai2024 import create_control
 
 from .api import api_router
+from .assets import StaticAssets
+from .geometry import RailwayGeometry
 from .gogatsusai2024 import create_bridge
+from .history import StateHistory
+from .journal import ControlJournal
+from .recording import BridgeInputs, SessionRecorder
+from .snapshot import StateCache
+from .stream import StateBroadcaster
 
 DEFAULT_PORT = 5000
+DEFAULT_MOTOR_KEEPALIVE = 1.0
+DEFAULT_POINT_REFRESH = 5.0
+
+# UI に表示する路線の座標 (ptcs_ui/src/config/ui.ts と同じもの)
+UI_PATH = "./data/gogatsusai2024/railway_ui_v5.json"
 
 
 class ServerArgs(BaseModel):
     port: int = DEFAULT_PORT
     bridge: bool = False
     debug: bool = False
+    journal: str | None = None  # 入力を記録するディレクトリ (`None` なら記録しない)
+    recover: bool = False  # 起動時に `journal` のディレクトリから前回の状態を復元する
+    record: str | None = None  # BLE の入力と指令を記録するファイル (scripts/replay_session.py で再生できる)
+    motor_keepalive: float = DEFAULT_MOTOR_KEEPALIVE  # 列車への指令が変わらなくても送り直す間隔[s] (0 なら毎回送る)
+    write_without_response: bool = False  # 列車への指令を応答なしで書き込む
+    point_refresh: float = DEFAULT_POINT_REFRESH  # ポイントの向きが変わらなくても送り直す間隔[s]
 
 
 def set_server_args(args: ServerArgs) -> None:
@@ -54,84 +75,198 @@ def create_app() -> FastAPI:
     control = create_control(logger=logger)
     app.state.control = control
 
+    geometry = RailwayGeometry.load(UI_PATH)
+    state_cache = StateCache(control, geometry)
+    app.state.state_cache = state_cache
+
+    journal = ControlJournal(control, state_cache.layout_hash, args.journal, logger=logger)
+    if args.recover:
+        # 前回落ちたときの状態を、スナップショットとその後の入力の記録から復元する
+        # (手で列車を置き直した後などに古い位置を復元しないよう、明示的に指定したときだけ行う)
+        recovery_start = time.perf_counter()
+        replayed_count = journal.recover()
+        if replayed_count is not None:
+            logger.info(
+                "recovered from the journal: %d records in %.1f ms",
+                replayed_count,
+                (time.perf_counter() - recovery_start) * 1000,
+            )
+        else:
+            logger.warning("nothing to recover in the journal %s", args.journal)
+    journal.start()
+    state_cache.publish()
+    app.state.journal = journal
+
+    # API からの操作も BridgeInputs を通すので、記録には BLE の入力と API の操作の両方が残る
+    # (ジャーナルから復元した状態から始めても再生できるように、記録を始めるときの状態も残す)
+    recorder = (
+        SessionRecorder(args.record, state_cache.layout_hash, journal.encode_snapshot(0)) if args.record else None
+    )
+    inputs = BridgeInputs(control, journal, recorder, logger=logger)
+    app.state.inputs = inputs
+
+    state_broadcaster = StateBroadcaster(control, state_cache, journal.versions)
+    app.state.state_broadcaster = state_broadcaster
+
+    state_history = StateHistory(control, state_cache.index)
+    app.state.state_history = state_history
+
     # `/api` 以下で API を呼び出す
     app.include_router(api_router, prefix="/api")
 
-    # `/` 以下で静的ファイルを配信する
-    app.mount("/", StaticFiles(directory="./ptcs_ui/dist", html=True), name="static")
+    # `/` 以下で静的ファイルを配信する (起動時にメモリに読み込む)
+    app.mount("/", StaticAssets(directory="./ptcs_ui/dist"), name="static")
 
     bridge = create_bridge()
     app.state.bridge = bridge
+    for train_client in bridge.trains.values():
+        match train_client:
+            case TrainClient():
+                train_client.write_without_response = args.write_without_response
 
     async def control_loop():
         while True:
             # control 内部の時計を現実世界の時間において進める
             await asyncio.sleep(0.1)
-            control.tick()
-            control.update()
+            inputs.tick()
+            version = state_cache.publish()
+            state_history.record(control, version)
+            state_broadcaster.broadcast()
 
     control_loop_task = asyncio.create_task(control_loop())
     app.state.control_loop_task = control_loop_task
 
     async def train_loop(train_client: TrainBase):
-        await train_client.connect()
-
         def handle_notify_position_uid(train_client: TrainBase, position_uid: str):
-            train_control = control.trains.get(train_client.id)
-            position = next(filter(lambda sp: sp.uid == position_uid, control.sensor_positions.values()), None)
-            if train_control is None or position is None:
-                return
-            train_control.fix_position(position)
-
-        def handle_notify_rotation(train_client: TrainBase, _rotation: int):
-            train_control = control.trains.get(train_client.id)
-            if train_control is None:
-                return
-            train_control.move_forward_mr(1)
-
-        def handle_notify_voltage(train_client: TrainBase, _voltage_mV: int):
-            train_control = control.trains.get(train_client.id)
-            if train_control is None:
-                return
-            train_control.voltage_mV = _voltage_mV
-
-        await train_client.start_notify_rotation(handle_notify_rotation)
-        match train_client:
-            case TrainClient():
-                await train_client.start_notify_position_uid(handle_notify_position_uid)
-                await train_client.start_notify_voltage(handle_notify_voltage)
+            inputs.notify_position_uid(train_client.id, position_uid)
+
+        def handle_notify_rotation(train_client: TrainBase, rotation: int):
+            inputs.notify_rotation(train_client.id, rotation)
+
+        def handle_notify_voltage(train_client: TrainBase, voltage_mV: int):
+            inputs.notify_voltage(train_client.id, voltage_mV)
+
+        # 指令が変わったときと、キープアライブの間隔が経ったときだけ送る
+        command_filter = train_command_filters[train_client.id]
+
+        async def connect():
+            await train_client.connect()
+            await train_client.start_notify_rotation(handle_notify_rotation)
+            await train_client.start_notify_position_uid(handle_notify_position_uid)
+            await train_client.start_notify_voltage(handle_notify_voltage)
+            # 接続し直した機器は指令を覚えているかわからないので、次の指令は変わっていなくても必ず送る
+            command_filter.reset()
+
+        await connect()
 
         train_control = control.trains.get(train_client.id)
         if train_control is None:
             logger.warn(f"{train_client} has no corresponding train")
             return
 
+        match train_client:
+            case TrainSimulator():
+                # シミュレーターを control の列車の初期位置に置き、センサーの上を通ったら UID を通知させる
+                train_client.place(train_control, control.sensor_positions.values())
+
         while True:
             await asyncio.sleep(0.2)
             match train_client:
-                case TrainSimulator():
-                    await train_client.send_speed(train_control.speed_command)
-                case TrainClient():
-                    motor_input = train_control.calc_input(train_control.speed_command)
-                    await train_client.send_motor_input(motor_input)
-
+                case TrainClient(is_connected=False):
+                    logger.warning("%s disconnected, reconnecting", train_client)
+                    try:
+                        await connect()
+                    except (BleakError, asyncio.TimeoutError) as e:
+                        logger.warning("%s failed to reconnect: %s", train_client, e)
+                case TrainSimulator(dynamics=None):
+                    speed = inputs.command_speed(train_client.id)
+                    if command_filter.should_send(speed):
+                        await train_client.send_speed(speed)
+                case TrainSimulator() | TrainClient():
+                    # 動特性のモデルを持つシミュレーターには、実機と同じくモーターへの入力値を送る
+                    motor_input = inputs.command_motor_input(train_client.id)
+                    if command_filter.should_send(motor_input):
+                        try:
+                            await train_client.send_motor_input(motor_input)
+                        except BleakError as e:
+                            # 届かなかったので、次の周期に送り直す
+                            logger.warning("%s failed to send motor input: %s", train_client, e)
+                            command_filter.reset()
+
+    train_command_filters: dict[str, CommandFilter[float | int]] = {
+        train_id: CommandFilter(args.motor_keepalive) for train_id in bridge.trains
+    }
+    app.state.train_command_filters = train_command_filters
     app.state.train_loop_tasks = {}
     for train_id, train_client in bridge.trains.items():
         train_loop_task = asyncio.create_task(train_loop(train_client))
         app.state.train_loop_tasks[train_id] = train_loop_task
 
     async def point_loop(point_client: PointClient):
-        await point_client.connect()
+        # 向きが変わったときと、書き込みが失われたときのために `point_refresh` 秒ごとにだけ送る
+        command_filter = point_command_filters[point_client.id]
+
+        async def connect():
+            await point_client.connect()
+            # 接続し直したポイントは向きを覚えているかわからないので、次の指令は変わっていなくても必ず送る
+            command_filter.reset()
+
+        await connect()
 
         junction_control = control.junctions.get(point_client.id)
         if junction_control is None:
             logger.warn(f"{point_client} has no corresponding junction")
             return
 
+        acknowledged_change_at = inputs.direction_changed_at(point_client.id)
+        acknowledged_direction: PointDirection | None = None
         while True:
             await asyncio.sleep(0.2)
-            await point_client.send_direction(junction_control.current_direction)
-
+            if not point_client.is_connected:
+                logger.warning("%s disconnected, reconnecting", point_client)
+                try:
+                    await connect()
+                except (BleakError, asyncio.TimeoutError) as e:
+                    logger.warning("%s failed to reconnect: %s", point_client, e)
+                continue
+
+            direction = inputs.command_direction(point_client.id)
+            if not command_filter.should_send(direction):
+                continue
+
+            # 書き込みを待つ間に API などから向きが変わっても取り違えないよう、送る向きが決まった時刻を先に取っておく
+            changed_at = inputs.direction_changed_at(point_client.id)
+            write_start = time.monotonic()
+            try:
+                await point_client.send_direction(direction)
+            except BleakError as e:
+                # 届かなかったので、次の周期に送り直す
+                logger.warning("%s failed to send direction: %s", point_client, e)
+                command_filter.reset()
+                continue
+            acknowledged_at = time.monotonic()
+
+            # 向きが変わってから最初に確認された書き込みについて、向きが変わってからの遅れを記録する
+            # (送る前に元の向きに戻っていたなら、ポイントは動いていないので数えない)
+            is_new_change = changed_at != acknowledged_change_at and direction != acknowledged_direction
+            acknowledged_change_at = changed_at
+            acknowledged_direction = direction
+            if changed_at is not None and is_new_change:
+                point_write_latencies[point_client.id].add(acknowledged_at - changed_at)
+                logger.info(
+                    "%s acknowledged %s %.0f ms after the change (write %.0f ms)",
+                    point_client,
+                    direction.value,
+                    (acknowledged_at - changed_at) * 1000,
+                    (acknowledged_at - write_start) * 1000,
+                )
+
+    point_command_filters: dict[str, CommandFilter[PointDirection]] = {
+        point_id: CommandFilter(args.point_refresh) for point_id in bridge.points
+    }
+    app.state.point_command_filters = point_command_filters
+    point_write_latencies: dict[str, WriteLatency] = {point_id: WriteLatency() for point_id in bridge.points}
+    app.state.point_write_latencies = point_write_latencies
     app.state.point_loop_tasks = {}
     for point_id, point_client in bridge.points.items():
         app.state.point_loop_tasks[point_id] = asyncio.create_task(point_loop(point_client))
@@ -140,11 +275,7 @@ def create_app() -> FastAPI:
         await obstacle_client.connect()
 
         def handle_notify_collapse(obstacle_client: WirePoleClient, is_collapsed: bool):
-            obstacle_control = control.obstacles.get(obstacle_client.id)
-            if obstacle_control is None:
-                logger.warn(f"{obstacle_client} has no corresponding obstacle")
-                return
-            obstacle_control.is_detected = is_collapsed
+            inputs.notify_collapse(obstacle_client.id, is_collapsed)
 
         await obstacle_client.start_notify_collapse(handle_notify_collapse)
 
@@ -156,11 +287,7 @@ def create_app() -> FastAPI:
         await controller_client.connect()
 
         def handle_notify_speed(controller_client: MasterControllerClient, speed: int):
-            train_control = control.trains.get(controller_client.id)
-            if train_control is None:
-                logger.warn(f"{controller_client} has no corresponding train")
-                return
-            train_control.manual_speed = speed / 255 * train_control.max_speed
+            inputs.notify_controller_speed(controller_client.id, speed)
 
         await controller_client.start_notify_speed(handle_notify_speed)
 
@@ -170,26 +297,69 @@ def create_app() -> FastAPI:
 
     @app.on_event("shutdown")
     async def on_shutdown():
+        for train_id, command_filter in train_command_filters.items():
+            logger.info("train %s writes: %s", train_id, command_filter)
+        for point_id, command_filter in point_command_filters.items():
+            logger.info(
+                "point %s writes: %s, latency from set_direction: %s",
+                point_id,
+                command_filter,
+                point_write_latencies[point_id],
+            )
+
         for train in bridge.trains.values():
             match train:
-                case TrainSimulator():
+                case TrainSimulator(dynamics=None):
                     await train.send_speed(0.0)
+                case TrainSimulator():
+                    await train.send_motor_input(0)
                 case TrainClient():
                     if train.is_connected:
                         await train.send_motor_input(0)
 
         await bridge.disconnect_all()
+        journal.close()
+        if recorder is not None:
+            recorder.close()
 
     return app
 
 
-def serve(*, port: int = DEFAULT_PORT, bridge: bool = False, debug: bool = False) -> None:
+def serve(
+    *,
+    port: int = DEFAULT_PORT,
+    bridge: bool = False,
+    debug: bool = False,
+    journal: str | None = None,
+    recover: bool = False,
+    record: str | None = None,
+    motor_keepalive: float = DEFAULT_MOTOR_KEEPALIVE,
+    write_without_response: bool = False,
+    point_refresh: float = DEFAULT_POINT_REFRESH,
+) -> None:
     """
     列車制御システムを Web サーバーとして起動する。
     `debug` を `True` にすると、ソースコードに変更があったときにリロードされる。
+    `journal` のディレクトリに入力を記録し、`recover` を `True` にすると起動時にそこから前回の状態を復元する。
+    `record` を指定すると、BLE の入力と指令をそのファイルに記録する。
+    列車への指令は変わったときと `motor_keepalive` 秒ごとにだけ送り、
+    `write_without_response` を `True` にすると応答なしで書き込む (ファームウェアが対応していれば)。
+    ポイントへの指令は、向きが変わったときと `point_refresh` 秒ごとにだけ送る。
     """
 
-    set_server_args(ServerArgs(port=port, bridge=bridge, debug=debug))
+    set_server_args(
+        ServerArgs(
+            port=port,
+            bridge=bridge,
+            debug=debug,
+            journal=journal,
+            recover=recover,
+            record=record,
+            motor_keepalive=motor_keepalive,
+            write_without_response=write_without_response,
+            point_refresh=point_refresh,
+        )
+    )
 
     if debug:
         uvicorn.run(
@@ -0,0 +1,194 @@
+"""
+ptcs_control の状態を tick ごとに一度だけ JSON に変換し、使い回す。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from functools import cached_property
+
+from ptcs_control.control.base import BaseControl
+
+from .binary import StateIndex, encode_state_message
+from .compression import compress_gzip
+from .geometry import RailwayGeometry
+from .serializer import StateQuery, dump_json, dynamic_state_to_dict, state_to_dict
+from .types.state import get_topology_from_control
+
+MAX_QUERY_SNAPSHOTS = 64  # 同じバージョンに対して保持しておく、コンポーネントを選んだ状態の数
+
+
+@dataclass(frozen=True)
+class StateSnapshot:
+    """ある時点の状態を JSON に変換したもの"""
+
+    version: int
+    body: bytes
+    etag: str
+
+    @cached_property
+    def gzip_body(self) -> bytes:
+        """gzip で圧縮したもの。最初に必要になったときに一度だけ圧縮する。"""
+        return compress_gzip(self.body)
+
+
+class StateCache:
+    """
+    状態のバージョンを管理し、バージョンごとに一度だけ状態を JSON に変換して保持する。
+
+    状態に変化が起こったら `publish()` を呼んでバージョンを進めること。
+    変換は `get()` などが最初に呼ばれたときに行われるので、誰も状態を取得しなければ変換は行われない。
+    路線の構成は実行中に変化しないので、初期化時に一度だけ変換する。
+    """
+
+    _control: BaseControl
+    _geometry: RailwayGeometry | None  # 列車の UI 上の座標を計算するのに使う
+    _epoch: str
+    _version: int
+    _timestamp: float  # 現在のバージョンが発行された時刻 (UNIX 時間、秒)
+    _snapshot: StateSnapshot | None
+    _query_snapshots: dict[str, StateSnapshot]  # 現在のバージョンの、コンポーネントを選んだ状態
+    _dynamic_snapshot: StateSnapshot | None
+    _dynamic_binary_snapshot: StateSnapshot | None
+    _topology_snapshot: StateSnapshot
+    _layout_hash: str
+    _index: StateIndex
+
+    def __init__(self, control: BaseControl, geometry: RailwayGeometry | None = None) -> None:
+        self._control = control
+        self._geometry = geometry
+        # サーバーを再起動するとバージョンが 0 に戻るので、古い ETag と衝突しないようにする
+        self._epoch = os.urandom(4).hex()
+        self._version = 0
+        self._timestamp = time.time()
+        self._snapshot = None
+        self._query_snapshots = {}
+        self._dynamic_snapshot = None
+        self._dynamic_binary_snapshot = None
+        self._index = StateIndex.from_control(control)
+
+        topology = get_topology_from_control(control)
+        self._layout_hash = topology.layout_hash
+        self._topology_snapshot = StateSnapshot(
+            version=0,
+            body=topology.model_dump_json().encode(),
+            etag=f'"{topology.layout_hash}"',
+        )
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def timestamp(self) -> float:
+        return self._timestamp
+
+    @property
+    def layout_hash(self) -> str:
+        return self._layout_hash
+
+    @property
+    def index(self) -> StateIndex:
+        return self._index
+
+    @property
+    def geometry(self) -> RailwayGeometry | None:
+        return self._geometry
+
+    def publish(self) -> int:
+        """
+        状態に変化が起こったことを知らせ、新しいバージョンを返す。
+        """
+        self._version += 1
+        self._timestamp = time.time()
+        return self._version
+
+    def get(self) -> StateSnapshot:
+        """
+        現在のバージョンの状態 (`RailwayState`) を返す。
+        """
+        if self._snapshot is None or self._snapshot.version != self._version:
+            self._snapshot = self._create_snapshot(dump_json(state_to_dict(self._control, geometry=self._geometry)))
+        return self._snapshot
+
+    def get_query(self, query: StateQuery) -> StateSnapshot:
+        """
+        現在のバージョンの状態 (`RailwayState`) のうち、`query` で選ばれたコンポーネントのみを返す。
+        同じバージョンの同じ `query` に対しては、変換した結果を使い回す。
+        """
+        if self._query_snapshots and next(iter(self._query_snapshots.values())).version != self._version:
+            self._query_snapshots.clear()
+        key = query.key
+        snapshot = self._query_snapshots.get(key)
+        if snapshot is None:
+            if len(self._query_snapshots) >= MAX_QUERY_SNAPSHOTS:
+                self._query_snapshots.clear()
+            query_hash = hashlib.sha256(key.encode()).hexdigest()[:8]
+            body = dump_json(state_to_dict(self._control, query, self._geometry))
+            snapshot = self._query_snapshots[key] = self._create_snapshot(body, etag_suffix=f"-{query_hash}")
+        return snapshot
+
+    def get_dynamic(self) -> StateSnapshot:
+        """
+        現在のバージョンの実行中に変化する状態 (`RailwayDynamicState`) を返す。
+        """
+        if self._dynamic_snapshot is None or self._dynamic_snapshot.version != self._version:
+            state = dynamic_state_to_dict(
+                self._control,
+                version=self._version,
+                layout_hash=self._layout_hash,
+                timestamp=self._timestamp,
+                geometry=self._geometry,
+            )
+            self._dynamic_snapshot = self._create_snapshot(dump_json(state))
+        return self._dynamic_snapshot
+
+    def get_dynamic_binary(self) -> StateSnapshot:
+        """
+        現在のバージョンの実行中に変化する状態をバイナリ形式 (`binary.MEDIA_TYPE`) で返す。
+        """
+        if self._dynamic_binary_snapshot is None or self._dynamic_binary_snapshot.version != self._version:
+            state = dynamic_state_to_dict(
+                self._control,
+                version=self._version,
+                layout_hash=self._layout_hash,
+                timestamp=self._timestamp,
+                geometry=self._geometry,
+            )
+            body = encode_state_message(
+                self._index,
+                type="snapshot",
+                version=self._version,
+                since=None,
+                layout_hash=self._layout_hash,
+                timestamp=state["timestamp"],
+                current_time=state["current_time"],
+                junctions=state["junctions"],
+                sections=state["sections"],
+                trains=state["trains"],
+                obstacles=state["obstacles"],
+            )
+            self._dynamic_binary_snapshot = self._create_snapshot(body, etag_suffix="-bin")
+        return self._dynamic_binary_snapshot
+
+    def get_topology(self) -> StateSnapshot:
+        """
+        路線の構成 (`RailwayTopology`) を返す。ETag は `layout_hash` になる。
+        """
+        return self._topology_snapshot
+
+    def _create_snapshot(self, body: bytes, *, etag_suffix: str = "") -> StateSnapshot:
+        return StateSnapshot(version=self._version, body=body, etag=f'"{self._epoch}-{self._version}{etag_suffix}"')
+
+
+def is_etag_matched(if_none_match: str | None, etag: str) -> bool:
+    """
+    `If-None-Match` ヘッダーが ETag に一致するかを判定する。
+    """
+    if if_none_match is None:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
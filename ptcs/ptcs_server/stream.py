@@ -0,0 +1,290 @@
+"""
+実行中に変化する状態を、差分として複数のクライアントに配信する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass
+from functools import cached_property
+
+from ptcs_control.control.base import BaseControl
+
+from .binary import StateIndex, encode_state_message
+from .compression import compress_gzip
+from .geometry import RailwayGeometry
+from .journal import ComponentVersions
+from .serializer import JSONObject, dump_json, dynamic_component_to_dict
+from .snapshot import StateCache
+
+COMPONENT_KINDS = ("junctions", "sections", "trains", "obstacles")
+
+MAX_PENDING_MESSAGES = 4  # 購読者ごとに溜めておける送信待ちメッセージの数
+LONG_POLL_TIMEOUT = 30.0  # ロングポーリングで状態の変化を待つ最大の秒数
+
+
+@dataclass(frozen=True)
+class StateMessage:
+    """配信するメッセージ (`RailwayStateDelta` を JSON に変換したもの)"""
+
+    version: int
+    body: bytes
+
+    @cached_property
+    def text(self) -> str:
+        return self.body.decode()
+
+    @cached_property
+    def gzip_body(self) -> bytes:
+        return compress_gzip(self.body)
+
+
+@dataclass
+class ComponentFragment:
+    """コンポーネントひとつ分の状態とその JSON、およびそれが最後に変化したバージョン"""
+
+    version: int
+    state: JSONObject
+    body: bytes
+
+
+class StateDeltaTracker:
+    """
+    実行中に変化する状態をコンポーネントごとに JSON に変換し、
+    コンポーネントごとに最後に変化したバージョンを記録する。
+
+    `versions` (ControlJournal が入力を適用するたびに進める) を見て、前回から状態が変わりうるコンポーネントだけを変換し直す。
+    """
+
+    version: int
+    timestamp: float  # `version` が発行された時刻
+    current_time: int
+    _base_version: int  # 最初に状態を読み取ったバージョン
+    _layout_hash: str
+    _geometry: RailwayGeometry | None
+    _versions: ComponentVersions
+    _read_version: int  # 最後に状態を読み取ったときの `_versions.version`
+    _fragments: dict[str, dict[str, ComponentFragment]]
+
+    def __init__(self, layout_hash: str, versions: ComponentVersions, geometry: RailwayGeometry | None = None) -> None:
+        self.version = -1
+        self.timestamp = 0.0
+        self.current_time = 0
+        self._base_version = -1
+        self._layout_hash = layout_hash
+        self._geometry = geometry
+        self._versions = versions
+        self._read_version = -1
+        self._fragments = {kind: {} for kind in COMPONENT_KINDS}
+
+    def update(self, control: BaseControl, version: int, timestamp: float) -> None:
+        """
+        control の状態を読み取り、前回から変化したコンポーネントのバージョンを `version` にする。
+        """
+        if self._read_version != self._versions.version:
+            for kind in COMPONENT_KINDS:
+                fragments = self._fragments[kind]
+                for id, component_version in self._versions.get(kind).items():
+                    fragment = fragments.get(id)
+                    if fragment is not None and component_version <= self._read_version:
+                        continue
+                    component = dynamic_component_to_dict(control, kind, id, self._geometry)
+                    body = dump_json(component)
+                    if fragment is None:
+                        fragments[id] = ComponentFragment(version=version, state=component, body=body)
+                    elif fragment.body != body:
+                        fragment.version = version
+                        fragment.state = component
+                        fragment.body = body
+            self._read_version = self._versions.version
+        if self._base_version < 0:
+            self._base_version = version
+        self.version = version
+        self.timestamp = timestamp
+        self.current_time = control.current_time
+
+    def covers(self, since: int) -> bool:
+        """
+        `since` からの差分を作れるかを判定する。
+        最初に状態を読み取る前のバージョンや、未来のバージョン (サーバーの再起動前のものなど) からの差分は作れない。
+        """
+        return self._base_version <= since <= self.version
+
+    def encode(self, since: int | None) -> StateMessage:
+        """
+        `since` が `None` ならすべてのコンポーネントを、
+        そうでなければ `since` より後に変化したコンポーネントのみを含むメッセージを作る。
+        """
+        header = {
+            "type": "snapshot" if since is None else "delta",
+            "version": self.version,
+            "since": since,
+            "layout_hash": self._layout_hash,
+            "timestamp": float(self.timestamp),
+            "current_time": self.current_time,
+        }
+        parts = [json.dumps(header, separators=(",", ":")).encode()[:-1]]
+        for kind in COMPONENT_KINDS:
+            items = b",".join(
+                json.dumps(id).encode() + b":" + fragment.body
+                for id, fragment in self._fragments[kind].items()
+                if since is None or fragment.version > since
+            )
+            parts.append(b',"' + kind.encode() + b'":{' + items + b"}")
+        parts.append(b"}")
+        return StateMessage(version=self.version, body=b"".join(parts))
+
+    def encode_binary(self, since: int | None, index: StateIndex) -> StateMessage:
+        """
+        `encode()` と同じ内容のメッセージをバイナリ形式 (`binary.MEDIA_TYPE`) で作る。
+        """
+        components = {
+            kind: {
+                id: fragment.state
+                for id, fragment in self._fragments[kind].items()
+                if since is None or fragment.version > since
+            }
+            for kind in COMPONENT_KINDS
+        }
+        body = encode_state_message(
+            index,
+            type="snapshot" if since is None else "delta",
+            version=self.version,
+            since=since,
+            layout_hash=self._layout_hash,
+            timestamp=self.timestamp,
+            current_time=self.current_time,
+            junctions=components["junctions"],
+            sections=components["sections"],
+            trains=components["trains"],
+            obstacles=components["obstacles"],
+        )
+        return StateMessage(version=self.version, body=body)
+
+
+class StateSubscriber:
+    """配信先のクライアントひとつ分の送信待ちメッセージ"""
+
+    queue: asyncio.Queue[StateMessage]
+    binary: bool  # バイナリ形式 (`binary.MEDIA_TYPE`) のメッセージを受け取るか
+    conflated_count: int  # 送信が追いつかずにメッセージをまとめた回数
+
+    def __init__(self, binary: bool = False) -> None:
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING_MESSAGES)
+        self.binary = binary
+        self.conflated_count = 0
+
+    async def get(self) -> StateMessage:
+        return await self.queue.get()
+
+
+class StateBroadcaster:
+    """
+    tick ごとに状態の差分を一度だけ JSON に変換し、すべての購読者に配る。
+    JSON に変換し直すのは、前回からバージョンが進んだコンポーネントだけである。
+
+    送信が追いつかない購読者に対しては、溜まったメッセージを捨てて最新のスナップショットに置き換える。
+    これにより、遅いクライアントが制御ループを待たせることはない。
+
+    ロングポーリングのクライアントに対しては、`wait_for_update()` で状態の変化を待ってから
+    `get_message()` で差分を返す。同じバージョンからの差分は一度だけ JSON に変換して使い回す。
+    """
+
+    _control: BaseControl
+    _state_cache: StateCache
+    _tracker: StateDeltaTracker
+    _subscribers: set[StateSubscriber]
+    _messages: dict[tuple[int | None, bool], StateMessage]  # 現在のバージョンへの差分 (since, バイナリ形式か)
+    _broadcast_version: int  # 最後に購読者に配ったバージョン
+    _notified_version: int
+    _updated: asyncio.Event
+
+    def __init__(self, control: BaseControl, state_cache: StateCache, versions: ComponentVersions) -> None:
+        """
+        `versions` には、control への入力を適用する ControlJournal の `versions` を与える。
+        """
+        self._control = control
+        self._state_cache = state_cache
+        # 起動時のバージョンから読み取っておき、このサーバーが発行したどのバージョンからも差分を作れるようにする
+        self._tracker = StateDeltaTracker(state_cache.layout_hash, versions, state_cache.geometry)
+        self._tracker.update(control, state_cache.version, state_cache.timestamp)
+        self._subscribers = set()
+        self._messages = {}
+        self._broadcast_version = state_cache.version
+        self._notified_version = state_cache.version
+        self._updated = asyncio.Event()
+
+    def subscribe(self, binary: bool = False) -> StateSubscriber:
+        """
+        購読者を登録し、最初のメッセージとして現在のスナップショットを積む。
+        `binary` が真なら、以降もバイナリ形式 (`binary.MEDIA_TYPE`) のメッセージを積む。
+        """
+        subscriber = StateSubscriber(binary)
+        subscriber.queue.put_nowait(self.get_message(None, binary=binary))
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: StateSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def broadcast(self) -> None:
+        """
+        前回の配信以降に状態が変化していれば、差分を購読者に配り、
+        ロングポーリングで待っているクライアントを起こす。
+        制御ループから tick ごとに呼ぶこと。
+        """
+        version = self._state_cache.version
+        if version != self._notified_version:
+            self._notified_version = version
+            self._updated.set()
+            self._updated = asyncio.Event()
+
+        since = self._broadcast_version
+        if since == version:
+            return
+        self._broadcast_version = version
+        if not self._subscribers:
+            return
+        for subscriber in self._subscribers:
+            # 形式ごとに一度だけ変換され、`_messages` で使い回される
+            delta = self.get_message(since, binary=subscriber.binary)
+            try:
+                subscriber.queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(self.get_message(None, binary=subscriber.binary))
+                subscriber.conflated_count += 1
+
+    def get_message(self, since: int | None, *, binary: bool = False) -> StateMessage:
+        """
+        `since` から現在のバージョンへの差分を返す。
+        `since` が `None` の場合や、`since` からの差分を作れない場合はスナップショットを返す。
+        `binary` が真ならバイナリ形式 (`binary.MEDIA_TYPE`) で返す。
+        """
+        version = self._state_cache.version
+        if self._tracker.version != version:
+            self._tracker.update(self._control, version, self._state_cache.timestamp)
+            self._messages = {}
+        if since is not None and not self._tracker.covers(since):
+            since = None
+        message = self._messages.get((since, binary))
+        if message is None:
+            if binary:
+                message = self._tracker.encode_binary(since, self._state_cache.index)
+            else:
+                message = self._tracker.encode(since)
+            self._messages[(since, binary)] = message
+        return message
+
+    async def wait_for_update(self, since: int, timeout: float = LONG_POLL_TIMEOUT) -> None:
+        """
+        状態のバージョンが `since` から変わるか、`timeout` 秒経つまで待つ。
+        """
+        try:
+            async with asyncio.timeout(timeout):
+                while self._state_cache.version == since:
+                    await self._updated.wait()
+        except TimeoutError:
+            pass
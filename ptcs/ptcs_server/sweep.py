@@ -0,0 +1,254 @@
+"""
+制御のパラメーター (ブレーキ減速度、常用加減速度、停止余裕距離、最高速度、停車時間) と列車の種別の組み合わせを総当たりし、
+それぞれを仮想的な時刻で走らせて (headless.py)、結果を列ごとの配列の JSON に書き出す。
+FixedBlockControl は最高速度と停車時間しか使わないので、`--control fixed_block` ではほかのパラメーターは指定できない。
+
+組み合わせと乱数の種ごとの走行は、ProcessPoolExecutor で CPU のコアの数だけ並列に動かす。
+乱数の種は、列車ごとの走行距離の誤差 (`odometry_error`) を決めるのに使う。
+
+```
+{"break_acclt": [8.0, 10.0, ...], "stoppage_time": [30, 30, ...], ..., "min_headway_cm": [52.3, 48.0, ...]}
+```
+
+使い方:
+    poetry run python -m ptcs_server.sweep --max-speed 30,40,50 --stoppage-time 20,30 --seeds 4 -o sweep.json
+    poetry run python -m ptcs_server.sweep --control moving_block --synthetic-sections 200 --mergin 15,25,35
+    poetry run python -m ptcs_server.sweep --dynamics dynamics.json --stoppage-time 20,30,40 --seeds 8
+
+読み込み:
+    pandas.DataFrame(json.load(open("sweep.json")))
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import click
+
+from ptcs_bridge.train_dynamics import load_train_dynamics
+from ptcs_control import gogatsusai2024, gogatsusai2024_generated, synthetic
+from ptcs_control.components.train import TrainType
+from ptcs_control.control.base import BaseControl
+from ptcs_control.control.fixed_block import FixedBlockControl
+from ptcs_control.control.moving_block import MovingBlockControl
+
+from .headless import CONTROL_INTERVAL_SECONDS, HeadlessRunner
+
+CONTROL_CLASSES: dict[str, type[FixedBlockControl | MovingBlockControl]] = {
+    "fixed_block": FixedBlockControl,
+    "moving_block": MovingBlockControl,
+}
+
+# `SweepCase.fleet` で列車の種別を表す文字
+FLEET_TYPES = {
+    "E": TrainType.LimitedExpress,
+    "S": TrainType.CommuterSemiExpress,
+    "L": TrainType.Local,
+}
+
+
+@dataclass(frozen=True)
+class SweepSettings:
+    """すべての走行に共通する設定"""
+
+    duration: float  # 1 回の走行でシミュレーションする秒数
+    control: str  # `CONTROL_CLASSES` のキー
+    synthetic_sections: int | None  # 指定すれば、このセクション数の路線を自動生成して使う (無ければ gogatsusai2024)
+    synthetic_trains: int
+    odometry_error_sigma: float  # 列車ごとの走行距離の誤差の標準偏差
+    dynamics_path: str | None  # 列車の動特性のファイル (無ければ速度指令どおりに即座に加減速する)
+
+
+@dataclass(frozen=True)
+class SweepCase:
+    """1 回の走行のパラメーター"""
+
+    break_acclt: float
+    normal_acclt: float
+    mergin: float
+    max_speed: float
+    stoppage_time: int
+    fleet: str  # 列車の種別を、先頭の列車から 1 文字ずつ (`FLEET_TYPES`)。列車より短ければ繰り返す。空なら路線の設定のまま
+    seed: int
+
+
+def create_control(settings: SweepSettings, case: SweepCase) -> BaseControl:
+    control = CONTROL_CLASSES[settings.control]()
+    if settings.synthetic_sections is not None:
+        synthetic.configure(
+            control, synthetic.SyntheticLayout(sections=settings.synthetic_sections, trains=settings.synthetic_trains)
+        )
+    else:
+        gogatsusai2024_generated.configure(control)
+        gogatsusai2024.configure(control)
+    control.verify()
+
+    control.BREAK_ACCLT = case.break_acclt
+    control.NORMAL_ACCLT = case.normal_acclt
+    control.MERGIN = case.mergin
+    control.MAX_SPEED = case.max_speed
+    control.STOPPAGE_TIME = case.stoppage_time
+    if case.fleet:
+        for train, letter in zip(control.trains.values(), itertools.cycle(case.fleet)):
+            train.type = FLEET_TYPES[letter]
+    return control
+
+
+def run_case(settings: SweepSettings, case: SweepCase) -> dict[str, Any]:
+    """
+    1 回の走行を行い、パラメーターと結果を 1 行分の dict で返す。ProcessPoolExecutor のワーカーで呼ばれる。
+
+    - distance_m_per_hour: すべての列車が本当に走った距離の合計の、1 時間あたりの値 (輸送量の目安)
+    - stops_per_hour: 駅に停車した回数の、1 時間あたりの値
+    - min_headway_cm: tick ごとに、control から見た先行列車の最後尾までの距離の最小値
+    - stopping_distance_*_cm: 停車を始めてから止まりきるまでに進んだ距離 (停止精度の目安)
+    """
+
+    start = time.perf_counter()
+    control = create_control(settings, case)
+    dynamics = load_train_dynamics(settings.dynamics_path) if settings.dynamics_path is not None else None
+    runner = HeadlessRunner(control, dynamics=dynamics)
+    rng = random.Random(case.seed)
+    for simulator in runner.simulators.values():
+        simulator.odometry_error = rng.gauss(0.0, settings.odometry_error_sigma)
+
+    min_headway = math.inf
+    stopping_distances: list[float] = []
+    unfinished_stops = 0
+    position_uids = 0
+    for _ in range(round(settings.duration / CONTROL_INTERVAL_SECONDS)):
+        result = runner.run(CONTROL_INTERVAL_SECONDS)
+        stopping_distances.extend(result.stopping_distances)
+        unfinished_stops += result.unfinished_stops
+        position_uids += result.position_uids
+        for train in control.trains.values():
+            forward_train_and_distance = train.find_forward_train()
+            if forward_train_and_distance is not None and forward_train_and_distance[0] is not train:
+                min_headway = min(min_headway, forward_train_and_distance[1])
+
+    distance_cm = sum(
+        simulator.total_rotation * control.trains[train_id].delta_per_motor_rotation * (1 + simulator.odometry_error)
+        for train_id, simulator in runner.simulators.items()
+    )
+    hours = settings.duration / 3600
+    stops = len(stopping_distances) + unfinished_stops
+    return {
+        **asdict(case),
+        "distance_m_per_hour": distance_cm / 100 / hours,
+        "stops_per_hour": stops / hours,
+        "min_headway_cm": min_headway if min_headway < math.inf else None,
+        "stopping_distance_mean_cm": sum(stopping_distances) / len(stopping_distances) if stopping_distances else None,
+        "stopping_distance_max_cm": max(stopping_distances) if stopping_distances else None,
+        "unfinished_stops": unfinished_stops,
+        "position_uids": position_uids,
+        "wall_seconds": time.perf_counter() - start,
+    }
+
+
+def run_sweep(
+    settings: SweepSettings, cases: list[SweepCase], workers: int | None = None, progress: bool = False
+) -> dict[str, list[Any]]:
+    """
+    すべての走行を並列に行い、`cases` の順に並べた結果を列ごとの配列にして返す。
+    """
+
+    rows: list[dict[str, Any] | None] = [None] * len(cases)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_case, settings, case): i for i, case in enumerate(cases)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            rows[futures[future]] = future.result()
+            if progress:
+                print(f"{done}/{len(cases)} runs", flush=True)
+
+    columns: dict[str, list[Any]] = {}
+    for row in rows:
+        assert row is not None
+        for name, value in row.items():
+            columns.setdefault(name, []).append(value)
+    return columns
+
+
+def parse_values(text: str | None, convert: type, default: Any) -> list[Any]:
+    if text is None:
+        return [convert(default)]
+    return [convert(value) for value in text.split(",")]
+
+
+@click.command()
+@click.option("--control", "control_name", type=click.Choice(list(CONTROL_CLASSES)), default="fixed_block")
+@click.option("--break-acclt", help="ブレーキ減速度[cm/s/s] (カンマ区切りで複数指定)")
+@click.option("--normal-acclt", help="常用加減速度[cm/s/s] (カンマ区切りで複数指定)")
+@click.option("--mergin", help="停止余裕距離[cm] (カンマ区切りで複数指定)")
+@click.option("--max-speed", help="最高速度[cm/s] (カンマ区切りで複数指定)")
+@click.option("--stoppage-time", help="停車時間[tick] (カンマ区切りで複数指定)")
+@click.option("--fleet", multiple=True, help="列車の種別 (E: 特急, S: 通勤準急, L: 各駅停車)。例: EEESSSLLLL")
+@click.option("--seeds", default=1, help="組み合わせごとに走らせる回数 (乱数の種の数)")
+@click.option("--duration", default=600.0, help="1 回の走行でシミュレーションする秒数")
+@click.option("--synthetic-sections", type=int, help="指定すれば、このセクション数の路線を自動生成して使う")
+@click.option("--synthetic-trains", default=10, help="自動生成する路線に置く列車の数")
+@click.option("--odometry-error-sigma", default=0.02, help="列車ごとの走行距離の誤差の標準偏差")
+@click.option("--dynamics", "dynamics_path", help="scripts/fit_train_dynamics.py で求めた列車の動特性のファイル")
+@click.option("--workers", type=int, help="並列に走らせるプロセスの数 (省略すれば CPU のコアの数)")
+@click.option("-o", "--output", default="sweep.json", help="結果を書き出すファイル")
+def main(
+    control_name: str,
+    break_acclt: str | None,
+    normal_acclt: str | None,
+    mergin: str | None,
+    max_speed: str | None,
+    stoppage_time: str | None,
+    fleet: tuple[str, ...],
+    seeds: int,
+    duration: float,
+    synthetic_sections: int | None,
+    synthetic_trains: int,
+    odometry_error_sigma: float,
+    dynamics_path: str | None,
+    workers: int | None,
+    output: str,
+) -> None:
+    control_class = CONTROL_CLASSES[control_name]
+    for letter in "".join(fleet):
+        if letter not in FLEET_TYPES:
+            raise click.BadParameter(f"unknown train type {letter!r}", param_hint="--fleet")
+    if control_class is FixedBlockControl:
+        # FixedBlockControl の速度の計算はこれらを使わないので、指定しても同じ結果が並ぶだけになる
+        for option, value in (("--break-acclt", break_acclt), ("--normal-acclt", normal_acclt), ("--mergin", mergin)):
+            if value is not None:
+                raise click.UsageError(f"{option} has no effect on fixed_block; use --control moving_block")
+
+    settings = SweepSettings(
+        duration, control_name, synthetic_sections, synthetic_trains, odometry_error_sigma, dynamics_path
+    )
+    cases = [
+        SweepCase(*values)
+        for values in itertools.product(
+            parse_values(break_acclt, float, control_class.BREAK_ACCLT),
+            parse_values(normal_acclt, float, control_class.NORMAL_ACCLT),
+            parse_values(mergin, float, control_class.MERGIN),
+            parse_values(max_speed, float, control_class.MAX_SPEED),
+            parse_values(stoppage_time, int, control_class.STOPPAGE_TIME),
+            list(fleet) or [""],
+            range(seeds),
+        )
+    ]
+    print(f"{len(cases)} runs of {duration:.0f} s on {workers or os.cpu_count()} workers")
+
+    start = time.perf_counter()
+    columns = run_sweep(settings, cases, workers, progress=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(columns, f)
+        f.write("\n")
+    print(f"wrote {len(cases)} runs to {output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
 """
 ptcs_control の状態を、JSON に変換可能なオブジェクト (pydantic.BaseModel) に変換する。
-二度手間なので、そのうち無くしたい。
+二度手間なので、実行時の変換には serializer.py を使い、ここのモデルは OpenAPI のスキーマとして使う。
 """
 
 from __future__ import annotations
 
+import hashlib
+from typing import Literal
+
 from pydantic import BaseModel
 
 from ptcs_control.components.junction import JunctionConnection, PointDirection
+from ptcs_control.components.position import DirectedPosition as ControlDirectedPosition
 from ptcs_control.components.section import SectionConnection
 from ptcs_control.components.train import Train
 from ptcs_control.control.base import BaseControl
 
+from ..geometry import RailwayGeometry
+
 
 class RailwayState(BaseModel):
     current_time: int
@@ -52,13 +58,18 @@ class TrainState(BaseModel):
     stop_id: str | None
     stop_distance: float
     departure_time: int | None
-    speed_command: float
+    speed_command: float  # 速度指令値 (クライアントは列車がこの速さで進むとみなして位置を推定する)
     voltage_mV: int
     manual_speed: float | None
+    next_junction_distance: float  # 先頭から、先頭が向かっている分岐点までの距離
+    body_points: list[Coordinate]  # UI 上で列車の最後尾から先頭までを結ぶ折れ線
 
     @staticmethod
-    def from_control(train: Train) -> TrainState:
+    def from_control(train: Train, geometry: RailwayGeometry | None = None) -> TrainState:
         tail_position, covered_sections = train.head_position.get_retracted_position_with_path(train.length)
+        body_points = (
+            geometry.get_train_body_points(train.head_position, tail_position, covered_sections) if geometry else []
+        )
         return TrainState(
             id=train.id,
             min_input=train.min_input,
@@ -83,6 +94,8 @@ class TrainState(BaseModel):
             speed_command=train.speed_command,
             voltage_mV=train.voltage_mV,
             manual_speed=train.manual_speed,
+            next_junction_distance=get_distance_to_target_junction(train.head_position),
+            body_points=[Coordinate(x=x, y=y) for x, y in body_points],
         )
 
 
@@ -109,6 +122,13 @@ class ObstacleState(BaseModel):
     is_detected: bool
 
 
+class Coordinate(BaseModel):
+    """UI 上の座標"""
+
+    x: float
+    y: float
+
+
 class UndirectedPosition(BaseModel):
     section_id: str
     mileage: float
@@ -120,10 +140,212 @@ class DirectedPosition(BaseModel):
     mileage: float
 
 
+class PartialRailwayState(BaseModel):
+    """
+    `RailwayState` のうち、`include` などで選ばれたコンポーネントのみを含むもの。
+    選ばれなかった種類のキーは含まれない。
+    """
+
+    current_time: int
+    junctions: dict[str, JunctionState] | None = None
+    sections: dict[str, SectionState] | None = None
+    trains: dict[str, TrainState] | None = None
+    stops: dict[str, StopState] | None = None
+    stations: dict[str, StationState] | None = None
+    sensor_positions: dict[str, SensorPositionState] | None = None
+    obstacles: dict[str, ObstacleState] | None = None
+
+
+class RailwayTopology(BaseModel):
+    """
+    実行中に変化しない路線の構成。
+    `layout_hash` は `layout_hash` 自身を除いた内容から計算される。
+    """
+
+    layout_hash: str
+    junctions: dict[str, JunctionTopology]
+    sections: dict[str, SectionTopology]
+    trains: dict[str, TrainTopology]
+    stops: dict[str, StopState]
+    stations: dict[str, StationState]
+    sensor_positions: dict[str, SensorPositionState]
+    obstacles: dict[str, ObstacleTopology]
+    index: TopologyIndex
+
+
+class TopologyIndex(BaseModel):
+    """
+    バイナリ形式の状態で、各コンポーネントを参照するのに使う整数のインデックス。
+    リスト内の位置がインデックスになる。
+    """
+
+    junction_ids: list[str]
+    section_ids: list[str]
+    train_ids: list[str]
+    stop_ids: list[str]
+    obstacle_ids: list[str]
+
+
+class JunctionTopology(BaseModel):
+    id: str
+    connected_section_ids: dict[JunctionConnection, str]
+
+
+class SectionTopology(BaseModel):
+    id: str
+    length: float
+    connected_junction_ids: dict[SectionConnection, str]
+
+
+class TrainTopology(BaseModel):
+    id: str
+    min_input: int
+    max_input: int
+    max_speed: float
+    length: float
+    delta_per_motor_rotation: float
+
+
+class ObstacleTopology(BaseModel):
+    id: str
+    position: UndirectedPosition
+
+
+class RailwayDynamicState(BaseModel):
+    """
+    実行中に変化する状態のみ。
+    路線の構成は `layout_hash` に対応する `RailwayTopology` から得ること。
+    """
+
+    version: int
+    layout_hash: str
+    timestamp: float  # この状態が計算された時刻 (UNIX 時間、秒)
+    current_time: int
+    junctions: dict[str, JunctionDynamicState]
+    sections: dict[str, SectionDynamicState]
+    trains: dict[str, TrainDynamicState]
+    obstacles: dict[str, ObstacleDynamicState]
+
+
+class JunctionDynamicState(BaseModel):
+    id: str
+    manual_direction: PointDirection | None
+    current_direction: PointDirection
+    direction_command: PointDirection
+
+
+class SectionDynamicState(BaseModel):
+    id: str
+    is_blocked: bool
+
+
+class TrainDynamicState(BaseModel):
+    id: str
+    head_position: DirectedPosition
+    tail_position: DirectedPosition
+    covered_section_ids: list[str]
+    stop_id: str | None
+    stop_distance: float
+    departure_time: int | None
+    speed_command: float  # 速度指令値 (クライアントは列車がこの速さで進むとみなして位置を推定する)
+    voltage_mV: int
+    manual_speed: float | None
+    next_junction_distance: float  # 先頭から、先頭が向かっている分岐点までの距離
+    body_points: list[Coordinate]  # UI 上で列車の最後尾から先頭までを結ぶ折れ線
+
+    @staticmethod
+    def from_control(train: Train, geometry: RailwayGeometry | None = None) -> TrainDynamicState:
+        tail_position, covered_sections = train.head_position.get_retracted_position_with_path(train.length)
+        body_points = (
+            geometry.get_train_body_points(train.head_position, tail_position, covered_sections) if geometry else []
+        )
+        return TrainDynamicState(
+            id=train.id,
+            head_position=DirectedPosition(
+                section_id=train.head_position.section.id,
+                target_junction_id=train.head_position.target_junction.id,
+                mileage=train.head_position.mileage,
+            ),
+            tail_position=DirectedPosition(
+                section_id=tail_position.section.id,
+                target_junction_id=tail_position.target_junction.id,
+                mileage=tail_position.mileage,
+            ),
+            covered_section_ids=[section.id for section in covered_sections],
+            stop_id=train.stop.id if train.stop else None,
+            stop_distance=train.stop_distance,
+            departure_time=train.departure_time,
+            speed_command=train.speed_command,
+            voltage_mV=train.voltage_mV,
+            manual_speed=train.manual_speed,
+            next_junction_distance=get_distance_to_target_junction(train.head_position),
+            body_points=[Coordinate(x=x, y=y) for x, y in body_points],
+        )
+
+
+class ObstacleDynamicState(BaseModel):
+    id: str
+    is_detected: bool
+
+
+class RailwayStateDelta(BaseModel):
+    """
+    状態の配信で送られるメッセージ。
+    `type` が `snapshot` のときはすべてのコンポーネントを含み、
+    `delta` のときはバージョン `since` より後に変化したコンポーネントのみを含む。
+    """
+
+    type: Literal["snapshot", "delta"]
+    version: int
+    since: int | None
+    layout_hash: str
+    timestamp: float
+    current_time: int
+    junctions: dict[str, JunctionDynamicState]
+    sections: dict[str, SectionDynamicState]
+    trains: dict[str, TrainDynamicState]
+    obstacles: dict[str, ObstacleDynamicState]
+
+
+class RailwayHistory(BaseModel):
+    """
+    実行中に変化する状態の履歴。
+    各リストの `i` 番目の要素は、`timestamps[i]` の時刻に記録された値になる。
+    """
+
+    timestamps: list[float]
+    current_times: list[int]
+    versions: list[int]
+    trains: dict[str, TrainHistory]
+    junctions: dict[str, JunctionHistory]
+    sections: dict[str, SectionHistory]
+
+
+class TrainHistory(BaseModel):
+    section_ids: list[str]  # 先頭がいるセクション
+    target_junction_ids: list[str]
+    mileages: list[float]
+    speed_commands: list[float]
+    voltages_mV: list[int]
+
+
+class JunctionHistory(BaseModel):
+    current_directions: list[PointDirection]
+
+
+class SectionHistory(BaseModel):
+    is_blocked: list[bool]
+
+
 RailwayState.model_rebuild()
+PartialRailwayState.model_rebuild()
+RailwayTopology.model_rebuild()
+RailwayDynamicState.model_rebuild()
+RailwayStateDelta.model_rebuild()
+RailwayHistory.model_rebuild()
 
 
-def get_state_from_control(control: BaseControl) -> RailwayState:
+def get_state_from_control(control: BaseControl, geometry: RailwayGeometry | None = None) -> RailwayState:
     return RailwayState(
         current_time=control.current_time,
         junctions={
@@ -149,7 +371,7 @@ def get_state_from_control(control: BaseControl) -> RailwayState:
             )
             for section in control.sections.values()
         },
-        trains={train.id: TrainState.from_control(train) for train in control.trains.values()},
+        trains={train.id: TrainState.from_control(train, geometry) for train in control.trains.values()},
         stops={
             stop.id: StopState(
                 id=stop.id,
@@ -186,3 +408,127 @@ def get_state_from_control(control: BaseControl) -> RailwayState:
             for obstacle in control.obstacles.values()
         },
     )
+
+
+def get_topology_from_control(control: BaseControl) -> RailwayTopology:
+    topology = RailwayTopology(
+        layout_hash="",
+        junctions={
+            junction.id: JunctionTopology(
+                id=junction.id,
+                connected_section_ids={
+                    connection: section.id for connection, section in junction.connected_sections.items()
+                },
+            )
+            for junction in control.junctions.values()
+        },
+        sections={
+            section.id: SectionTopology(
+                id=section.id,
+                length=section.length,
+                connected_junction_ids={
+                    connection: junction.id for connection, junction in section.connected_junctions.items()
+                },
+            )
+            for section in control.sections.values()
+        },
+        trains={
+            train.id: TrainTopology(
+                id=train.id,
+                min_input=train.min_input,
+                max_input=train.max_input,
+                max_speed=train.max_speed,
+                length=train.length,
+                delta_per_motor_rotation=train.delta_per_motor_rotation,
+            )
+            for train in control.trains.values()
+        },
+        stops={
+            stop.id: StopState(
+                id=stop.id,
+                position=DirectedPosition(
+                    section_id=stop.position.section.id,
+                    target_junction_id=stop.position.target_junction.id,
+                    mileage=stop.position.mileage,
+                ),
+            )
+            for stop in control.stops.values()
+        },
+        stations={
+            station.id: StationState(id=station.id, stop_ids=[stop.id for stop in station.stops])
+            for station in control.stations.values()
+        },
+        sensor_positions={
+            sensor_position.id: SensorPositionState(
+                id=sensor_position.id,
+                section_id=sensor_position.section.id,
+                mileage=sensor_position.mileage,
+                target_junction_id=sensor_position.target_junction.id,
+            )
+            for sensor_position in control.sensor_positions.values()
+        },
+        obstacles={
+            obstacle.id: ObstacleTopology(
+                id=obstacle.id,
+                position=UndirectedPosition(
+                    section_id=obstacle.position.section.id,
+                    mileage=obstacle.position.mileage,
+                ),
+            )
+            for obstacle in control.obstacles.values()
+        },
+        index=TopologyIndex(
+            junction_ids=list(control.junctions),
+            section_ids=list(control.sections),
+            train_ids=list(control.trains),
+            stop_ids=list(control.stops),
+            obstacle_ids=list(control.obstacles),
+        ),
+    )
+    content = topology.model_dump_json(exclude={"layout_hash"}).encode()
+    topology.layout_hash = hashlib.sha256(content).hexdigest()[:16]
+    return topology
+
+
+def get_dynamic_state_from_control(
+    control: BaseControl,
+    *,
+    version: int,
+    layout_hash: str,
+    timestamp: float = 0.0,
+    geometry: RailwayGeometry | None = None,
+) -> RailwayDynamicState:
+    return RailwayDynamicState(
+        version=version,
+        layout_hash=layout_hash,
+        timestamp=timestamp,
+        current_time=control.current_time,
+        junctions={
+            junction.id: JunctionDynamicState(
+                id=junction.id,
+                manual_direction=junction.manual_direction,
+                current_direction=junction.current_direction,
+                direction_command=junction.direction_command,
+            )
+            for junction in control.junctions.values()
+        },
+        sections={
+            section.id: SectionDynamicState(id=section.id, is_blocked=section.is_blocked)
+            for section in control.sections.values()
+        },
+        trains={train.id: TrainDynamicState.from_control(train, geometry) for train in control.trains.values()},
+        obstacles={
+            obstacle.id: ObstacleDynamicState(id=obstacle.id, is_detected=obstacle.is_detected)
+            for obstacle in control.obstacles.values()
+        },
+    )
+
+
+def get_distance_to_target_junction(position: ControlDirectedPosition) -> float:
+    """
+    位置 `position` から、向かっている分岐点までの距離を返す。
+    """
+    if position.target_junction == position.section.connected_junctions[SectionConnection.B]:
+        return position.section.length - position.mileage
+    else:
+        return position.mileage
@@ -0,0 +1,45 @@
+import {
+  RailwayDynamicState,
+  RailwayState,
+  RailwayTopology,
+} from "ptcs_client";
+
+/**
+ * 一度だけ取得した路線の構成と、定期的に取得する変化する状態とを組み合わせて、
+ * `RailwayState` と同じ形にする。
+ */
+export const mergeRailwayState = (
+  topology: RailwayTopology,
+  dynamic: RailwayDynamicState
+): RailwayState => {
+  return {
+    current_time: dynamic.current_time,
+    junctions: Object.fromEntries(
+      Object.entries(dynamic.junctions).map(([id, junction]) => [
+        id,
+        { ...topology.junctions[id], ...junction },
+      ])
+    ),
+    sections: Object.fromEntries(
+      Object.entries(dynamic.sections).map(([id, section]) => [
+        id,
+        { ...topology.sections[id], ...section },
+      ])
+    ),
+    trains: Object.fromEntries(
+      Object.entries(dynamic.trains).map(([id, train]) => [
+        id,
+        { ...topology.trains[id], ...train },
+      ])
+    ),
+    stops: topology.stops,
+    stations: topology.stations,
+    sensor_positions: topology.sensor_positions,
+    obstacles: Object.fromEntries(
+      Object.entries(dynamic.obstacles).map(([id, obstacle]) => [
+        id,
+        { ...topology.obstacles[id], ...obstacle },
+      ])
+    ),
+  };
+};
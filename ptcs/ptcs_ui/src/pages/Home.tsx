@@ -1,5 +1,10 @@
 import { Code, Container, Grid, Stack, useMantineTheme } from "@mantine/core";
-import { DefaultService, RailwayState } from "ptcs_client";
+import {
+  DefaultService,
+  RailwayState,
+  RailwayTopology,
+  subscribeState,
+} from "ptcs_client";
 import { Layout } from "../components/Layout";
 import { useEffect, useState } from "react";
 import { Railway } from "../components/Railway";
@@ -7,6 +12,7 @@ import { Debugger } from "../components/Debugger";
 import { RailwayStateContext, RailwayUIContext } from "../contexts";
 import { Information } from "../components/Information";
 import { ui } from "../config/ui";
+import { mergeRailwayState } from "../lib/state";
 
 export const Home: React.FC = () => {
   const theme = useMantineTheme();
@@ -14,21 +20,44 @@ export const Home: React.FC = () => {
   const [time, setTime] = useState(() => new Date());
 
   useEffect(() => {
-    DefaultService.getState().then((state) => {
-      setTime(new Date());
-      setRailwayState(state);
-    });
-  }, []);
+    // 状態は WebSocket で差分を受け取り、
+    // 路線の構成は layout_hash ごとに一度だけ取得する (取得中なら同じ Promise を待つ)
+    const topologies = new Map<string, Promise<RailwayTopology>>();
+    const fetchTopology = (layoutHash: string): Promise<RailwayTopology> => {
+      let topology = topologies.get(layoutHash);
+      if (topology === undefined) {
+        topology = DefaultService.getTopologyByHash(layoutHash);
+        // 失敗したら次に受け取ったときに取得し直す
+        topology.catch(() => topologies.delete(layoutHash));
+        topologies.set(layoutHash, topology);
+      }
+      return topology;
+    };
 
-  useEffect(() => {
-    const interval = setInterval(() => {
-      DefaultService.getState().then((state) => {
-        setTime(new Date());
-        setRailwayState(state);
-      });
-    }, 500);
+    // 路線の構成の取得を待つ間に新しい状態が先に適用されることがあるので、
+    // 受け取った順番を覚えておき、適用済みのものより古い状態は捨てる
+    // (サーバーが再起動すると version は戻るので、version ではなく受け取った順番で比べる)
+    let received = 0;
+    let applied = 0;
+    let unsubscribed = false;
+    const unsubscribe = subscribeState((dynamicState) => {
+      const sequence = ++received;
+      fetchTopology(dynamicState.layout_hash)
+        .then((topology) => {
+          if (unsubscribed || sequence <= applied) {
+            return;
+          }
+          applied = sequence;
+          setTime(new Date());
+          setRailwayState(mergeRailwayState(topology, dynamicState));
+        })
+        .catch((error) => {
+          console.error("failed to fetch topology", error);
+        });
+    });
     return () => {
-      clearInterval(interval);
+      unsubscribed = true;
+      unsubscribe();
     };
   }, []);
 
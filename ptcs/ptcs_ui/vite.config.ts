@@ -5,7 +5,10 @@ export default defineConfig({
   plugins: [react()],
   server: {
     proxy: {
-      "/api": "http://127.0.0.1:5000",
+      "/api": {
+        target: "http://127.0.0.1:5000",
+        ws: true,
+      },
     },
   },
 });
@@ -0,0 +1,67 @@
+# 状態を JSON に変換する処理について、pydantic を経由する場合と serializer.py を使う場合の速さを比べます。
+#
+# 使い方:
+#   poetry run python scripts/benchmark_state.py
+#   poetry run python scripts/benchmark_state.py --ticks 300 --number 200
+
+import timeit
+
+import click
+
+from ptcs_control.gogatsusai2024 import create_control
+from ptcs_server.geometry import RailwayGeometry
+from ptcs_server.serializer import dump_json, dynamic_state_to_dict, state_to_dict
+from ptcs_server.types.state import (
+    get_dynamic_state_from_control,
+    get_state_from_control,
+)
+
+
+@click.command()
+@click.option("--ticks", default=100, help="計測前に進める tick 数")
+@click.option("--number", default=100, help="1 回の計測で変換する回数")
+@click.option("--repeat", default=5, help="計測の回数 (最も速い回を表示する)")
+def main(ticks: int, number: int, repeat: int):
+    control = create_control()
+    geometry = RailwayGeometry.load("./data/gogatsusai2024/railway_ui_v5.json")
+    for _ in range(ticks):
+        control.tick()
+        control.update()
+
+    def pydantic_state() -> bytes:
+        return get_state_from_control(control, geometry).model_dump_json().encode()
+
+    def direct_state() -> bytes:
+        return dump_json(state_to_dict(control, geometry=geometry))
+
+    def pydantic_dynamic() -> bytes:
+        return (
+            get_dynamic_state_from_control(control, version=0, layout_hash="", geometry=geometry)
+            .model_dump_json()
+            .encode()
+        )
+
+    def direct_dynamic() -> bytes:
+        return dump_json(dynamic_state_to_dict(control, version=0, layout_hash="", geometry=geometry))
+
+    assert pydantic_state() == direct_state()
+    assert pydantic_dynamic() == direct_dynamic()
+
+    print(
+        f"gogatsusai2024: {len(control.junctions)} junctions, "
+        f"{len(control.sections)} sections, {len(control.trains)} trains"
+    )
+    for name, pydantic_path, direct_path in [
+        ("RailwayState", pydantic_state, direct_state),
+        ("RailwayDynamicState", pydantic_dynamic, direct_dynamic),
+    ]:
+        pydantic_time = min(timeit.repeat(pydantic_path, number=number, repeat=repeat)) / number
+        direct_time = min(timeit.repeat(direct_path, number=number, repeat=repeat)) / number
+        print(
+            f"{name:20} pydantic: {pydantic_time * 1e6:8.1f} us  "
+            f"direct: {direct_time * 1e6:8.1f} us  ({pydantic_time / direct_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# 探索や update の別の実装 (バックエンド) が、素直な実装と同じ結果を出すかどうかを、乱数で作った路線と列車で確かめます。
+# 食い違いがあれば、食い違いが残る最小のシナリオと、食い違った値を表示して、終了コード 1 で終わります。
+#
+# `--candidate` には、路線が空の control を返す関数を `モジュール:名前` の形で指定します。
+# 指定しなければ素直な実装どうしを比べます (シナリオが決定的に再現できることの確認になります)。
+#
+# 使い方:
+#   poetry run python scripts/check_equivalence.py --reference fixed_block --candidate my_backend:create_control
+#   poetry run python scripts/check_equivalence.py --reference moving_block --cases 500 --seed 1
+
+import importlib
+import sys
+
+import click
+
+from ptcs_control.equivalence import (
+    REFERENCE_BACKENDS,
+    Backend,
+    Scenario,
+    check_equivalence,
+)
+
+
+def load_backend(spec: str) -> Backend:
+    module_name, _, attr = spec.partition(":")
+    create_control = getattr(importlib.import_module(module_name), attr)
+    return Backend(spec, create_control)
+
+
+@click.command()
+@click.option("--reference", type=click.Choice(list(REFERENCE_BACKENDS)), default="fixed_block", help="素直な実装")
+@click.option("--candidate", help="比べる実装 (`モジュール:名前`)")
+@click.option("--cases", default=100, help="シナリオの数")
+@click.option("--ticks", default=200, help="1 つのシナリオで進める tick 数")
+@click.option("--seed", default=0, help="シナリオを作る乱数の種")
+def main(reference: str, candidate: str | None, cases: int, ticks: int, seed: int):
+    reference_backend = REFERENCE_BACKENDS[reference]
+    candidate_backend = load_backend(candidate) if candidate is not None else reference_backend
+
+    def on_case(i: int, scenario: Scenario) -> None:
+        if (i + 1) % 10 == 0:
+            print(f"{i + 1}/{cases} scenarios", flush=True)
+
+    failure = check_equivalence(reference_backend, candidate_backend, cases, ticks, seed, on_case)
+    if failure is not None:
+        print(failure)
+        sys.exit(1)
+    print(f"{candidate_backend.name} agrees with {reference_backend.name} on {cases} scenarios")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# 実機の列車で記録したセッション (`poetry run server --bridge --record session.jsonl`) から、
+# TrainSimulator の動特性のモデル (ptcs_bridge/train_dynamics.py) のパラメーターを列車ごとに求めます。
+#
+# 1. モーターへの入力値が一定の時間が続いた区間の後半を定常状態とみなし、
+#    入力値と回転の速さの関係を直線で近似して、不感帯とゲインを求めます。
+# 2. そのうえで、加速の遅れの時定数と不感帯を変えながら記録された入力値で回転数をシミュレーションし、
+#    記録された回転数に最もよく合うものを選びます。ゲインはそのたびに最小二乗法で合わせ直します。
+#
+# 使い方:
+#   poetry run python scripts/fit_train_dynamics.py session1.jsonl session2.jsonl -o dynamics.json
+#   poetry run python -m ptcs_server.headless --dynamics dynamics.json
+
+from dataclasses import dataclass, field
+
+import click
+
+from ptcs_bridge.train_dynamics import TrainDynamics, save_train_dynamics
+from ptcs_server.recording import read_recording
+
+MIN_STEADY_SECONDS = 2.0  # 入力値がこれだけ続いた区間の後半を定常状態とみなす
+SIMULATION_STEP_SECONDS = 0.05
+BIN_SECONDS = 0.5  # 回転数を比べる区間の長さ
+TIME_CONSTANT_CANDIDATES = [i * 0.05 for i in range(61)]  # 0〜3 秒
+DEAD_ZONE_DELTAS = range(-30, 31)  # 定常状態から求めた不感帯の前後で探す範囲
+
+
+@dataclass
+class TrainLog:
+    """1 つのセッションの、1 両分の記録"""
+
+    motor_inputs: list[tuple[float, int]] = field(default_factory=list)  # (時刻, 入力値)
+    rotations: list[tuple[float, int]] = field(default_factory=list)  # (時刻, 回転数)
+
+
+def read_train_logs(path: str) -> dict[str, TrainLog]:
+    _header, events = read_recording(path)
+    logs: dict[str, TrainLog] = {}
+    for event_time, kind, id, value in events:
+        match kind:
+            case "motor_input":
+                logs.setdefault(id, TrainLog()).motor_inputs.append((event_time, value))
+            case "rotation":
+                logs.setdefault(id, TrainLog()).rotations.append((event_time, value))
+    return logs
+
+
+def count_rotations(log: TrainLog, start: float, end: float) -> int:
+    return sum(count for t, count in log.rotations if start <= t < end)
+
+
+def find_steady_states(log: TrainLog) -> list[tuple[int, float]]:
+    """入力値が一定の区間ごとに、(入力値, 後半の回転の速さ[回転/s]) を返す"""
+    steady_states: list[tuple[int, float]] = []
+    segment_start = 0
+    for i in range(1, len(log.motor_inputs) + 1):
+        if i < len(log.motor_inputs) and log.motor_inputs[i][1] == log.motor_inputs[segment_start][1]:
+            continue
+        start_time, motor_input = log.motor_inputs[segment_start]
+        end_time = log.motor_inputs[i][0] if i < len(log.motor_inputs) else log.motor_inputs[i - 1][0]
+        if end_time - start_time >= MIN_STEADY_SECONDS:
+            middle_time = (start_time + end_time) / 2
+            rate = count_rotations(log, middle_time, end_time) / (end_time - middle_time)
+            steady_states.append((motor_input, rate))
+        segment_start = i
+    return steady_states
+
+
+def fit_line(points: list[tuple[int, float]]) -> tuple[float, float] | None:
+    """最小二乗法で y = a x + b の (a, b) を求める"""
+    n = len(points)
+    if n < 2 or len({x for x, _ in points}) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    a = sxy / sxx
+    return a, mean_y - a * mean_x
+
+
+def simulate_binned_rotations(log: TrainLog, dynamics: TrainDynamics) -> list[float]:
+    """記録された入力値を与えたときの、`BIN_SECONDS` ごとの回転数 (端数を含む) を返す"""
+    start_time = log.motor_inputs[0][0]
+    end_time = log.motor_inputs[-1][0]
+    bins = [0.0] * (int((end_time - start_time) / BIN_SECONDS) + 1)
+    rate = 0.0
+    motor_input = 0
+    next_input = 0
+    t = start_time
+    while t < end_time:
+        while next_input < len(log.motor_inputs) and log.motor_inputs[next_input][0] <= t:
+            motor_input = log.motor_inputs[next_input][1]
+            next_input += 1
+        next_rate = dynamics.calc_next_rotation_rate(rate, motor_input, SIMULATION_STEP_SECONDS)
+        bins[int((t - start_time) / BIN_SECONDS)] += (rate + next_rate) / 2 * SIMULATION_STEP_SECONDS
+        rate = next_rate
+        t += SIMULATION_STEP_SECONDS
+    return bins
+
+
+def record_binned_rotations(log: TrainLog) -> list[float]:
+    start_time = log.motor_inputs[0][0]
+    end_time = log.motor_inputs[-1][0]
+    bins = [0.0] * (int((end_time - start_time) / BIN_SECONDS) + 1)
+    for t, count in log.rotations:
+        if start_time <= t < end_time:
+            bins[int((t - start_time) / BIN_SECONDS)] += count
+    return bins
+
+
+def fit_gain(
+    logs: list[TrainLog], recorded: list[list[float]], dead_zone_input: float, time_constant: float
+) -> tuple[TrainDynamics, float] | None:
+    """
+    不感帯と時定数を固定したときに、回転数の二乗誤差が最小になるゲインを求め、そのときの二乗誤差とともに返す。
+    ゲインが 1 のときの応答を求めておけば、回転数はゲインに比例するので、ゲインは最小二乗法で決まる。
+    """
+    unit = TrainDynamics(dead_zone_input, 1.0, time_constant)
+    simulated = [simulate_binned_rotations(log, unit) for log in logs]
+    sxy = sum(x * y for xs, ys in zip(simulated, recorded) for x, y in zip(xs, ys))
+    sxx = sum(x * x for xs in simulated for x in xs)
+    if sxx == 0:
+        return None
+    gain = sxy / sxx
+    squared_error = sum((gain * x - y) ** 2 for xs, ys in zip(simulated, recorded) for x, y in zip(xs, ys))
+    return TrainDynamics(dead_zone_input, gain, time_constant), squared_error
+
+
+def fit_train_dynamics(logs: list[TrainLog]) -> tuple[TrainDynamics, float] | None:
+    """
+    動特性のパラメーターと、区間ごとの回転数の二乗平均平方根誤差を返す。
+    入力値の異なる定常状態が 2 つ以上なければ None を返す。
+    """
+    logs = [log for log in logs if len(log.motor_inputs) >= 2]
+    steady_states = [state for log in logs for state in find_steady_states(log)]
+    line = fit_line([(motor_input, rate) for motor_input, rate in steady_states if rate > 0])
+    if line is None or line[0] <= 0:
+        return None
+    gain, intercept = line
+    recorded = [record_binned_rotations(log) for log in logs]
+    best: tuple[TrainDynamics, float] = (TrainDynamics(-intercept / gain, gain, 0.0), float("inf"))
+
+    # 定常状態とみなした区間にも加速の遅れが残っていると不感帯がずれるので、
+    # 時定数 → 不感帯 → 時定数の順に、ひとつずつ変えて回転数に合わせ直す
+    for parameter in ["time_constant", "dead_zone", "time_constant"]:
+        current = best[0]
+        candidates = (
+            [(current.dead_zone_input, time_constant) for time_constant in TIME_CONSTANT_CANDIDATES]
+            if parameter == "time_constant"
+            else [(current.dead_zone_input + d, current.time_constant_seconds) for d in DEAD_ZONE_DELTAS]
+        )
+        for dead_zone_input, time_constant in candidates:
+            result = fit_gain(logs, recorded, dead_zone_input, time_constant)
+            if result is not None and result[1] < best[1]:
+                best = result
+    if best[1] == float("inf"):
+        return None
+    bin_count = sum(len(bins) for bins in recorded)
+    return best[0], (best[1] / bin_count) ** 0.5
+
+
+@click.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option("-o", "--output", default="dynamics.json", help="パラメーターを書き出すファイル")
+def main(paths: tuple[str, ...], output: str):
+    logs_by_train: dict[str, list[TrainLog]] = {}
+    for path in paths:
+        for train_id, log in read_train_logs(path).items():
+            logs_by_train.setdefault(train_id, []).append(log)
+
+    dynamics: dict[str, TrainDynamics] = {}
+    for train_id, logs in sorted(logs_by_train.items()):
+        result = fit_train_dynamics(logs)
+        if result is None:
+            print(f"{train_id}: not enough steady motor inputs to fit")
+            continue
+        dynamics[train_id], rmse = result
+        print(
+            f"{train_id}: dead zone {dynamics[train_id].dead_zone_input:.1f}, "
+            f"gain {dynamics[train_id].gain:.4f} rotations/s per input, "
+            f"time constant {dynamics[train_id].time_constant_seconds:.2f} s "
+            f"(rmse {rmse:.2f} rotations per {BIN_SECONDS} s)"
+        )
+
+    save_train_dynamics(output, dynamics)
+    print(f"wrote {len(dynamics)} trains to {output}")
+
+
+if __name__ == "__main__":
+    main()
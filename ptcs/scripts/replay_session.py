@@ -0,0 +1,38 @@
+# サーバーを `--record` 付きで起動して記録した BLE の入力を、新しい control に与えて再生します。
+# 時計を待たずに CPU の許す限り速く再生し、記録された指令と再生で得られた指令の食い違いを表示します。
+#
+# 使い方:
+#   poetry run server --bridge --record session.jsonl
+#   poetry run python scripts/replay_session.py session.jsonl
+
+import sys
+
+import click
+
+from ptcs_control.gogatsusai2024 import create_control
+from ptcs_server.recording import replay_session
+from ptcs_server.types.state import get_topology_from_control
+
+
+@click.command()
+@click.argument("path")
+def main(path: str):
+    control = create_control()
+    layout_hash = get_topology_from_control(control).layout_hash
+    result = replay_session(control, layout_hash, path)
+
+    print(f"events : {result.events} ({result.ticks} ticks, {result.commands} commands)")
+    print(f"time   : {result.virtual_seconds:.1f} s recorded, {result.wall_seconds:.3f} s replayed")
+    print(f"speed  : {result.ticks_per_second:.0f} ticks/s ({result.speedup:.0f}x)")
+    print(f"diverge: {result.divergence_count} / {result.commands} commands")
+    for divergence in result.divergences:
+        print(
+            f"  {divergence.time:10.4f} {divergence.kind:12} {divergence.id:6} "
+            f"recorded {divergence.recorded!r}, replayed {divergence.replayed!r}"
+        )
+    if result.divergence_count > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
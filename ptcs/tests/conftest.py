@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from ptcs_control.control.base import BaseControl
+from ptcs_control.gogatsusai2024 import create_control
+from ptcs_server.geometry import RailwayGeometry
+
+CONTROL_INTERVAL_SECONDS = 0.1
+UI_PATH = Path(__file__).parent.parent / "data" / "gogatsusai2024" / "railway_ui_v5.json"
+
+
+def advance(control: BaseControl, ticks: int) -> None:
+    """
+    制御ループを `ticks` 周期だけ回す。列車は速度指令どおりに進んだものとする。
+    """
+    for _ in range(ticks):
+        control.tick()
+        for train in control.trains.values():
+            if train.speed_command > 0:
+                train.move_forward(train.speed_command * CONTROL_INTERVAL_SECONDS)
+        control.update()
+
+
+@pytest.fixture
+def control() -> BaseControl:
+    """列車が走り出し、停車や分岐の状態ができた gogatsusai2024 の control"""
+    control = create_control()
+    control.update()
+    advance(control, 50)
+    return control
+
+
+@pytest.fixture(scope="session")
+def geometry() -> RailwayGeometry:
+    return RailwayGeometry.load(str(UI_PATH))
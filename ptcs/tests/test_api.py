@@ -0,0 +1,93 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ptcs_control.control.base import BaseControl
+from ptcs_server.api import api_router
+from ptcs_server.journal import ControlJournal
+from ptcs_server.recording import BridgeInputs
+from ptcs_server.snapshot import StateCache
+from ptcs_server.stream import StateBroadcaster
+
+
+@pytest.fixture
+def app(control: BaseControl) -> FastAPI:
+    """server.py の `create_app` のうち、API に必要な部分だけを組み立てる (BLE も制御ループも使わない)"""
+    app = FastAPI()
+    app.state.control = control
+    state_cache = StateCache(control)
+    state_cache.publish()
+    app.state.state_cache = state_cache
+    journal = ControlJournal(control, state_cache.layout_hash, None)
+    app.state.journal = journal
+    app.state.inputs = BridgeInputs(control, journal)
+    app.state.state_broadcaster = StateBroadcaster(control, state_cache, journal.versions)
+    app.include_router(api_router, prefix="/api")
+    return app
+
+
+@pytest.fixture
+def client(app: FastAPI) -> TestClient:
+    return TestClient(app)
+
+
+# FixedBlockControl は update のたびに閉塞やポイントの向きを計算し直すので、列車の位置で確かめる
+# (control のコンポーネントは互いに参照し合っていて repr がとても遅いので、比べるのは ID と数値だけにする)
+
+
+def head(train) -> tuple[str, float]:
+    return train.head_position.section.id, train.head_position.mileage
+
+
+def test_batch_applies_commands_and_updates_once(app, client, control):
+    train, other_train = list(control.trains.values())[:2]
+    sensor_position, other_sensor_position = list(control.sensor_positions.values())[:2]
+    version = app.state.state_cache.version
+    response = client.post(
+        "/api/commands/batch",
+        json={
+            "commands": [
+                {"type": "put_train", "train_id": train.id, "position_id": sensor_position.id},
+                {"type": "put_train", "train_id": other_train.id, "position_id": other_sensor_position.id},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == {"version": version + 1}
+    assert head(train) == (sensor_position.section.id, sensor_position.mileage)
+    assert head(other_train) == (other_sensor_position.section.id, other_sensor_position.mileage)
+
+
+def test_batch_with_unknown_id_applies_nothing(app, client, control):
+    train = next(iter(control.trains.values()))
+    position = head(train)
+    sensor_position = next(sp for sp in control.sensor_positions.values() if sp.section.id != position[0])
+    version = app.state.state_cache.version
+    response = client.post(
+        "/api/commands/batch",
+        json={
+            "commands": [
+                {"type": "put_train", "train_id": train.id, "position_id": sensor_position.id},
+                {"type": "update_junction", "junction_id": "j04", "direction": "straight"},
+                {"type": "detect_obstacle", "obstacle_id": "no_such_obstacle"},
+            ]
+        },
+    )
+    assert response.status_code == 404
+    assert "no_such_obstacle" in response.json()["detail"]
+    assert head(train) == position
+    assert app.state.state_cache.version == version
+
+
+def test_batch_rejects_unknown_command_type(client):
+    response = client.post("/api/commands/batch", json={"commands": [{"type": "explode", "section_id": "S00"}]})
+    assert response.status_code == 422
+
+
+def test_move_train(app, client, control):
+    train = next(iter(control.trains.values()))
+    position = head(train)
+    version = app.state.state_cache.version
+    assert client.post(f"/api/state/trains/{train.id}/move", json={"delta": 1.0}).status_code == 200
+    assert head(train) != position
+    assert app.state.state_cache.version == version + 1
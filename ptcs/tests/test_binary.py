@@ -0,0 +1,229 @@
+import struct
+from typing import Any
+
+import pytest
+
+from ptcs_server.binary import (
+    COUNT,
+    DIRECTIONS,
+    FLAG_DEPARTURE_TIME,
+    FLAG_MANUAL_SPEED,
+    FORMAT_VERSION,
+    HEADER,
+    JUNCTION,
+    MAGIC,
+    NO_DIRECTION,
+    NO_INDEX,
+    OBSTACLE,
+    SECTION,
+    TRAIN,
+    StateIndex,
+    encode_state_message,
+    is_binary_accepted,
+)
+from ptcs_server.serializer import dynamic_state_to_dict
+
+LAYOUT_HASH = "0123456789abcdef"
+
+
+class Reader:
+    """binary.py の先頭に書かれた形式どおりに読む (ptcs_client/lib/binary.ts と同じ手順)"""
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.offset = 0
+
+    def read(self, format: struct.Struct | str) -> tuple[Any, ...]:
+        if isinstance(format, str):
+            format = struct.Struct(format)
+        values = format.unpack_from(self.data, self.offset)
+        self.offset += format.size
+        return values
+
+    def count(self) -> int:
+        return self.read(COUNT)[0]
+
+
+def decode_state_message(data: bytes, index: StateIndex) -> dict[str, Any]:
+    junction_ids = list(index.junctions)
+    section_ids = list(index.sections)
+    train_ids = list(index.trains)
+    stop_ids = list(index.stops)
+    obstacle_ids = list(index.obstacles)
+
+    def direction(value: int) -> str | None:
+        return None if value == NO_DIRECTION else DIRECTIONS[value]
+
+    def position(section_index: int, junction_index: int, mileage: float) -> dict[str, Any]:
+        return {
+            "section_id": section_ids[section_index],
+            "target_junction_id": junction_ids[junction_index],
+            "mileage": mileage,
+        }
+
+    reader = Reader(data)
+    magic, format, type, version, since, current_time, layout_hash, timestamp = reader.read(HEADER)
+    assert magic == MAGIC
+    assert format == FORMAT_VERSION
+    message: dict[str, Any] = {
+        "type": "snapshot" if type == 0 else "delta",
+        "version": version,
+        "since": None if since == -1 else since,
+        "current_time": current_time,
+        "layout_hash": layout_hash.decode(),
+        "timestamp": timestamp,
+        "junctions": {},
+        "sections": {},
+        "trains": {},
+        "obstacles": {},
+    }
+    for _ in range(reader.count()):
+        i, manual_direction, current_direction, direction_command = reader.read(JUNCTION)
+        message["junctions"][junction_ids[i]] = {
+            "id": junction_ids[i],
+            "manual_direction": direction(manual_direction),
+            "current_direction": direction(current_direction),
+            "direction_command": direction(direction_command),
+        }
+    for _ in range(reader.count()):
+        i, is_blocked = reader.read(SECTION)
+        message["sections"][section_ids[i]] = {"id": section_ids[i], "is_blocked": bool(is_blocked)}
+    for _ in range(reader.count()):
+        (
+            i,
+            flags,
+            head_section,
+            head_junction,
+            head_mileage,
+            tail_section,
+            tail_junction,
+            tail_mileage,
+            stop_index,
+            stop_distance,
+            departure_time,
+            speed_command,
+            voltage_mV,
+            manual_speed,
+            next_junction_distance,
+            covered_count,
+        ) = reader.read(TRAIN)
+        covered = reader.read(f"<{covered_count}H")
+        body_point_count = reader.count()
+        coordinates = reader.read(f"<{body_point_count * 2}f")
+        message["trains"][train_ids[i]] = {
+            "id": train_ids[i],
+            "head_position": position(head_section, head_junction, head_mileage),
+            "tail_position": position(tail_section, tail_junction, tail_mileage),
+            "covered_section_ids": [section_ids[j] for j in covered],
+            "stop_id": None if stop_index == NO_INDEX else stop_ids[stop_index],
+            "stop_distance": stop_distance,
+            "departure_time": departure_time if flags & FLAG_DEPARTURE_TIME else None,
+            "speed_command": speed_command,
+            "voltage_mV": voltage_mV,
+            "manual_speed": manual_speed if flags & FLAG_MANUAL_SPEED else None,
+            "next_junction_distance": next_junction_distance,
+            "body_points": [{"x": x, "y": y} for x, y in zip(coordinates[::2], coordinates[1::2])],
+        }
+    for _ in range(reader.count()):
+        i, is_detected = reader.read(OBSTACLE)
+        message["obstacles"][obstacle_ids[i]] = {"id": obstacle_ids[i], "is_detected": bool(is_detected)}
+    assert reader.offset == len(data)
+    return message
+
+
+def approx_f32(value: Any) -> Any:
+    """float を f32 の精度で比べられるようにする"""
+    if isinstance(value, float):
+        return pytest.approx(value, rel=1e-6, abs=1e-4)
+    if isinstance(value, dict):
+        return {key: approx_f32(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [approx_f32(item) for item in value]
+    return value
+
+
+def encode(control, geometry=None, **kwargs) -> tuple[dict[str, Any], bytes]:
+    state = dynamic_state_to_dict(control, version=7, layout_hash=LAYOUT_HASH, timestamp=1.5, geometry=geometry)
+    data = encode_state_message(
+        StateIndex.from_control(control),
+        type=kwargs.get("type", "snapshot"),
+        version=state["version"],
+        since=kwargs.get("since"),
+        layout_hash=LAYOUT_HASH,
+        timestamp=state["timestamp"],
+        current_time=state["current_time"],
+        junctions=state["junctions"],
+        sections=state["sections"],
+        trains=state["trains"],
+        obstacles=state["obstacles"],
+    )
+    return state, data
+
+
+def test_round_trip(control, geometry):
+    state, data = encode(control, geometry)
+    message = decode_state_message(data, StateIndex.from_control(control))
+    assert message["type"] == "snapshot"
+    assert message["since"] is None
+    assert (message["version"], message["layout_hash"], message["current_time"], message["timestamp"]) == (
+        state["version"],
+        LAYOUT_HASH,
+        state["current_time"],
+        state["timestamp"],
+    )
+    for kind in ("junctions", "sections", "trains", "obstacles"):
+        assert message[kind] == approx_f32(state[kind])
+    assert any(train["body_points"] for train in message["trains"].values())
+
+
+def test_round_trip_optional_values(control):
+    train = next(iter(control.trains.values()))
+    train.manual_speed = 12.5
+    junction = next(iter(control.junctions.values()))
+    junction.manual_direction = None
+    state, data = encode(control, type="delta", since=3)
+    message = decode_state_message(data, StateIndex.from_control(control))
+    assert (message["type"], message["since"]) == ("delta", 3)
+    assert message["trains"][train.id]["manual_speed"] == 12.5
+    assert message["junctions"][junction.id]["manual_direction"] is None
+    departures = {id: train["departure_time"] for id, train in message["trains"].items()}
+    assert departures == {id: train["departure_time"] for id, train in state["trains"].items()}
+
+
+def test_long_body_does_not_overflow(control):
+    # 長い列車が多くの区間にまたがっても (u8 では収まらない数でも) 読める
+    train_id = next(iter(control.trains))
+    state, _ = encode(control)
+    train = dict(state["trains"][train_id])
+    train["covered_section_ids"] = list(control.sections)[:1] * 300
+    train["body_points"] = [{"x": float(i), "y": float(-i)} for i in range(300)]
+    index = StateIndex.from_control(control)
+    data = encode_state_message(
+        index,
+        type="delta",
+        version=1,
+        since=0,
+        layout_hash=LAYOUT_HASH,
+        timestamp=0.0,
+        current_time=0,
+        junctions={},
+        sections={},
+        trains={train_id: train},
+        obstacles={},
+    )
+    decoded = decode_state_message(data, index)["trains"][train_id]
+    assert len(decoded["covered_section_ids"]) == 300
+    assert decoded["body_points"][-1] == {"x": 299.0, "y": -299.0}
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("application/json", False),
+        ("application/x-ptcs-state", True),
+        ("application/json, application/x-ptcs-state;q=0.9", True),
+    ],
+)
+def test_is_binary_accepted(accept, expected):
+    assert is_binary_accepted(accept) is expected
@@ -0,0 +1,48 @@
+from ptcs_bridge.command_filter import CommandFilter, WriteLatency
+
+
+def test_sends_only_changes_within_keepalive():
+    command_filter: CommandFilter[int] = CommandFilter(keepalive_seconds=1.0)
+    assert command_filter.should_send(10, now=0.0)
+    assert not command_filter.should_send(10, now=0.2)
+    assert not command_filter.should_send(10, now=0.9)
+    assert command_filter.should_send(20, now=1.0)
+    assert (command_filter.sent_count, command_filter.saved_count) == (2, 2)
+
+
+def test_resends_after_keepalive():
+    command_filter: CommandFilter[int] = CommandFilter(keepalive_seconds=1.0)
+    assert command_filter.should_send(10, now=0.0)
+    assert not command_filter.should_send(10, now=0.5)
+    assert command_filter.should_send(10, now=1.0)
+    # キープアライブの間隔は、最後に送った時刻から数える
+    assert not command_filter.should_send(10, now=1.5)
+    assert command_filter.should_send(10, now=2.0)
+
+
+def test_zero_keepalive_always_sends():
+    command_filter: CommandFilter[int] = CommandFilter(keepalive_seconds=0.0)
+    assert all(command_filter.should_send(10, now=i * 0.1) for i in range(5))
+    assert command_filter.saved_count == 0
+
+
+def test_reset_forces_next_send():
+    command_filter: CommandFilter[str] = CommandFilter(keepalive_seconds=10.0)
+    assert command_filter.should_send("straight", now=0.0)
+    assert not command_filter.should_send("straight", now=1.0)
+    command_filter.reset()
+    assert command_filter.should_send("straight", now=1.1)
+    assert not command_filter.should_send("straight", now=1.2)
+
+
+def test_write_latency():
+    latency = WriteLatency()
+    assert latency.mean_seconds is None
+    assert str(latency) == "no writes"
+    latency.add(0.010)
+    latency.add(0.030)
+    assert latency.count == 2
+    assert latency.mean_seconds == 0.020
+    assert latency.max_seconds == 0.030
+    assert latency.last_seconds == 0.030
+    assert str(latency) == "2 writes, mean 20 ms, max 30 ms"
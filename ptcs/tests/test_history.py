@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from ptcs_server.binary import StateIndex
+from ptcs_server.history import StateHistory
+
+from .conftest import advance
+
+
+@pytest.fixture
+def history(control) -> StateHistory:
+    """1 秒ごとに 8 回記録した、5 回分しか持てない履歴"""
+    history = StateHistory(control, StateIndex.from_control(control), capacity=5)
+    base = time.monotonic() - 100.0
+    for version in range(8):
+        history.record(control, version, monotonic_time=base + version)
+        advance(control, 1)
+    return history
+
+
+def to_unix_time(monotonic_time: float) -> float:
+    return monotonic_time + time.time() - time.monotonic()
+
+
+def test_keeps_latest_records_after_wrap_around(history):
+    result = history.query()
+    assert history.size == 5
+    assert result["versions"] == [3, 4, 5, 6, 7]
+    assert result["timestamps"] == sorted(result["timestamps"])
+    assert result["timestamps"][-1] - result["timestamps"][0] == pytest.approx(4.0)
+
+
+def test_range_across_wrap_around(history):
+    first = history.query()["timestamps"][0]
+    result = history.query(from_time=first + 1.5, to_time=first + 3.5)
+    assert result["versions"] == [5, 6]
+    assert len(result["current_times"]) == 2
+
+
+def test_range_before_oldest_record(history):
+    base = history.query()["timestamps"][0]
+    assert history.query(to_time=base - 1.0)["versions"] == []
+    assert history.query(from_time=base - 10.0)["versions"] == [3, 4, 5, 6, 7]
+
+
+def test_step_thins_out_records(history):
+    assert history.query(step=2.0)["versions"] == [3, 5, 7]
+    assert history.query(step=10.0)["versions"] == [3]
+    first = history.query()["timestamps"][0]
+    assert history.query(from_time=first + 0.5, step=2.0)["versions"] == [4, 6]
+
+
+def test_records_component_values(history, control):
+    result = history.query()
+    train = next(iter(control.trains.values()))
+    train_history = result["trains"][train.id]
+    assert len(train_history["mileages"]) == 5
+    assert train_history["section_ids"][-1] in control.sections
+    assert set(result["junctions"]) == set(control.junctions)
+    assert all(
+        direction in ("straight", "curve")
+        for junction in result["junctions"].values()
+        for direction in junction["current_directions"]
+    )
+    assert result["current_times"] == sorted(result["current_times"])
+
+
+def test_unix_times_follow_monotonic_clock(control):
+    history = StateHistory(control, StateIndex.from_control(control), capacity=3)
+    now = time.monotonic()
+    history.record(control, 1, monotonic_time=now - 2.0)
+    history.record(control, 2, monotonic_time=now - 1.0)
+    assert history.query(from_time=to_unix_time(now - 1.5))["versions"] == [2]
@@ -0,0 +1,83 @@
+import pytest
+
+from ptcs_control.gogatsusai2024 import create_control
+from ptcs_server.journal import RECORD, ControlJournal, RecordKind
+from ptcs_server.types.state import get_topology_from_control
+
+CONTROL_INTERVAL_SECONDS = 0.1
+
+
+@pytest.fixture
+def layout_hash() -> str:
+    return get_topology_from_control(create_control()).layout_hash
+
+
+def run(journal: ControlJournal, control, ticks: int) -> None:
+    """サーバーと同じく、入力はすべてジャーナルを通して与える"""
+    for _ in range(ticks):
+        journal.tick()
+        for train in control.trains.values():
+            if train.speed_command > 0:
+                journal.move_forward(train, train.speed_command * CONTROL_INTERVAL_SECONDS)
+        journal.update()
+
+
+def crash(journal: ControlJournal) -> None:
+    """
+    最後のスナップショットを書かずに書き込み用のスレッドを止める (サーバーが落ちたときと同じ状態にする)。
+    それまでに `update()` で渡した入力は、すべて書き込まれる。
+    """
+    assert journal._writer is not None
+    journal._queue.put(None)
+    journal._writer.join()
+    journal._writer = None
+
+
+def test_recover_after_torn_tail(tmp_path, layout_hash):
+    control = create_control()
+    journal = ControlJournal(control, layout_hash, str(tmp_path))
+    journal.start()
+    run(journal, control, 50)
+    crash(journal)
+    expected = journal.encode_snapshot(0)
+
+    journal_files = list(tmp_path.glob("journal-*.bin"))
+    assert len(journal_files) == 1
+    record_count = journal_files[0].stat().st_size // RECORD.size
+    assert record_count > 0
+    # 入力の書き込みの途中で落ちた
+    with open(journal_files[0], "ab") as f:
+        f.write(RECORD.pack(RecordKind.MOVE_FORWARD_MR, 0, 1.0)[: RECORD.size // 2])
+
+    recovered = ControlJournal(create_control(), layout_hash, str(tmp_path))
+    assert recovered.encode_snapshot(0) != expected
+    assert recovered.recover() == record_count
+    assert recovered.encode_snapshot(0) == expected
+
+
+def test_recover_skips_broken_snapshot(tmp_path, layout_hash):
+    control = create_control()
+    journal = ControlJournal(control, layout_hash, str(tmp_path))
+    journal.start()
+    run(journal, control, 20)
+    journal.close()
+    expected = journal.encode_snapshot(0)
+
+    # 書き込みの途中で落ちた、より新しいスナップショット
+    (tmp_path / "snapshot-99.bin").write_bytes(b"PTCJ")
+
+    recovered = ControlJournal(create_control(), layout_hash, str(tmp_path))
+    assert recovered.recover() == 0
+    assert recovered.encode_snapshot(0) == expected
+
+
+def test_recover_without_files(tmp_path, layout_hash):
+    journal = ControlJournal(create_control(), layout_hash, str(tmp_path / "missing"))
+    assert journal.recover() is None
+
+
+def test_snapshot_rejects_other_layout(layout_hash):
+    journal = ControlJournal(create_control(), layout_hash, None)
+    other = ControlJournal(create_control(), "0" * 16, None)
+    with pytest.raises(ValueError):
+        other.apply_snapshot(journal.encode_snapshot(1))
@@ -0,0 +1,83 @@
+import threading
+
+from ptcs_control.gogatsusai2024 import create_control
+from ptcs_server.journal import ControlJournal
+from ptcs_server.recording import (
+    BridgeInputs,
+    SessionRecorder,
+    read_recording,
+    replay_session,
+)
+from ptcs_server.types.state import get_topology_from_control
+
+
+def record_session(path: str, ticks: int) -> str:
+    """
+    途中から (ジャーナルから復元した状態のように、初期状態ではない状態から) 記録を始め、
+    BLE の入力と API の操作を混ぜて与える。
+    """
+    control = create_control()
+    layout_hash = get_topology_from_control(control).layout_hash
+    journal = ControlJournal(control, layout_hash, None)
+    for train in control.trains.values():
+        journal.move_forward(train, 37.0)
+    journal.update()
+
+    recorder = SessionRecorder(path, layout_hash, journal.encode_snapshot(0))
+    inputs = BridgeInputs(control, journal, recorder)
+    train_ids = list(control.trains)
+    sensor_position_id = next(iter(control.sensor_positions))
+    for i in range(ticks):
+        inputs.tick()
+        for train_id in train_ids:
+            inputs.notify_rotation(train_id, 3)
+            inputs.command_speed(train_id)
+        for junction_id in control.junctions:
+            inputs.command_direction(junction_id)
+        if i == 20:
+            inputs.move_train(train_ids[0], 20.0)
+            inputs.update()
+        if i == 40:
+            inputs.put_train(train_ids[1], sensor_position_id)
+            inputs.set_manual_direction("j04", None)
+            inputs.update()
+    recorder.close()
+    return layout_hash
+
+
+def test_replay_from_recorded_state(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    layout_hash = record_session(path, 100)
+    result = replay_session(create_control(), layout_hash, path)
+    assert result.ticks == 100
+    assert result.commands > 0
+    assert result.divergence_count == 0
+
+
+def test_api_commands_are_recorded(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    record_session(path, 50)
+    header, events = read_recording(path)
+    assert "snapshot" in header
+    kinds = [kind for _, kind, _, _ in events]
+    assert {"move", "put", "manual_direction", "update"} <= set(kinds)
+
+
+def test_inputs_from_another_thread_are_rejected():
+    control = create_control()
+    journal = ControlJournal(control, get_topology_from_control(control).layout_hash, None)
+    inputs = BridgeInputs(control, journal)
+    inputs.tick()
+
+    errors: list[Exception] = []
+
+    def move() -> None:
+        try:
+            inputs.move_train(next(iter(control.trains)), 10.0)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=move)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
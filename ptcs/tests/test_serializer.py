@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from ptcs_control import mft2023, synthetic
+from ptcs_server.serializer import (
+    StateQuery,
+    dump_json,
+    dynamic_state_to_dict,
+    state_to_dict,
+)
+from ptcs_server.types.state import (
+    get_dynamic_state_from_control,
+    get_state_from_control,
+)
+
+from .conftest import advance
+
+
+def test_state_matches_pydantic(control, geometry):
+    expected = get_state_from_control(control, geometry).model_dump_json().encode()
+    assert dump_json(state_to_dict(control, geometry=geometry)) == expected
+
+
+def test_state_without_geometry_matches_pydantic(control):
+    expected = get_state_from_control(control).model_dump_json().encode()
+    assert dump_json(state_to_dict(control)) == expected
+
+
+def test_dynamic_state_matches_pydantic(control, geometry):
+    expected = (
+        get_dynamic_state_from_control(control, version=3, layout_hash="abc", timestamp=12.5, geometry=geometry)
+        .model_dump_json()
+        .encode()
+    )
+    actual = dump_json(dynamic_state_to_dict(control, version=3, layout_hash="abc", timestamp=12.5, geometry=geometry))
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "create_control",
+    [
+        mft2023.create_control,
+        lambda: synthetic.create_control(synthetic.SyntheticLayout(sections=100, trains=10)),
+    ],
+    ids=["mft2023", "synthetic100"],
+)
+def test_other_layouts_match_pydantic(create_control):
+    control = create_control()
+    control.update()
+    advance(control, 30)
+    assert dump_json(state_to_dict(control)) == get_state_from_control(control).model_dump_json().encode()
+
+
+def test_query_selects_components(control):
+    train_id = next(iter(control.trains))
+    query = StateQuery.parse("trains,junctions", {"trains": train_id})
+    state = json.loads(get_state_from_control(control).model_dump_json())
+    expected = {
+        "current_time": state["current_time"],
+        "junctions": state["junctions"],
+        "trains": {train_id: state["trains"][train_id]},
+    }
+    assert dump_json(state_to_dict(control, query)) == dump_json(expected)
+
+
+def test_query_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        StateQuery.parse("trains,trucks", {})
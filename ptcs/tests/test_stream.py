@@ -0,0 +1,48 @@
+from ptcs_server.journal import ControlJournal
+from ptcs_server.serializer import dump_json, dynamic_state_to_dict
+from ptcs_server.stream import COMPONENT_KINDS, StateDeltaTracker
+from ptcs_server.types.state import get_topology_from_control
+
+from .conftest import CONTROL_INTERVAL_SECONDS
+
+
+def test_tracker_matches_full_serialization(control, geometry):
+    """変換し直すコンポーネントをバージョンで選んでも、毎回すべてを変換したときと同じ状態になる"""
+    layout_hash = get_topology_from_control(control).layout_hash
+    journal = ControlJournal(control, layout_hash, None)
+    tracker = StateDeltaTracker(layout_hash, journal.versions, geometry)
+    sensor_position = next(iter(control.sensor_positions.values()))
+    changed_versions: set[int] = set()
+    for version in range(200):
+        journal.tick()
+        for train in control.trains.values():
+            if train.speed_command > 0:
+                journal.move_forward(train, train.speed_command * CONTROL_INTERVAL_SECONDS)
+        if version == 100:
+            journal.fix_position(next(iter(control.trains.values())), sensor_position)
+        journal.update()
+        tracker.update(control, version, 0.0)
+
+        state = dynamic_state_to_dict(control, version=version, layout_hash=layout_hash, geometry=geometry)
+        for kind in COMPONENT_KINDS:
+            fragments = tracker._fragments[kind]
+            assert fragments.keys() == state[kind].keys()
+            for id, component in state[kind].items():
+                assert fragments[id].body == dump_json(component), (kind, id, version)
+                changed_versions.add(fragments[id].version)
+    # 変化のあったコンポーネントだけが新しいバージョンになっている
+    assert len(changed_versions) > 1
+
+
+def test_unchanged_components_keep_their_version(control):
+    layout_hash = get_topology_from_control(control).layout_hash
+    journal = ControlJournal(control, layout_hash, None)
+    tracker = StateDeltaTracker(layout_hash, journal.versions)
+    tracker.update(control, 0, 0.0)
+    train_id = next(iter(control.trains))
+    journal.set_voltage(control.trains[train_id], 3700)
+    tracker.update(control, 1, 0.0)
+    delta = tracker.encode(0).body
+    assert b'"trains":{"' + train_id.encode() + b'":' in delta
+    assert delta.count(b'"head_position"') == 1
+    assert b'"sections":{}' in delta and b'"junctions":{}' in delta